@@ -0,0 +1,85 @@
+from ecdsa import VerifyingKey as PublicKey, SECP256k1 as curve
+from ecdsa.ellipticcurve import Point
+from ..encoding.base58 import decode_public_key
+from ..lru_cache import LRUCache
+from .settings import PUBLIC_KEY_CACHE_SIZE, PRECOMPUTE_AFTER_USES
+
+"""
+
+    class PublicKeyCache
+
+        Keeps parsed ecdsa VerifyingKeys keyed by their Base58 string, so repeat
+        senders skip decoding and point validation. Keys used more than
+        PRECOMPUTE_AFTER_USES times get precomputed multiplication tables.
+
+        Methods
+        - get(public_key_string: str) -> PublicKey
+        - stats() -> dict
+        - clear() -> None
+
+"""
+
+
+def precompute_public_key(public_key: PublicKey) -> PublicKey:
+    """
+        Returns a copy of the key carrying precomputed multiplication tables
+    """
+    # Points parsed from strings carry no order, which ecdsa needs to build the tables
+    point = public_key.pubkey.point
+    point = Point(curve.curve, point.x(), point.y(), curve.order)
+    precomputed_key = PublicKey.from_public_point(point, curve=curve)
+    precomputed_key.precompute()
+    return precomputed_key
+
+
+class _CachedKey:
+
+    __slots__ = ("public_key", "uses", "precomputed")
+
+    def __init__(self, public_key):
+        self.public_key = public_key
+        self.uses = 0
+        self.precomputed = False
+
+
+class PublicKeyCache:
+
+    def __init__(self, maxsize: int = PUBLIC_KEY_CACHE_SIZE, precompute_after: int = PRECOMPUTE_AFTER_USES):
+        self.cache = LRUCache(maxsize)
+        self.precompute_after = precompute_after
+        self.precomputed = 0
+
+    def get(self, public_key_string: str):
+        """
+            Base58 String -> PublicKey, parsed at most once while the key stays cached
+        """
+        entry = self.cache.get(public_key_string)
+        if entry is None:
+            entry = _CachedKey(decode_public_key(public_key_string))
+            self.cache.put(public_key_string, entry)
+
+        entry.uses += 1
+        if not entry.precomputed and entry.uses > self.precompute_after:
+            entry.precomputed = True
+            entry.public_key = precompute_public_key(entry.public_key)
+            self.precomputed += 1
+
+        return entry.public_key
+
+    def stats(self) -> dict:
+        data = self.cache.stats()
+        data["precomputed"] = self.precomputed
+        return data
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+PUBLIC_KEY_CACHE = PublicKeyCache()
+
+
+def get_public_key(public_key_string: str):
+    """
+        Base58 String -> PublicKey, served from the process wide cache
+    """
+    return PUBLIC_KEY_CACHE.get(public_key_string)
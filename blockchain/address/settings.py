@@ -0,0 +1,4 @@
+
+
+PUBLIC_KEY_CACHE_SIZE = 4096           # Number of parsed public keys kept in memory
+PRECOMPUTE_AFTER_USES = 3              # Uses after which a key gets precomputed multiplication tables
@@ -1,9 +1,17 @@
 from ..encoding.base58 import encode, decode
+from ..encoding import canonical
 from ..transaction.transaction import Transaction
 from .solved_transaction import SolvedTransaction
+from .validator import BlockValidator, ValidationResult
 from hashlib import sha256
 from .settings import VERSION, TRANSACTION_COUNT, REWARD_VALUE
+from ..settings import HASH_VERSION, LEGACY_HASH_VERSION, ACCEPT_LEGACY_HASHES
+from ..tracking import Tracked, DigestCache
 from ..database.blockdb import BlockModel
+from ..database.unspent_transactiondb import UnspentTransactionModel
+from ..database.transactiondb import TransactionModel, COLLECTION_NAME as TRANSACTION_COLLECTION_NAME
+from ..database.addressdb import AddressModel, COLLECTION_NAME as ADDRESS_COLLECTION_NAME
+from ..database.operations import WriteBatch
 
 
 """
@@ -43,22 +51,27 @@ class Block
     - miner_public_key: str
 
     Methods
-    - find_block_id() -> str
+    - find_hash(version: int) -> str
+    - find_block_id(version: int) -> str
+    - get_state() -> tuple
+    - get_digest() -> bytes
     - get_block(block_id: str) -> Block
     - add_block(block: Block) -> bool  (@static)
+    - validate() -> ValidationResult
     - verify() -> bool
-    - verify_solved_transactions() -> bool
     - verify_timestamp() -> bool
     - verify_reward_transaction() -> bool
     - verify_block_id() -> bool
-    - add_tochain() -> bool
+    - add_tochain(batch: WriteBatch) -> bool
     - json_data() -> dict
     - from_json(block_document: dict) -> Block
 
 """
 
 
-class Block:
+class Block(Tracked):
+
+    _untracked = ("block_id",)
 
     def __init__(self, previous_block: str = None, block_id: str = None, timestamp: str = None,
                  reward_transaction: Transaction = None, miner_public_key: str = None,
@@ -71,6 +84,7 @@ class Block:
         self.version = version
         self.miner_public_key = miner_public_key
         self.reward_transaction = reward_transaction
+        self._digests = DigestCache()
 
     def get_block(self, block_id):
         block_document = BlockModel().get_block(block_id)
@@ -79,29 +93,42 @@ class Block:
     def add_block(self):
         return BlockModel().add_block(self.json_data())
 
-    def find_hash(self) -> str:
+    def find_hash(self, version: int = HASH_VERSION) -> str:
         # returns hash without encoding -change if it doesnt feel good
-        document = self.json_data()
-        document.pop("block_id")
-        document_string = str(document)
-
-        hash_fun = sha256()
-        hash_fun.update(document_string)
-        hash_string = hash_fun.hexdigest()
-        return hash_string
-
-    def find_block_id(self) -> str:
-        hash_string = self.find_hash()
+        if version == LEGACY_HASH_VERSION:
+            document = self.json_data()
+            document.pop("block_id")
+            return sha256(str(document).encode('utf-8')).hexdigest()
+        return self.get_digest().hex()
+
+    def get_state(self) -> tuple:
+        # The reward's transaction_id is hashed into the block, the id of solved transactions is not
+        reward = self.reward_transaction
+        reward_state = (reward.get_state(), reward.transaction_id) if reward is not None else None
+        return self._revision, tuple(solved.get_state() for solved in self.solved_transactions), reward_state
+
+    def get_digest(self) -> bytes:
+        """
+            Canonical block digest, memoized until the block or one of its transactions changes
+        """
+        # Transactions contribute their own memoized id digests, so each one is hashed once
+        return self._digests.get(self.get_state(), "block",
+                                 lambda: canonical.block_digest(self, lambda transaction: transaction.get_id_digest()))
+
+    def find_block_id(self, version: int = HASH_VERSION) -> str:
+        hash_string = self.find_hash(version)
+        if version == LEGACY_HASH_VERSION:
+            return encode(hash_string.lstrip("0"))
         return encode(hash_string)
 
-    def verify(self) -> bool:
-        return self.verify_solved_transactions() and self.verify_reward_transaction() and self.verify_timestamp() and self.verify_block_id()
+    def validate(self) -> ValidationResult:
+        """
+            Runs the staged BlockValidator, the result names the stage that rejected the block
+        """
+        return BlockValidator(self).validate()
 
-    def verify_solved_transactions(self) -> bool:
-        for transaction in self.solved_transactions:
-            if not transaction.verify():
-                return False
-        return True
+    def verify(self) -> bool:
+        return self.validate().valid
 
     def verify_reward_transaction(self) -> bool:
         if len(self.reward_transaction.inputs) == 0 and self.reward_transaction.question is None and self.reward_transaction.get_total_output_value() <= REWARD_VALUE:
@@ -109,16 +136,24 @@ class Block:
         return False
 
     def verify_block_id(self) -> bool:
-        return self.find_block_id() == self.block_id
+        if self.find_block_id() == self.block_id:
+            return True
+        return ACCEPT_LEGACY_HASHES and self.find_block_id(LEGACY_HASH_VERSION) == self.block_id
 
     def verify_timestamp(self) -> bool:
         # To be implemented
         return True
 
-    def add_tochain(self) -> bool:
-        for solved in self.solved_transactions:
-            solved.add_tochain(self.block_id)
-        return self.reward_transaction.add_chain_transaction(self.block_id)
+    def add_tochain(self, batch: WriteBatch = None) -> bool:
+        transactions = [solved.transaction for solved in self.solved_transactions] + [self.reward_transaction]
+
+        # Every write of the block goes out as one ordered bulk_write per collection, atomically where possible.
+        # batch may already hold the chain update and the rollback of a reorg.
+        batch = batch if batch is not None else WriteBatch()
+        batch.extend(TRANSACTION_COLLECTION_NAME, TransactionModel().chain_transaction_operations(
+            [transaction.json_data() for transaction in transactions], self.block_id))
+        batch.extend(ADDRESS_COLLECTION_NAME, AddressModel().connect_operations(transactions, self.block_id))
+        return UnspentTransactionModel().connect_block(transactions, self.block_id, batch)
 
     def json_data(self) -> dict:
         document = {
@@ -127,8 +162,8 @@ class Block:
             "previous_block": self.previous_block,
             "timestamp": self.timestamp,
             "miner_public_key": self.miner_public_key,
-            "solved_transactions": self.solved_transactions,
-            "reward_transaction": self.reward_transaction,
+            "solved_transactions": [solved.json_data() for solved in self.solved_transactions],
+            "reward_transaction": self.reward_transaction.json_data() if self.reward_transaction is not None else None,
         }
         return document
 
@@ -140,7 +175,7 @@ class Block:
         self.miner_public_key = block_document["miner_public_key"]
 
         self.solved_transactions = [SolvedTransaction().from_json(doc) for doc in block_document['solved_transactions']]
-        self.reward_transaction = RewardTransaction().from_json(block_document["reward_transaction"])
+        self.reward_transaction = Transaction().from_json(block_document["reward_transaction"])
         return self
 
     def __str__(self):
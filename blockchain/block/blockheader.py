@@ -1,5 +1,6 @@
-from hashlib import sha256
-from binascii import unhexlify
+from .merkle import MerkleTree, transaction_leaf
+from ..encoding import canonical
+from ..encoding.base58 import encode_bytes
 
 '''
 Version-A version number to track software/protocol upgrades
@@ -8,62 +9,141 @@ Merkle Root-A hash of the root of the merkle tree of this block’s transactions
 Timestamp-The approximate creation time of this block (seconds from Unix Epoch)
 Difficulty Target-The proof-of-work algorithm difficulty target for this block
 Nonce-A counter used for the proof-of-work algorithm
+
+The merkle tree leaves are the reward transaction followed by the solved transactions,
+in block order. Adding a solved transaction to a candidate block only rehashes the
+path from its leaf to the root.
+
+Block ids commit to the transaction digests and solutions rather than to the merkle
+root, so the header also carries the miner, the transaction ids and the solutions.
+find_block_id() rebuilds the block id from them, which authenticates the header, and
+with it the merkle root, against a block id the reader already trusts. Transactions
+with legacy ids don't have their digest as id, blocks holding one can't be checked.
 '''
 
 
+class _SolvedHeader:
+
+    __slots__ = ("solution", "transaction")
+
+    def __init__(self, solution: str, transaction: str):
+        self.solution = solution
+        self.transaction = transaction          # transaction id
+
+
 class BlockHeader:
 
-	def __init__(self, block):
-		assert (block is not None)
-		document = block.json_data()
-		self.version = document.get("version")
-		self.previous_block = document.get("previous_block")
-		self.transactions = document.get("transactions")
-		self.merkleroot = self.compute_merkleroot(self.transactions)
-		self.timestamp = document.get("timestamp")
-		self.difficulty = document.get("difficulty")
-		self.nonce = document.get("nonce")
-
-	def json_data(self) -> dict:
-		data = {
-			"version": self.version,
-			"previous_block": self.previous_block,
-			"merkleroot": self.merkleroot,
-			"timestamp": {self.timestamp},
-			"difficulty": {self.difficulty},
-			"nonce": {self.nonce}
-		}
-		return data
-
-	def little(self, string):
-		t = bytearray.fromhex(string)
-		t.reverse()
-		return ''.join(format(x, '02x') for x in t)
-
-	def compute_merkleroot(self, transactions: list) -> str:
-		merkleroot = ""
-		merklelist = transactions.copy()
-		newmerklelist = []
-		if len(merklelist) == 0:
-			# should raise exception
-			pass
-		elif len(merklelist) == 1:
-			merkleroot = merklelist[0]
-		else:
-			if len(merklelist) % 2 != 0:
-				merklelist.append(merklelist[-1])
-			while len(merklelist) != 1:
-				newmerklelist = []
-				for hashind in range(0, len(merklelist), 2):
-					combhash = self.little(merklelist[hashind]) + self.little(merklelist[hashind + 1])
-					combhash = unhexlify(combhash)
-					hash1 = sha256(combhash).hexdigest()
-					hash2 = sha256(unhexlify(hash1)).hexdigest()
-					newmerklelist.append(hash2)
-				merklelist = newmerklelist
-			merkleroot = self.little(merklelist[0])
-
-		return merkleroot
-
-	def __str__(self) -> str:
-		return str(self.json_data())
+    def __init__(self, block=None):
+        self.block_id = None
+        self.version = None
+        self.previous_block = None
+        self.timestamp = None
+        self.difficulty = None
+        self.nonce = None
+        self.miner_public_key = None
+        self.reward_transaction = None          # transaction id
+        self.solved_transactions = []           # [_SolvedHeader]
+        self.tree = MerkleTree()
+
+        if block is not None:
+            self.block_id = block.block_id
+            self.version = block.version
+            self.previous_block = block.previous_block
+            self.timestamp = block.timestamp
+            self.difficulty = getattr(block, "difficulty", None)
+            self.nonce = getattr(block, "nonce", None)
+            self.miner_public_key = block.miner_public_key
+            self.solved_transactions = [_SolvedHeader(solved.solution, solved.transaction.transaction_id)
+                                        for solved in block.solved_transactions]
+            if block.reward_transaction is not None:
+                self.reward_transaction = block.reward_transaction.transaction_id
+            self.tree.extend([transaction_leaf(transaction_id) for transaction_id in self.transaction_ids()])
+
+    def from_json(self, block_document: dict):
+        """
+            Builds the header from a block document or a header json_data(), only the
+            transaction ids and solutions of its transactions are read
+        """
+        self.block_id = block_document.get("block_id")
+        self.version = block_document.get("version")
+        self.previous_block = block_document.get("previous_block")
+        self.timestamp = block_document.get("timestamp")
+        self.difficulty = block_document.get("difficulty")
+        self.nonce = block_document.get("nonce")
+        self.miner_public_key = block_document.get("miner_public_key")
+
+        self.solved_transactions = [_SolvedHeader(solved.get("solution"), solved["transaction"]["transaction_id"])
+                                    for solved in block_document.get("solved_transactions") or []]
+        reward_transaction = block_document.get("reward_transaction")
+        self.reward_transaction = reward_transaction["transaction_id"] if reward_transaction is not None else None
+        self.tree = MerkleTree([transaction_leaf(transaction_id) for transaction_id in self.transaction_ids()])
+        return self
+
+    def transaction_ids(self) -> list:
+        """
+            Ids of the merkle leaves, the reward transaction first
+        """
+        transaction_ids = [solved.transaction for solved in self.solved_transactions]
+        if self.reward_transaction is not None:
+            transaction_ids.insert(0, self.reward_transaction)
+        return transaction_ids
+
+    def find_block_id(self) -> str:
+        """
+            Block id of the header's fields and transactions, equal to block_id when the header is genuine
+        """
+        return encode_bytes(canonical.block_digest(self, transaction_leaf, lambda transaction_id: transaction_id))
+
+    @property
+    def merkleroot(self) -> str:
+        root = self.tree.root()
+        return root.hex() if root is not None else None
+
+    def add_transaction(self, transaction_id: str) -> int:
+        """
+            Appends a transaction to the merkle tree, returns its leaf index
+        """
+        return self.tree.append(transaction_leaf(transaction_id))
+
+    def add_solved_transaction(self, solved) -> int:
+        self.solved_transactions.append(_SolvedHeader(solved.solution, solved.transaction.transaction_id))
+        return self.add_transaction(solved.transaction.transaction_id)
+
+    def get_proof(self, transaction_id: str):
+        """
+            Returns (index, [sibling hex]) proving the transaction is in the block, None if it is not
+        """
+        index = self.tree.index_of(transaction_leaf(transaction_id))
+        if index == -1:
+            return None
+        return index, [sibling.hex() for sibling in self.tree.get_proof(index)]
+
+    def json_data(self) -> dict:
+        data = {
+            "block_id": self.block_id,
+            "version": self.version,
+            "previous_block": self.previous_block,
+            "merkleroot": self.merkleroot,
+            "timestamp": self.timestamp,
+            "difficulty": self.difficulty,
+            "nonce": self.nonce,
+            "miner_public_key": self.miner_public_key,
+            "reward_transaction": (
+                {"transaction_id": self.reward_transaction} if self.reward_transaction is not None else None
+            ),
+            "solved_transactions": [
+                {"solution": solved.solution, "transaction": {"transaction_id": solved.transaction}}
+                for solved in self.solved_transactions
+            ],
+        }
+        return data
+
+    def compute_merkleroot(self, transactions: list) -> str:
+        """
+            Merkle root of a list of transaction ids, as hex
+        """
+        root = MerkleTree([transaction_leaf(transaction_id) for transaction_id in transactions]).root()
+        return root.hex() if root is not None else None
+
+    def __str__(self) -> str:
+        return str(self.json_data())
@@ -0,0 +1,148 @@
+from hashlib import sha256
+from ..encoding.base58 import decode_bytes
+
+"""
+
+    class MerkleTree
+
+        Merkle tree over raw 32 byte digests. Every level of the tree is kept, so
+        appending a leaf only rehashes the path from that leaf to the root. A level
+        with an odd number of nodes pairs its last node with itself.
+
+        - levels: [[bytes]]        // levels[0] are the leaves, levels[-1] is [root]
+
+        Methods
+        - append(leaf: bytes) -> int
+        - extend(leaves: list) -> None
+        - root() -> bytes
+        - get_proof(index: int) -> [bytes]
+        - index_of(leaf: bytes) -> int
+
+    Proofs are the sibling digests from the leaf up to the root. The index of the
+    leaf tells on which side each sibling goes, see verify_proof().
+
+"""
+
+DIGEST_SIZE = 32
+
+
+def hash_pair(left: bytes, right: bytes) -> bytes:
+    return sha256(sha256(left + right).digest()).digest()
+
+
+def transaction_leaf(transaction_id: str) -> bytes:
+    """
+        Leaf digest of a transaction, legacy ids with stripped leading zeros are padded back to 32 bytes
+    """
+    return decode_bytes(transaction_id).rjust(DIGEST_SIZE, b"\0")
+
+
+class MerkleTree:
+
+    def __init__(self, leaves: list = None):
+        self.levels = [[]]
+        if leaves:
+            self.extend(leaves)
+
+    def __len__(self) -> int:
+        return len(self.levels[0])
+
+    def append(self, leaf: bytes) -> int:
+        """
+            Adds a leaf and rehashes its path to the root, returns the index of the leaf
+        """
+        levels = self.levels
+        levels[0].append(leaf)
+        index = position = len(levels[0]) - 1
+
+        level = 0
+        while len(levels[level]) > 1:
+            nodes = levels[level]
+            position //= 2
+            left = nodes[2 * position]
+            right = nodes[2 * position + 1] if 2 * position + 1 < len(nodes) else left
+
+            if level + 1 == len(levels):
+                levels.append([])
+            parents = levels[level + 1]
+            if position < len(parents):
+                parents[position] = hash_pair(left, right)
+            else:
+                parents.append(hash_pair(left, right))
+            level += 1
+        return index
+
+    def extend(self, leaves: list) -> None:
+        if len(self.levels[0]):
+            for leaf in leaves:
+                self.append(leaf)
+            return
+
+        # Building from scratch hashes every level once instead of one path per leaf
+        nodes = list(leaves)
+        self.levels = [nodes]
+        while len(nodes) > 1:
+            if len(nodes) % 2:
+                pairs = zip(nodes[::2], nodes[1::2] + [nodes[-1]])
+            else:
+                pairs = zip(nodes[::2], nodes[1::2])
+            nodes = [hash_pair(left, right) for left, right in pairs]
+            self.levels.append(nodes)
+
+    def root(self) -> bytes:
+        """
+            Root digest, None for a tree without leaves
+        """
+        top = self.levels[-1]
+        return top[0] if top else None
+
+    def index_of(self, leaf: bytes) -> int:
+        """
+            Index of the first leaf equal to leaf, -1 if the tree does not contain it
+        """
+        try:
+            return self.levels[0].index(leaf)
+        except ValueError:
+            return -1
+
+    def get_proof(self, index: int) -> list:
+        """
+            Sibling digests from the leaf at index up to the root, None if index is out of range
+        """
+        if not 0 <= index < len(self.levels[0]):
+            return None
+        proof = []
+        for nodes in self.levels[:-1]:
+            sibling = index ^ 1
+            proof.append(nodes[sibling] if sibling < len(nodes) else nodes[index])
+            index //= 2
+        return proof
+
+
+def compute_root(leaves: list) -> bytes:
+    return MerkleTree(leaves).root()
+
+
+def verify_proof(leaf: bytes, index: int, proof: list, root: bytes) -> bool:
+    """
+        True if leaf is the leaf at index of the tree with the given root
+
+        Parameters:
+            leaf: bytes
+            index: int          // position of the leaf, its bits give the side of every sibling
+            proof: [bytes]      // from MerkleTree.get_proof()
+            root: bytes
+
+        Returns:
+            bool
+    """
+    if index < 0 or index >> len(proof):
+        return False
+    node = leaf
+    for sibling in proof:
+        if index & 1:
+            node = hash_pair(sibling, node)
+        else:
+            node = hash_pair(node, sibling)
+        index >>= 1
+    return node == root
@@ -1,21 +1,29 @@
 from ..transaction.transaction import Transaction
 from ..database.unspent_transactiondb import UnspentTransactionModel
+from ..encoding.base58 import matches_digest
+from ..tracking import Tracked
 from hashlib import sha256
 
 
-class SolvedTransaction:
+class SolvedTransaction(Tracked):
 
     def __init__(self, transaction: Transaction = None, solution: str = None):
         self.transaction = transaction
         self.solution = solution
 
-    def verify(self):
+    def verify_solution(self) -> bool:
         hash_message = self.solution + self.transaction.question.question_id
         sha2 = sha256()
-        sha2.update(hash_message)
-        if sha2.hexdigest() != self.transaction.question.answer_hash:
+        sha2.update(hash_message.encode('utf-8'))
+        return matches_digest(sha2.digest(), self.transaction.question.answer_hash)
+
+    def verify(self, check_signature: bool = True, resolved=None) -> bool:
+        if not self.verify_solution():
             return False
-        return self.transaction.verify()
+        return self.transaction.verify(check_signature, resolved)
+
+    def get_state(self) -> tuple:
+        return self._revision, self.transaction.get_state()
 
     def add_tochain(self, block_id: str) -> bool:
         return self.transaction.add_chain_transaction(block_id)
@@ -24,6 +32,7 @@ class SolvedTransaction:
     def from_json(self, document):
         self.transaction = Transaction().from_json(document["transaction"])
         self.solution = document["solution"]
+        return self
 
     def json_data(self):
         document = {
@@ -0,0 +1,151 @@
+from ..transaction.transaction import Transaction
+from ..transaction.signature_verifier import verify_batch
+from ..database.transactiondb import TransactionModel
+
+"""
+
+    class BlockValidator
+
+        Validates a block in stages ordered from cheapest to most expensive and stops
+        at the first failure, so an invalid block costs no more than the stage that
+        rejects it.
+
+            structure     block id, reward rules, timestamps, answer hashes, transaction ids,
+                          questions and output values of every transaction
+            reward        the reward transaction_id is not stored in another block
+            double_spend  no outpoint spent twice and no transaction included twice in the block
+            inputs        one batched UTXO resolution, then spends and scripts of every input
+                          with their signature checks collected instead of verified
+            signatures    transaction and script signatures verified as one parallel batch
+
+        Transactions found in the validation cache skip their scripts and signatures.
+
+        Methods
+        - validate() -> ValidationResult
+
+"""
+
+STRUCTURE = "structure"
+REWARD = "reward"
+DOUBLE_SPEND = "double_spend"
+INPUTS = "inputs"
+SIGNATURES = "signatures"
+
+
+class ValidationResult:
+
+    def __init__(self, valid: bool, stage: str = None, reason: str = None):
+        self.valid = valid
+        self.stage = stage        # stage that rejected the block, None if valid
+        self.reason = reason
+
+    def json_data(self) -> dict:
+        return {
+            "valid": self.valid,
+            "stage": self.stage,
+            "reason": self.reason,
+        }
+
+    def __bool__(self) -> bool:
+        return self.valid
+
+    def __str__(self) -> str:
+        if self.valid:
+            return "valid"
+        return f"rejected at {self.stage}: {self.reason}"
+
+
+class BlockValidator:
+
+    def __init__(self, block):
+        self.block = block
+        self.transactions = [solved.transaction for solved in block.solved_transactions]
+        self.signature_checks = []
+        self.unvalidated = []
+
+    def validate(self) -> ValidationResult:
+        stages = (
+            (STRUCTURE, self.check_structure),
+            (REWARD, self.check_reward),
+            (DOUBLE_SPEND, self.check_double_spend),
+            (INPUTS, self.check_inputs),
+            (SIGNATURES, self.check_signatures),
+        )
+        for stage, check in stages:
+            try:
+                reason = check()
+            except Exception as e:
+                reason = f"{type(e).__name__}: {e}"
+            if reason is not None:
+                return ValidationResult(False, stage, reason)
+        return ValidationResult(True)
+
+    def check_structure(self) -> str:
+        block = self.block
+        if block.reward_transaction is None or not block.verify_reward_transaction():
+            return "invalid reward transaction"
+        if not block.reward_transaction.verify_transaction_id():
+            return f"transaction_id does not match hash of reward {block.reward_transaction.transaction_id}"
+        if not block.verify_timestamp():
+            return "invalid timestamp"
+        if not block.verify_block_id():
+            return "block_id does not match block hash"
+
+        for solved in block.solved_transactions:
+            transaction = solved.transaction
+            if transaction.question is None or not solved.verify_solution():
+                return f"wrong solution for {transaction.transaction_id}"
+            if not transaction.verify_transaction_id():
+                return f"transaction_id does not match hash of {transaction.transaction_id}"
+            if not transaction.verify_question() or not transaction.verify_outputs() or \
+                    not transaction.verify_timestamp():
+                return f"invalid transaction {transaction.transaction_id}"
+        return None
+
+    def check_reward(self) -> str:
+        # A reward under the id of a transaction in another block would take it over. A free one
+        # has the same content, as the id was checked against it, eg. the reward of a detached block.
+        transaction_id = self.block.reward_transaction.transaction_id
+        block_id = TransactionModel().get_block_id(transaction_id)
+        if block_id is not None and block_id != self.block.block_id:
+            return f"reward {transaction_id} is already stored in block {block_id}"
+        return None
+
+    def check_double_spend(self) -> str:
+        transaction_ids = set()
+        outpoints = set()
+        for transaction in self.transactions:
+            if transaction.transaction_id in transaction_ids:
+                return f"transaction {transaction.transaction_id} included twice"
+            transaction_ids.add(transaction.transaction_id)
+
+            for inp in transaction.inputs:
+                outpoint = (inp.transaction_id, inp.index)
+                if outpoint in outpoints:
+                    return f"output {inp.transaction_id}:{inp.index} spent twice"
+                outpoints.add(outpoint)
+        return None
+
+    def check_inputs(self) -> str:
+        # Parents and unspent outputs of every input in the block, fetched with one query per collection
+        resolved = Transaction.resolve_inputs(self.transactions)
+
+        for transaction in self.transactions:
+            validated = transaction.is_validated()
+            if not validated:
+                self.unvalidated.append(transaction)
+                self.signature_checks.append(transaction.get_signature_check())
+
+            if not transaction.verify_inputs(resolved, check_scripts=not validated,
+                                             signature_checks=self.signature_checks):
+                return f"invalid inputs in {transaction.transaction_id}"
+        return None
+
+    def check_signatures(self) -> str:
+        results = verify_batch(self.signature_checks)
+        if not all(results):
+            return f"{results.count(False)} invalid signatures"
+
+        for transaction in self.unvalidated:
+            transaction.mark_validated()
+        return None
@@ -1,20 +1,28 @@
 # Classes
 from .block.block import Block, SolvedTransaction
+from .block.blockheader import BlockHeader
 from .transaction.transaction import Transaction
+from .transaction.signature_verifier import verify_batch
 from .address import address
 
-from .settings import TRANSACTIONS_PER_BLOCK, VERSION
+from .settings import TRANSACTIONS_PER_BLOCK, VERSION, FREE_TRANSACTION_TTL, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, \
+    BLOCK_CACHE_SIZE, TRANSACTION_CACHE_SIZE, MISSING_CACHE_SIZE, MISSING_TTL, SEEN_FILTER_CAPACITY, \
+    SEEN_FILTER_FP_RATE
+from .read_cache import ReadThroughCache
+from .bloom_filter import RotatingBloomFilter
+from .mempool import Mempool
 
 # Database Models
 from .database.blockchaindb import BlockChainModel
 from .database.blockdb import BlockModel
-from .database.transactiondb import TransactionModel
-from .database.unspent_transactiondb import UnspentTransactionModel
+from .database.transactiondb import TransactionModel, COLLECTION_NAME as TRANSACTION_COLLECTION_NAME
+from .database.unspent_transactiondb import UnspentTransactionModel, COLLECTION_NAME as UNSPENT_COLLECTION_NAME
+from .database.addressdb import AddressModel, COLLECTION_NAME as ADDRESS_COLLECTION_NAME
+from .database.operations import WriteBatch
+from .database import indexes
 
 # Other Libraries
 import time
-import hashlib
-from .encoding import base58
 
 """
 
@@ -23,25 +31,42 @@ from .encoding import base58
         - block_model: BlockModel
         - transaction_model: TransactionModel
         - unspent_transaction_model: UnspentTransactionModel
-        - transaction_pool: [<Transaction>]  // to be verified by human for question validity
+        - address_model: AddressModel
+        - block_cache: ReadThroughCache  // block documents by block_id
+        - transaction_cache: ReadThroughCache  // transaction documents by transaction_id
+        - seen_blocks: RotatingBloomFilter  // block ids of the recent chain and added since startup
+        - seen_transactions: RotatingBloomFilter  // free, recent chain and recently added transaction ids
+        - transaction_pool: Mempool  // to be verified by human for question validity
         - block_pool: [<Block>] // to be verified by human for question validity
-        - solved_transaction_pool: [<SolvedTransaction>]
+        - solved_transaction_pool: {transaction_id: <SolvedTransaction>}  // kept while the pool reserves its outpoints
 
         Methods
 
         - generate_keys() -> (ecdsa.PublicKey, ecdsa.PrivateKey)
         - add_block_pool(block_data: dict) -> bool
         - add_transaction_pool(transaction_data: dict) -> bool
-        - store_block(block_data: dict) -> bool
-        - store_transaction(transaction_data: dict) -> bool
+        - add_transactions_pool(transactions_data: [dict]) -> [bool]
+        - store_block(block_data: dict | Block) -> bool
+        - store_transaction(transaction_data: dict | Transaction) -> bool
         - get_block(block_id: str) -> dict
         - get_transaction(transaction_id: str) -> dict
+        - has_block(block_id: str) -> bool
+        - has_transaction(transaction_id: str) -> bool
+        - get_merkle_proof(transaction_id: str) -> dict
+        - get_balance(public_key: str, page: int, page_size: int) -> dict
+        - get_client_transactions(public_key: str, page: int, page_size: int) -> dict
+        - prune_transactions(max_age: float) -> dict
+        - cache_stats() -> dict
+        - mempool_stats() -> dict
         - mine_block() -> dict
         - solve_transaction() -> bool
 
 
 """
 
+LOG = print
+
+
 class BlockChain:
 
     def __init__(self):
@@ -55,8 +80,19 @@ class BlockChain:
         self.block_model = BlockModel()
         self.transaction_model = TransactionModel()
         self.unspent_transaction_model = UnspentTransactionModel()
-
-        self.transaction_pool = {}
+        self.address_model = AddressModel()
+        self.block_cache = ReadThroughCache(self.block_model.get_block, BLOCK_CACHE_SIZE,
+                                            MISSING_CACHE_SIZE, MISSING_TTL)
+        self.transaction_cache = ReadThroughCache(self.transaction_model.get_transaction, TRANSACTION_CACHE_SIZE,
+                                                  MISSING_CACHE_SIZE, MISSING_TTL)
+        indexes.bootstrap()
+        self.unspent_transaction_model.load_utxo_set()
+
+        self.seen_blocks = RotatingBloomFilter(SEEN_FILTER_CAPACITY, SEEN_FILTER_FP_RATE)
+        self.seen_transactions = RotatingBloomFilter(SEEN_FILTER_CAPACITY, SEEN_FILTER_FP_RATE)
+        self._seed_seen_filters()
+
+        self.transaction_pool = Mempool()
         self.block_pool = {}
         self.solved_transaction_pool = {}
 
@@ -90,10 +126,13 @@ class BlockChain:
         if block.block_id in self.block_pool.keys():
             return True
 
-        if block.verify():
+        result = block.validate()
+        if result:
             self.block_pool[block.block_id] = block
-            self.store_block(block_data)
+            self.seen_blocks.add(block.block_id)
+            self.store_block(block)
             return True
+        LOG(f"Block {block.block_id} {result}")
         return False
 
 
@@ -108,84 +147,155 @@ class BlockChain:
                 bool
         """
 
-        transaction = Transaction()
-        transaction.from_json(transaction_data)
+        return self.add_transactions_pool([transaction_data])[0]
 
-        if transaction.transaction_id in self.transaction_pool.keys():
-            return True
 
-        if transaction.verify():
-            self.transaction_pool[transaction.transaction_id] = transaction
-            self.store_transaction(transaction_data)
-            return True
-        return False
+    def add_transactions_pool(self, transactions_data: list) -> list:
+        """
+            Adds a batch of transactions to the transaction pool, verifying their signatures together
+
+            Parameters:
+                transactions_data: [dict]
+
+            Returns:
+                [bool]
+        """
+
+        results = [False] * len(transactions_data)
+        transactions = [Transaction().from_json(transaction_data) for transaction_data in transactions_data]
+        resolved = Transaction.resolve_inputs(transactions)
+        pending = []
+
+        for position, transaction in enumerate(transactions):
+            if self.transaction_pool.holds(transaction.transaction_id):
+                # Pooled, or solved and waiting for a block
+                results[position] = True
+            elif self.transaction_pool.has_conflict(transaction):
+                # Spends an output a pooled or solved transaction already spends, not worth verifying
+                continue
+            elif transaction.verify(check_signature=False, resolved=resolved):
+                pending.append((position, transaction))
+
+        # Signatures of transactions not validated before are checked as one batch
+        unvalidated = [transaction for _, transaction in pending if not transaction.is_validated()]
+        signatures = verify_batch([transaction.get_signature_check() for transaction in unvalidated])
+        for transaction, valid in zip(unvalidated, signatures):
+            if valid:
+                transaction.mark_validated()
+
+        for position, transaction in pending:
+            # Conflicts within the batch are caught here, the first one wins
+            if transaction.is_validated() and self.transaction_pool.add(transaction):
+                self.seen_transactions.add(transaction.transaction_id)
+                self.store_transaction(transaction)
+                results[position] = True
+
+        return results
         
 
-    def store_block(self, block_data: dict) -> bool:
+    def store_block(self, block_data) -> bool:
         """
             Stores the block to the database. If already found or not valid block, returns False
 
             Parameters:
-                block_data: dict
+                block_data: dict | Block     // a Block keeps its memoized hashes
 
             Returns:
                 bool
 
         """
 
-        block = Block()
-        block.from_json(block_data)
+        block = block_data if isinstance(block_data, Block) else Block().from_json(block_data)
         if block.verify():
-            return self.block_model.add_block(block)
+            stored = self.block_model.add_block(block.json_data())
+            self.block_cache.invalidate(block.block_id)
+            return stored
         else:
             return False
 
 
-    def store_transaction(self, transaction_data: dict) -> bool:
+    def store_transaction(self, transaction_data) -> bool:
         """
             Stores the transaction to the database. If already found or not valid transaction, returns False
 
             Parameters:
-                transaction_data: dict
+                transaction_data: dict | Transaction     // a Transaction keeps its memoized hashes
 
             Returns:
                 bool
 
         """
 
-        transaction = Transaction()
-        transaction.from_json(transaction_data)
+        if isinstance(transaction_data, Transaction):
+            transaction = transaction_data
+        else:
+            transaction = Transaction().from_json(transaction_data)
         if transaction.verify():
-            return self.transaction_model.add_transaction(transaction)
+            stored = self.transaction_model.add_free_transaction(transaction.json_data())
+            self.transaction_cache.invalidate(transaction.transaction_id)
+            return stored
         else:
             return False
 
-    def add_blockto_chain(self, block_data: dict) -> bool:
-        block = Block().from_json(block_data)
+    def add_blockto_chain(self, block_data) -> bool:
+        block = block_data if isinstance(block_data, Block) else Block().from_json(block_data)
         prev_block_id = block.previous_block
+        # The tip is cached, extending it costs no lookup. The first block has no previous block.
+        if self.block_chain_model.get_last_block_id() == prev_block_id:
+            # Do stuffs like calculate unspend transactions
+            return self._connect_block(block)
+
         if self.block_chain_model.block_exists(prev_block_id):
-            if self.block_chain_model.get_last_block_id() == prev_block_id:
-                self.block_chain_model.append(block_id=block.block_id)
-                # Do stuffs like calculate unspend transactions
-                return block.add_tochain()
-
-            else:
-                prev_block_number = self.block_chain_model.getby_block_id(prev_block_id)
-                cur_block_id = self.block_chain_model.getby_block_number(prev_block_number + 1)
-                cur_block = self.block_model.get_block(cur_block_id)
-
-                # Check Timestamp  To be implemented
-
-                if cur_block.timestamp > block.timestamp:
-                    removed_blocks = self.block_chain_model.remove_until(prev_block_number) # removed block ids
-                    for removed_block in removed_blocks:
-                        self.unspent_transaction_model.free_block_transactions(removed_block)
-                    self.block_chain_model.append(block_id=block.block_id)
-                    
-                    return block.add_tochain()
+            prev_block_number = self.block_chain_model.getby_block_id(prev_block_id)
+            cur_block_id = self.block_chain_model.getby_block_number(prev_block_number + 1)
+            cur_block = self.get_blockby_id(cur_block_id)
+
+            # Check Timestamp  To be implemented
+
+            if cur_block["timestamp"] > block.timestamp:
+                # The chain, address history and UTXO rollback commit with the new block in one
+                # batch. Tip first, so each block is rolled back from its UTXO undo data in memory.
+                batch = WriteBatch()
+                removed_blocks = self.block_chain_model.remove_until(prev_block_number, batch) # removed block ids
+                batch.extend(ADDRESS_COLLECTION_NAME, self.address_model.disconnect_operations(removed_blocks))
+                batch.extend(TRANSACTION_COLLECTION_NAME, self.transaction_model.disconnect_operations(removed_blocks))
+                batch.extend(UNSPENT_COLLECTION_NAME,
+                             self.unspent_transaction_model.disconnect_operations(removed_blocks))
+                # Transactions of the detached blocks left the chain
+                self.transaction_cache.clear()
+                return self._connect_block(block, batch)
 
         return False
 
+    def _connect_block(self, block: Block, batch: WriteBatch = None) -> bool:
+        """
+            Appends the block to the chain and connects it, committing both with batch,
+            which may hold the rollback of a reorg
+        """
+        reorg = batch is not None
+        batch = batch if reorg else WriteBatch()
+        self.block_chain_model.append(block.block_id, batch)
+        try:
+            connected = block.add_tochain(batch)
+        except Exception:
+            # Nothing was written. The UTXO set only rolled back the block itself, not the detached blocks.
+            self.block_chain_model.load_chain()
+            if reorg:
+                self.unspent_transaction_model.load_utxo_set()
+            raise
+        transactions = [solved.transaction for solved in block.solved_transactions]
+        if block.reward_transaction is not None:
+            transactions.append(block.reward_transaction)
+        # The block_id of its transactions was just set
+        for transaction in transactions:
+            self.transaction_cache.invalidate(transaction.transaction_id)
+            self.seen_transactions.add(transaction.transaction_id)
+        if connected:
+            # Pooled transactions spending what the block spent can never confirm
+            self.transaction_pool.remove_for_block(transactions)
+            self._drop_released_solved()
+        return connected
+
 
     def get_blockby_id(self, block_id: str) -> dict:
         """
@@ -199,7 +309,7 @@ class BlockChain:
 
         """
 
-        block_data = self.block_model.get_block(block_id)
+        block_data = self.block_cache.get(block_id)
         if block_data is None:
             return None
         
@@ -217,7 +327,9 @@ class BlockChain:
 
         """
         block_id = self.block_chain_model.getby_block_number(block_number)
-        block_data = self.block_model.get_block(block_id)
+        if block_id is None:
+            return None
+        block_data = self.block_cache.get(block_id)
         if block_data is None:
             return None
         return block_data
@@ -235,23 +347,243 @@ class BlockChain:
 
         """
 
-        transaction_data = self.transaction_model.get_transaction(transaction_id)
+        transaction_data = self.transaction_cache.get(transaction_id)
         if transaction_data is None:
             return None
 
         return transaction_data
 
+    def has_block(self, block_id: str) -> bool:
+        """
+            True if the block is in the block pool or the database
+
+            Gossip invites are mostly for blocks we already have. Only an id the seen
+            filter flags as a probable duplicate is confirmed, from memory or with an
+            id-only query, any other id is taken as new without a query. The filter holds
+            the recent chain from startup and every block added since, an invite for an
+            older block fetches it again and storing it is refused.
+        """
+
+        if block_id in self.block_pool:
+            return True
+        if block_id not in self.seen_blocks:
+            return False
+
+        if self.block_chain_model.getby_block_id(block_id) is not None or \
+                self.block_cache.contains(block_id) or self.block_model.block_exists(block_id):
+            return True
+        self.seen_blocks.false_positive()
+        return False
+
+    def has_transaction(self, transaction_id: str) -> bool:
+        """
+            True if the transaction is in one of the pools or the database, see has_block()
+        """
+
+        if transaction_id in self.transaction_pool or transaction_id in self.solved_transaction_pool:
+            return True
+        if transaction_id not in self.seen_transactions:
+            return False
+
+        if self.transaction_cache.contains(transaction_id) or self.transaction_model.transaction_exists(transaction_id):
+            return True
+        self.seen_transactions.false_positive()
+        return False
+
+    def _seed_seen_filters(self) -> None:
+        # The recent chain, its transactions and the free transactions, what gossip invites are mostly about
+        recent_blocks = self.block_chain_model.chain.block_ids[-SEEN_FILTER_CAPACITY:]
+        for block_id in recent_blocks:
+            self.seen_blocks.add(block_id)
+        # Read tip first so the limit keeps the newest, added oldest first so a rotation drops the oldest
+        chain_transactions = self.transaction_model.get_block_transaction_ids(recent_blocks[::-1], SEEN_FILTER_CAPACITY)
+        for transaction_id in reversed(chain_transactions):
+            self.seen_transactions.add(transaction_id)
+        for transaction_id in self.transaction_model.get_free_transaction_ids(SEEN_FILTER_CAPACITY):
+            self.seen_transactions.add(transaction_id)
+
+    def get_merkle_proof(self, transaction_id: str) -> dict:
+        """
+            Proves the transaction is included in its block. If it is not in a block, returns None
+
+            Parameters:
+                transaction_id: str
+
+            Returns:
+                {
+                    block_header: dict,     // merkleroot is the hex of the root, with the solutions
+                                            // and transaction ids the block id is rebuilt from
+                    transaction_id: str,
+                    index: int,             // leaf index, its bits give the side of every sibling
+                    proof: [str],           // hex sibling digests from the leaf up to the root
+                }
+
+        """
+
+        block_id = self.transaction_model.get_block_id(transaction_id)
+        if block_id is None:
+            return None
+        block_document = self.block_model.get_block_header(block_id)
+        if block_document is None:
+            return None
+
+        try:
+            block_header = BlockHeader().from_json(block_document)
+            proof = block_header.get_proof(transaction_id)
+        except ValueError:
+            return None
+        if proof is None:
+            return None
+        index, siblings = proof
+        return {
+            "block_header": block_header.json_data(),
+            "transaction_id": transaction_id,
+            "index": index,
+            "proof": siblings,
+        }
+
+    @staticmethod
+    def _page(page: int, page_size: int) -> tuple:
+        page = max(int(page), 1)
+        page_size = min(max(int(page_size), 1), MAX_PAGE_SIZE)
+        return page, page_size
+
+    def get_balance(self, public_key: str, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE) -> dict:
+        """
+            Balance of the public key and one page of its unspent outputs, read from the address index
+
+            Parameters:
+                public_key: str
+                page: int           // from 1
+                page_size: int      // at most MAX_PAGE_SIZE
+
+            Returns:
+                {
+                    public_key: str,
+                    balance: float,
+                    unspent_count: int,
+                    unspent: [{transaction_id: str, output_index: int, value: float}],
+                    page: int,
+                    page_size: int,
+                }
+
+        """
+
+        page, page_size = self._page(page, page_size)
+        balance, unspent_count = self.address_model.get_balance(public_key)
+        unspent = self.address_model.get_unspent(public_key, (page - 1) * page_size, page_size)
+        return {
+            "public_key": public_key,
+            "balance": balance,
+            "unspent_count": unspent_count,
+            "unspent": unspent,
+            "page": page,
+            "page_size": page_size,
+        }
+
+    def get_client_transactions(self, public_key: str, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE) -> dict:
+        """
+            One page of the chain transactions the public key takes part in, latest first
+
+            Parameters:
+                public_key: str
+                page: int           // from 1
+                page_size: int      // at most MAX_PAGE_SIZE
+
+            Returns:
+                {
+                    transactions: [dict],   // transaction documents with block_id, received and sent
+                    page: int,
+                    page_size: int,
+                    total: int,
+                }
+
+        """
+
+        page, page_size = self._page(page, page_size)
+        history = self.address_model.get_history(public_key, (page - 1) * page_size, page_size)
+        documents = self.transaction_model.get_transactions([entry["transaction_id"] for entry in history])
+
+        transactions = []
+        for entry in history:
+            document = documents.get(entry["transaction_id"])
+            if document is not None:
+                document = dict(document, received=entry["received"], sent=entry["sent"])
+                transactions.append(document)
+        return {
+            "transactions": transactions,
+            "page": page,
+            "page_size": page_size,
+            "total": self.address_model.count_history(public_key),
+        }
+
+    def prune_transactions(self, max_age: float = FREE_TRANSACTION_TTL) -> dict:
+        """
+            Removes free transactions older than max_age seconds from the transaction pool and the database
+
+            Parameters:
+                max_age: float      // seconds
+
+            Returns:
+                {
+                    pool: int,      // transactions evicted from transaction_pool or solved ones released
+                    removed: int,   // free transactions deleted from the database
+                    stamped: int,   // stored free transactions without received_at, stamped now
+                }
+
+        """
+
+        expired = self.transaction_pool.expire(time.time() - max_age)
+        self._drop_released_solved()
+
+        report = self.transaction_model.prune_free_transactions(max_age)
+        if report["removed"]:
+            self.transaction_cache.clear()
+        report["pool"] = len(expired)
+        return report
+
+    def _drop_released_solved(self) -> None:
+        # Solved transactions whose reservations the pool released can't go in a block any more
+        for transaction_id in list(self.solved_transaction_pool):
+            if transaction_id not in self.transaction_pool.solved:
+                self.solved_transaction_pool.pop(transaction_id, None)
+
+    def mempool_stats(self) -> dict:
+        """
+            Counters of the transaction pool, see Mempool.stats()
+        """
+
+        return self.transaction_pool.stats()
+
+    def cache_stats(self) -> dict:
+        """
+            Hit-rate stats of the read caches and the seen filters
+
+            Returns:
+                {
+                    blocks: dict,           // see ReadThroughCache.stats()
+                    transactions: dict,
+                    seen_blocks: dict,      // see RotatingBloomFilter.stats()
+                    seen_transactions: dict,
+                }
+
+        """
+
+        return {
+            "blocks": self.block_cache.stats(),
+            "transactions": self.transaction_cache.stats(),
+            "seen_blocks": self.seen_blocks.stats(),
+            "seen_transactions": self.seen_transactions.stats(),
+        }
+
     def solve_transaction(self, transaction_id: str, answer: str) -> bool:
-        transaction = self.transaction_pool[transaction_id]
-        question_id = transaction.question.question_id
-        sha = hashlib.sha256()
-        sha.update((answer+question_id).encode('utf-8'))
-        ans = sha.hexdigest()
-        ans = base58.encode(ans)
-        
-        if ans == transaction.question.answer_hash:
-            self.transaction_pool.pop(transaction.transaction_id)
-            solved_transaction = SolvedTransaction(transaction, answer)
+        transaction = self.transaction_pool.get(transaction_id)
+        if transaction is None:
+            return False
+        solved_transaction = SolvedTransaction(transaction, answer)
+        if solved_transaction.verify_solution():
+            # Its outpoints stay spent until the block holding it is connected
+            self.transaction_pool.remove(transaction.transaction_id, reserve=True)
             self.solved_transaction_pool[transaction.transaction_id] = solved_transaction
             return True
         return False
@@ -271,7 +603,11 @@ class BlockChain:
 
         if len(self.solved_transaction_pool) >= TRANSACTIONS_PER_BLOCK:
             new_block = Block()
-            new_block.solved_transactions = self.solved_transaction_pool[: TRANSACTIONS_PER_BLOCK]
+            # Highest fee rate first
+            picked = self.transaction_pool.by_fee_rate(TRANSACTIONS_PER_BLOCK, solved=True)
+            new_block.solved_transactions = [self.solved_transaction_pool[transaction.transaction_id]
+                                             for transaction in picked
+                                             if transaction.transaction_id in self.solved_transaction_pool]
             
             reward = Transaction().from_json(reward_transaction_data)
             new_block.reward_transaction = reward
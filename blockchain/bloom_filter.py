@@ -0,0 +1,120 @@
+import math
+from hashlib import blake2b
+from threading import Lock
+
+"""
+
+    class BloomFilter
+
+        Set of strings with no false negatives and about false_positive_rate false
+        positives once capacity items were added.
+
+        - capacity: int
+        - false_positive_rate: float
+        - size: int              // bits
+        - hash_count: int
+        - count: int             // items added
+
+    class RotatingBloomFilter
+
+        Recently seen items, in two BloomFilter generations. Items go to the current
+        generation, which replaces the previous one once it holds capacity items, so
+        an item is remembered for between one and two generations.
+
+        Methods
+        - add(item: str) -> None
+        - __contains__(item: str) -> bool
+        - false_positive() -> None
+        - clear() -> None
+        - stats() -> dict
+
+"""
+
+
+class BloomFilter:
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        assert capacity > 0 and 0 < false_positive_rate < 1
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        # Optimal sizes: m = -n ln p / (ln 2)^2 bits and k = m / n ln 2 hash functions
+        self.size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing, the k positions come from two 64 bit halves of one digest
+        digest = blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RotatingBloomFilter:
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        """
+            Parameters:
+                capacity: int                   // items per generation
+                false_positive_rate: float      // of the whole filter, each generation gets half of it
+        """
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.current = self._generation()
+        self.previous = None
+        self.rotations = 0
+        self.positives = 0
+        self.false_positives = 0
+        self._lock = Lock()
+
+    def _generation(self) -> BloomFilter:
+        return BloomFilter(self.capacity, self.false_positive_rate / 2)
+
+    def add(self, item: str) -> None:
+        with self._lock:
+            if self.current.count >= self.capacity:
+                self.previous = self.current
+                self.current = self._generation()
+                self.rotations += 1
+            self.current.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        if item is None:
+            return False
+        current, previous = self.current, self.previous
+        found = item in current or (previous is not None and item in previous)
+        if found:
+            self.positives += 1
+        return found
+
+    def false_positive(self) -> None:
+        """
+            Counts a positive the exact check did not confirm
+        """
+        self.false_positives += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.current = self._generation()
+            self.previous = None
+
+    def stats(self) -> dict:
+        return {
+            "count": self.current.count + (self.previous.count if self.previous is not None else 0),
+            "capacity": self.capacity,
+            "false_positive_rate": self.false_positive_rate,
+            "bytes": len(self.current.bits) * 2,
+            "rotations": self.rotations,
+            "positives": self.positives,
+            "false_positives": self.false_positives,
+        }
@@ -0,0 +1,91 @@
+from .backend import get_collection
+from .operations import UpdateOne, DeleteMany
+from . import unspent_transactiondb
+
+COLLECTION_NAME = "Address_History"
+
+"""
+            ADDRESS HISTORY DOCUMENT STRUCTURE
+
+            {
+                public_key: str,
+                transaction_id: str,
+                block_id: str,       // block holding the transaction
+                received: float,     // value of the transaction's outputs to public_key
+                sent: float,         // value of the transaction's inputs, if public_key made it
+            }
+
+    One document per public key and chain transaction it takes part in, written in
+    the same batch as the block and removed when the block is detached. Unspent
+    outputs of a public key come from the Unspent_Transaction collection, whose
+    documents carry public_key and value.
+
+"""
+
+
+def history_documents(transaction, block_id: str) -> list:
+    entries = {}
+    for output in transaction.outputs:
+        if output.public_key is not None:
+            entry = entries.setdefault(output.public_key, {"received": 0, "sent": 0})
+            entry["received"] += output.value
+    if transaction.public_key is not None and transaction.inputs:
+        entry = entries.setdefault(transaction.public_key, {"received": 0, "sent": 0})
+        entry["sent"] += transaction.get_total_input_value()
+
+    return [
+        dict(entry, public_key=public_key, transaction_id=transaction.transaction_id, block_id=block_id)
+        for public_key, entry in entries.items()
+    ]
+
+
+class AddressModel:
+
+    def __init__(self):
+        self.collection = get_collection(COLLECTION_NAME)
+        self.unspent_collection = get_collection(unspent_transactiondb.COLLECTION_NAME)
+
+    def connect_operations(self, transactions: list, block_id: str) -> list:
+        """
+            Upserts adding the transactions of block_id to the history of their public keys, for a WriteBatch
+        """
+        return [
+            UpdateOne(
+                {"public_key": document["public_key"], "transaction_id": document["transaction_id"]},
+                {"$set": document},
+                upsert=True
+            )
+            for transaction in transactions for document in history_documents(transaction, block_id)
+        ]
+
+    def disconnect_operations(self, block_ids: list) -> list:
+        return [DeleteMany({"block_id": {"$in": list(block_ids)}})]
+
+    def get_history(self, public_key: str, skip: int = 0, limit: int = 20) -> list:
+        """
+            History entries of public_key, latest first
+        """
+        cursor = self.collection.find({"public_key": public_key}, {"_id": 0}).sort("_id", -1).skip(skip).limit(limit)
+        return list(cursor)
+
+    def count_history(self, public_key: str) -> int:
+        return self.collection.count_documents({"public_key": public_key})
+
+    def get_unspent(self, public_key: str, skip: int = 0, limit: int = 20) -> list:
+        cursor = self.unspent_collection.find(
+            {"public_key": public_key, "spend_block": None},
+            {"_id": 0, "transaction_id": 1, "output_index": 1, "value": 1}
+        ).sort([("transaction_id", 1), ("output_index", 1)]).skip(skip).limit(limit)
+        return list(cursor)
+
+    def get_balance(self, public_key: str) -> tuple:
+        """
+            Returns (balance, number of unspent outputs) of public_key
+        """
+        balance = 0
+        count = 0
+        for document in self.unspent_collection.find({"public_key": public_key, "spend_block": None},
+                                                     {"_id": 0, "value": 1}):
+            balance += document.get("value") or 0
+            count += 1
+        return balance, count
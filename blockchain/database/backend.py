@@ -0,0 +1,142 @@
+import pymongo
+from threading import Lock
+from pymongo.errors import OperationFailure
+from . import connection
+from .settings import BACKEND, USE_TRANSACTIONS
+
+"""
+
+    Storage backends
+
+        Every model gets its collections from the selected backend. A collection
+        answers the part of the pymongo Collection API the models use: find_one, find,
+        insert_one, update_one, update_many, delete_one, delete_many, bulk_write,
+        create_indexes and index_information.
+
+        BACKEND in database/settings.py selects the backend
+            "mongodb"    collections of the shared MongoClient, see connection.py
+            "embedded"   files under DATA_DIRECTORY, see embedded.py
+
+        class StorageBackend
+        - get_collection(name: str) -> Collection
+        - write_batch(operations: {collection_name: [Operation]}) -> bool
+        - close() -> None
+
+        Methods
+        - get_backend() -> StorageBackend
+        - get_collection(name: str) -> Collection
+        - close_backend() -> None
+
+"""
+
+
+class StorageBackend:
+
+    name = None
+
+    def get_collection(self, name: str):
+        raise NotImplementedError
+
+    def write_batch(self, operations: dict) -> bool:
+        """
+            Writes the operations of every collection with one ordered bulk_write each.
+            Backends that can make the writes of all collections atomic override this.
+        """
+        for collection_name, collection_operations in operations.items():
+            if collection_operations:
+                self.get_collection(collection_name).bulk_write(collection_operations, ordered=True)
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class MongoBackend(StorageBackend):
+
+    name = "mongodb"
+
+    def __init__(self):
+        self.transactions = USE_TRANSACTIONS       # cleared once the server turns out to be standalone
+
+    def get_collection(self, name: str):
+        return connection.get_collection(name)
+
+    def write_batch(self, operations: dict) -> bool:
+        """
+            One ordered bulk_write per collection, inside a multi-document transaction
+            when the server is a replica set or mongos
+        """
+        requests = {
+            collection_name: [to_pymongo(operation) for operation in collection_operations]
+            for collection_name, collection_operations in operations.items() if collection_operations
+        }
+        database = connection.get_database()
+
+        def write(session=None):
+            for collection_name, collection_requests in requests.items():
+                database.get_collection(collection_name).bulk_write(collection_requests, ordered=True,
+                                                                    session=session)
+
+        if self.transactions:
+            try:
+                with connection.get_client().start_session() as session:
+                    session.with_transaction(write)
+                return True
+            except OperationFailure as e:
+                # IllegalOperation: transactions need a replica set member or mongos
+                if e.code != 20:
+                    raise
+                self.transactions = False
+
+        write()
+        return True
+
+    def close(self) -> None:
+        connection.close_client()
+
+
+def to_pymongo(operation):
+    if operation.kind == "InsertOne":
+        return pymongo.InsertOne(operation.document)
+    if operation.kind in ("DeleteOne", "DeleteMany"):
+        return getattr(pymongo, operation.kind)(operation.query)
+    if operation.kind in ("UpdateOne", "UpdateMany") and not any(key.startswith("$") for key in operation.document):
+        # A replacement document replaces a single document, as with pymongo
+        if operation.kind == "UpdateMany":
+            raise ValueError("update only works with $ operators")
+        return pymongo.ReplaceOne(operation.query, operation.document, upsert=operation.upsert)
+    return getattr(pymongo, operation.kind)(operation.query, operation.document, upsert=operation.upsert)
+
+
+def create_backend(name: str) -> StorageBackend:
+    if name == MongoBackend.name:
+        return MongoBackend()
+    if name == "embedded":
+        from .embedded import EmbeddedBackend
+        return EmbeddedBackend()
+    raise ValueError(f"Unknown storage backend {name}")
+
+
+_backend = None
+_backend_lock = Lock()
+
+
+def get_backend() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(BACKEND)
+    return _backend
+
+
+def get_collection(name: str):
+    return get_backend().get_collection(name)
+
+
+def close_backend() -> None:
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
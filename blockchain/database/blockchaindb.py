@@ -1,5 +1,6 @@
-import pymongo
-from .settings import SERVER, DATABASE_NAME
+from threading import RLock
+from .backend import get_collection
+from .operations import WriteBatch, InsertOne, UpdateOne, DeleteMany
 
 COLLECTION_NAME = "BlockChain"
 CONFIG_COLLECTION_NAME = "BlockChainConfig"
@@ -16,127 +17,254 @@ BLOCKCHAIN CONFIG STRUCTURE
 
     {
         config: 'blockchain',
-        last_block_id: str,
-        last_block_number: int,
+        last_block_id: str,           // None while the chain is empty
+        last_block_number: int,       // blocks are numbered from 1, 0 while the chain is empty
     }
 
+    The active chain is read once per process into CHAIN_INDEX and every write of
+    the models updates both, so reading the tip, a height or the height of a block
+    costs no query.
+
+    append() and remove_until() take an optional WriteBatch, so a block connect or a
+    reorg commits the chain with the rest of its writes. The index is updated right
+    away and reloaded from the collection if that commit fails.
+
 """
 
+
+class ChainIndex:
+    """
+        Block ids of the active chain by height and heights by block id
+
+        - block_ids: [str]            // block_ids[n - 1] is the block number n
+        - heights: {block_id: int}
+
+        Methods
+        - load(collection) -> int
+        - get_block_id(block_number: int) -> str
+        - get_block_number(block_id: str) -> int
+        - append(block_id: str) -> int
+        - replace(block_number: int, block_id: str) -> None
+        - truncate(block_number: int) -> [str]
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.block_ids = []
+        self.heights = {}
+        self.lock = RLock()
+
+    @property
+    def block_number(self) -> int:
+        return len(self.block_ids)
+
+    @property
+    def block_id(self) -> str:
+        return self.block_ids[-1] if self.block_ids else None
+
+    def load(self, collection) -> int:
+        """
+            Streams the chain collection once, returns the number of blocks
+        """
+        with self.lock:
+            block_ids = []
+            cursor = collection.find({}, {"_id": 0, "block_number": 1, "block_id": 1})
+            for document in cursor:
+                index = document["block_number"] - 1
+                if index >= len(block_ids):
+                    block_ids.extend([None] * (index + 1 - len(block_ids)))
+                block_ids[index] = document["block_id"]
+
+            # A gap means the blocks after it were left behind by an interrupted removal
+            if None in block_ids:
+                block_ids = block_ids[:block_ids.index(None)]
+            self.block_ids = block_ids
+            self.heights = {block_id: number for number, block_id in enumerate(block_ids, 1)}
+            self.loaded = True
+            return len(block_ids)
+
+    def get_block_id(self, block_number: int) -> str:
+        if 1 <= block_number <= len(self.block_ids):
+            return self.block_ids[block_number - 1]
+        return None
+
+    def get_block_number(self, block_id: str) -> int:
+        return self.heights.get(block_id)
+
+    def append(self, block_id: str) -> int:
+        with self.lock:
+            self.block_ids.append(block_id)
+            self.heights[block_id] = len(self.block_ids)
+            return len(self.block_ids)
+
+    def replace(self, block_number: int, block_id: str) -> None:
+        with self.lock:
+            self.heights.pop(self.block_ids[block_number - 1], None)
+            self.block_ids[block_number - 1] = block_id
+            self.heights[block_id] = block_number
+
+    def truncate(self, block_number: int) -> list:
+        """
+            Drops every block above block_number, returns their ids tip first
+        """
+        with self.lock:
+            removed = self.block_ids[block_number:]
+            del self.block_ids[block_number:]
+            for block_id in removed:
+                self.heights.pop(block_id, None)
+            removed.reverse()
+            return removed
+
+
+CHAIN_INDEX = ChainIndex()
+
+
+def _config_update(block_number: int, block_id: str) -> dict:
+    return {"$set": {"last_block_number": block_number, "last_block_id": block_id}}
+
+
 class BlockChainModel:
-    
+
     def __init__(self):
-        client = pymongo.MongoClient(SERVER)
-        db = client.get_database(DATABASE_NAME)
-        self.collection = db.get_collection(COLLECTION_NAME)
-        self.config_collection = db.get_collection(CONFIG_COLLECTION_NAME)
-
-        #  Initialising if not done        
-        res = self.config_collection.find_one({'config': 'blockchain'}, {'_id': 0})
-        if res is None:
-            res = self.config_collection.insert_one(
-                {
-                    "config": "blockchain",
-                    "last_block_number": 0,
-                    "last_block_id": None,
-                }
-            )
+        self.collection = get_collection(COLLECTION_NAME)
+        self.config_collection = get_collection(CONFIG_COLLECTION_NAME)
+        self.chain = CHAIN_INDEX
+
+        with self.chain.lock:
+            if not self.chain.loaded:
+                self.load_chain()
+
+    def load_chain(self) -> int:
+        """
+            Loads the active chain into memory, initialising the config if not done
+        """
+        with self.chain.lock:
+            res = self.config_collection.find_one({'config': 'blockchain'}, {'_id': 0})
+            if res is None:
+                self.config_collection.insert_one(
+                    {
+                        "config": "blockchain",
+                        "last_block_number": 0,
+                        "last_block_id": None,
+                    }
+                )
+                res = {"last_block_number": 0, "last_block_id": None}
+
+            count = self.chain.load(self.collection)
+            if (res["last_block_number"], res["last_block_id"]) != (count, self.chain.block_id):
+                self.config_collection.update_one({'config': 'blockchain'}, _config_update(count, self.chain.block_id))
+            return count
 
     def getby_block_number(self, block_number: int) -> str:
-        res = self.collection.find_one({"block_number": block_number}, {"_id": 0})
-        if res is not None:
-            return res["block_id"]
-        return None
+        return self.chain.get_block_id(block_number)
 
     def getby_block_id(self, block_id: str) -> int:
-        res = self.collection.find_one({"block_id": block_id}, {"_id": 0})
-        if res is not None:
-            return res['block_number']
-        return None
+        return self.chain.get_block_number(block_id)
 
     def get_last_block_number(self) -> int:
-        res = self.config_collection.find_one({'config': 'blockchain'}, {'_id': 0})
-        return res['last_block_number']
+        return self.chain.block_number
 
     def get_last_block_id(self) -> str:
-        res = self.config_collection.find_one({'config': 'blockchain'}, {'_id': 0})
-        return res['last_block_id']        
+        return self.chain.block_id
 
+    def append(self, block_id: str, batch: WriteBatch = None) -> bool:
+        """
+            Appends the block to the chain, with batch its writes are left to the caller to commit
+        """
+        with self.chain.lock:
+            block_number = self.chain.block_number + 1
+            writes = batch if batch is not None else WriteBatch()
+            writes.add(COLLECTION_NAME, InsertOne({'block_id': block_id, 'block_number': block_number}))
+            writes.add(CONFIG_COLLECTION_NAME, UpdateOne(
+                {'config': 'blockchain'},
+                _config_update(block_number, block_id)
+            ))
+            self.chain.append(block_id)
+            return batch is not None or self.commit(writes)
 
-    def append(self, block_id: str) -> bool:
-        block_number = self.get_last_block_number()
-        res = self.collection.insert_one({'block_id': block_id, 'block_number': block_number})
-
-        update_config = self.config_collection.update_one(
-            {
-                'config': 'blockchain'
-            },
-            {
-                'last_block_number': block_number,
-                'last_block_id': block_id,
-            }
-        )
-        return res.acknowledged and update_config.acknowledged
+    def commit(self, batch: WriteBatch) -> bool:
+        """
+            Commits a batch holding writes of the chain, the chain is reloaded if it fails
+        """
+        try:
+            return batch.commit()
+        except Exception:
+            self.load_chain()
+            raise
 
     def updateby_number(self, block_number: int, block_id: str) -> bool:
         if block_number == self.get_last_block_number():
             return self.update_last(block_id)
+        if self.chain.get_block_id(block_number) is None:
+            return False
 
-        res = self.collection.update_one(
-            {"block_number": block_number},
-            {"block_id": block_id}
-        )
-        return res.acknowledged
+        with self.chain.lock:
+            res = self.collection.update_one(
+                {"block_number": block_number},
+                {"$set": {"block_id": block_id}}
+            )
+            self.chain.replace(block_number, block_id)
+            return res.acknowledged
 
     def update_last(self, block_id: str) -> bool:
-        res = self.collection.update_one(
-            {"block_number": block_number},
-            {"block_id": block_id}
-        )
-
-        #
-        update_config = self.config_collection.update_one(
-            {'config': 'blockchain'},
-            {'last_block_id': block_id}
-        )
-
-        return res.acknowledged and update_config.acknowledged
+        with self.chain.lock:
+            block_number = self.chain.block_number
+            if block_number == 0:
+                return False
+            res = self.collection.update_one(
+                {"block_number": block_number},
+                {"$set": {"block_id": block_id}}
+            )
+            update_config = self.config_collection.update_one(
+                {'config': 'blockchain'},
+                _config_update(block_number, block_id)
+            )
+            self.chain.replace(block_number, block_id)
+            return res.acknowledged and update_config.acknowledged
 
     def removeby_number(self, block_number: int) -> bool:
-        if block_number == self.get_last_block_number():
-            return self.remove_last()
-        
-        res = self.collection.delete_one({'block_number': block_number})
-        return res.acknowledged
-    
+        """
+            Removes the block and, as the chain can't have a gap, every block after it
+        """
+        with self.chain.lock:
+            if self.chain.get_block_id(block_number) is None:
+                return False
+            return len(self.remove_until(block_number - 1)) > 0
 
     def remove_last(self) -> bool:
-        number = self.get_last_block_number()
-        res = self.collection.delete_one({'block_number': number})
-
-        #  Updating config after removal
-        update_config = self.config_collection.update_one(
-            {'config': 'blockchain'},
-            {'last_block_number': number-1,'last_block_id': self.getby_block_number(number-1) }
-        )
-        return res.acknowledged and update_config.acknowledged
+        with self.chain.lock:
+            if self.chain.block_id is None:
+                return False
+            return len(self.remove_until(self.chain.block_number - 1)) == 1
 
-    def remove_until(self, block_number: int) -> dict:
+    def remove_until(self, block_number: int, batch: WriteBatch = None) -> list:
         """
             Removes all blocks from chain until given block_number
             doesn't remove given block number
-        """
-        removed_list = []
-        number = self.get_last_block_number()
-        while number > block_number:
-            removed_list.append(self.get_last_block_id())
-            self.remove_last()
-            number -= 1
 
-        return removed_list
+            Returns the removed block ids, tip first. The blocks are deleted with one
+            delete_many, committed together with the config update, or left in batch
+            for the caller to commit.
+        """
+        with self.chain.lock:
+            if block_number >= self.chain.block_number:
+                return []
+            block_number = max(block_number, 0)
+            last_block_id = self.chain.get_block_id(block_number)
 
+            writes = batch if batch is not None else WriteBatch()
+            writes.add(COLLECTION_NAME, DeleteMany({'block_number': {'$gt': block_number}}))
+            writes.add(CONFIG_COLLECTION_NAME, UpdateOne(
+                {'config': 'blockchain'},
+                _config_update(block_number, last_block_id)
+            ))
+            removed = self.chain.truncate(block_number)
+            if batch is None:
+                self.commit(writes)
+            return removed
 
     def block_exists(self, block_id: str) -> bool:
-        block = self.collection.find_one({'block_id': str})
-        if block is not None:
-            return True
-        return False
+        """
+            True if the block is part of the active chain
+        """
+        return self.chain.get_block_number(block_id) is not None
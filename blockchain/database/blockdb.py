@@ -1,8 +1,21 @@
-import pymongo
-from .settings import SERVER, DATABASE_NAME
+from .backend import get_collection
+from .formats import get_format
 
 COLLECTION_NAME = "Block"
 
+# Header fields, solutions and transaction ids of a block, enough to build its merkle tree and id
+HEADER_PROJECTION = {
+    "_id": 0,
+    "block_id": 1,
+    "version": 1,
+    "previous_block": 1,
+    "timestamp": 1,
+    "miner_public_key": 1,
+    "reward_transaction.transaction_id": 1,
+    "solved_transactions.solution": 1,
+    "solved_transactions.transaction.transaction_id": 1,
+}
+
 """
 BLOCK DOCUMENT STRUCTURE
 
@@ -21,24 +34,55 @@ BLOCK DOCUMENT STRUCTURE
         reward_transaction: <Transaction>
     }
 
+    With the compressed format (STORAGE_FORMATS in database/settings.py) a block
+    is stored as block_header() plus a zlib payload holding the transactions.
+    HEADER_PROJECTION reads the same fields from both formats.
+
 """
 
 
+def block_header(block_document: dict) -> dict:
+    """
+        Header fields, solutions and transaction ids of the block, kept queryable by the compressed format
+    """
+    reward_transaction = block_document.get("reward_transaction")
+    return {
+        "block_id": block_document.get("block_id"),
+        "version": block_document.get("version"),
+        "previous_block": block_document.get("previous_block"),
+        "timestamp": block_document.get("timestamp"),
+        "miner_public_key": block_document.get("miner_public_key"),
+        "reward_transaction": (
+            {"transaction_id": reward_transaction.get("transaction_id")} if reward_transaction is not None else None
+        ),
+        "solved_transactions": [
+            {"solution": solved.get("solution"), "transaction": {"transaction_id": solved["transaction"]["transaction_id"]}}
+            for solved in block_document.get("solved_transactions") or []
+        ],
+    }
+
+
 class BlockModel:
 
     def __init__(self):
-        client = pymongo.MongoClient(SERVER)
-        db = client.get_database(DATABASE_NAME)
-        self.collection = db.get_collection(COLLECTION_NAME)
+        self.collection = get_collection(COLLECTION_NAME)
+        self.format = get_format(COLLECTION_NAME, block_header)
 
     def block_exists(self, block_id: str) -> bool:
-        query_result = self.collection.find_one({"block_id": block_id}, {"_id": 0})
+        query_result = self.collection.find_one({"block_id": block_id}, {"_id": 0, "block_id": 1})
         return query_result is not None
 
     def add_block(self, block_document: dict) -> bool:
-        query_result = self.collection.insert_one(block_document)
+        query_result = self.collection.insert_one(self.format.encode(block_document))
         return query_result.acknowledged
 
     def get_block(self, block_id: str) -> dict:
         query_result = self.collection.find_one({"block_id": block_id}, {"_id": 0})
+        return self.format.decode(query_result)
+
+    def get_block_header(self, block_id: str) -> dict:
+        """
+            Block document reduced to its header fields and transaction ids
+        """
+        query_result = self.collection.find_one({"block_id": block_id}, HEADER_PROJECTION)
         return query_result
@@ -0,0 +1,55 @@
+import pymongo
+from threading import Lock
+from .settings import SERVER, DATABASE_NAME, MAX_POOL_SIZE, MIN_POOL_SIZE, SERVER_SELECTION_TIMEOUT_MS
+
+"""
+
+    Process wide MongoDB connection
+
+        The client is created on first use and shared by every model, so creating a
+        model costs no connection. pymongo keeps up to MAX_POOL_SIZE sockets per
+        server and hands them out to the threads that need one.
+
+        Methods
+        - get_client() -> pymongo.MongoClient
+        - get_database() -> pymongo.database.Database
+        - get_collection(name: str) -> pymongo.collection.Collection
+        - close_client() -> None
+
+"""
+
+_client = None
+_client_lock = Lock()
+
+
+def get_client() -> pymongo.MongoClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = pymongo.MongoClient(
+                    SERVER,
+                    maxPoolSize=MAX_POOL_SIZE,
+                    minPoolSize=MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                )
+    return _client
+
+
+def get_database():
+    return get_client().get_database(DATABASE_NAME)
+
+
+def get_collection(name: str):
+    return get_database().get_collection(name)
+
+
+def close_client() -> None:
+    """
+        Closes the shared client, the next get_client() opens a new one
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,897 @@
+import os
+import json
+import base64
+import mmap
+import struct
+from threading import RLock
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from .backend import StorageBackend
+from .operations import Operation, operation_from_json
+from .blockdb import COLLECTION_NAME as BLOCK_COLLECTION_NAME
+from .query import matches, project, apply_update, upsert_document, sort_documents
+from .settings import DATA_DIRECTORY, BLOCK_SEGMENT_SIZE, JOURNAL_COMPACT_MIN, SYNC_WRITES
+
+"""
+
+    Embedded storage backend
+
+        Runs the models without a database server, everything is kept under DATA_DIRECTORY.
+
+    class BlockFileCollection
+
+        Block documents appended to segment files of up to BLOCK_SEGMENT_SIZE bytes,
+        each record being a 4 byte length and the JSON document. index.log maps every
+        block_id to (segment, offset, length) and is replayed at startup, records
+        written after the last index entry are recovered by scanning the segment tail.
+        Blocks are read back through memory maps of the segments. Blocks are append
+        only, replacing one raises ReadOnlyCollectionError. Appends reverted by undo()
+        are cut off the end of their segment, a [null, [segment, offset]] entry in
+        index.log records the cut so it is completed at the next start if interrupted.
+
+    class JournaledCollection
+
+        Documents kept in memory and persisted as an append-only journal of puts and
+        deletes, compacted into a snapshot once it holds more than twice as many
+        entries as there are documents. Indexes created with create_indexes() are hash
+        indexes answering equality and $in lookups, their definitions are kept in
+        <name>.indexes and rebuilt while the journal is replayed.
+
+    Both answer the pymongo Collection API the models use, see backend.py. There is
+    no aggregate(), no model runs a pipeline.
+
+"""
+
+RECORD_HEADER = struct.Struct(">I")
+
+
+class ReadOnlyCollectionError(OperationFailure):
+    """
+        Write the collection does not allow, like replacing a block of the append only block files
+    """
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def _encode_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"$binary": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_bytes(document: dict):
+    if len(document) == 1 and "$binary" in document:
+        return base64.b64decode(document["$binary"])
+    return document
+
+
+def _dumps(value) -> str:
+    """
+        json.dumps keeping bytes values, written as {"$binary": base64} like mongodb extended json
+    """
+    return json.dumps(value, default=_encode_bytes)
+
+
+def _loads(data):
+    return json.loads(data, object_hook=_decode_bytes)
+
+
+def _field_value(document: dict, path: str):
+    value = document
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return _freeze(value)
+
+
+def _is_condition(value) -> bool:
+    return isinstance(value, dict) and any(key.startswith("$") for key in value)
+
+
+def _sync(file) -> None:
+    file.flush()
+    if SYNC_WRITES:
+        os.fsync(file.fileno())
+
+
+class WriteResult:
+
+    acknowledged = True
+
+    def __init__(self, inserted_id=None, matched_count: int = 0, modified_count: int = 0,
+                 deleted_count: int = 0, upserted_id=None):
+        self.inserted_id = inserted_id
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.deleted_count = deleted_count
+        self.upserted_id = upserted_id
+
+
+class BulkWriteResult:
+
+    acknowledged = True
+
+    def __init__(self):
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.deleted_count = 0
+        self.upserted_count = 0
+
+    def add(self, result: WriteResult) -> None:
+        self.inserted_count += result.inserted_id is not None
+        self.matched_count += result.matched_count
+        self.modified_count += result.modified_count
+        self.deleted_count += result.deleted_count
+        self.upserted_count += result.upserted_id is not None
+
+
+class Cursor:
+    """
+        Result of find(), documents are matched when the cursor is first iterated
+    """
+
+    def __init__(self, load, projection: dict = None):
+        self._load = load
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def __iter__(self):
+        documents = self._load()
+        if self._sort:
+            documents = sort_documents(documents, self._sort)
+        end = self._skip + self._limit if self._limit else None
+        for document in documents[self._skip:end]:
+            yield project(document, self._projection)
+
+
+def _operation_of(request) -> tuple:
+    """
+        (kind, filter, document, upsert) of an Operation or a pymongo bulk_write request
+    """
+    if isinstance(request, Operation):
+        return request.kind, request.query, request.document, request.upsert
+    if isinstance(request, tuple):
+        return request
+    kind = type(request).__name__
+    return kind, getattr(request, "_filter", None), getattr(request, "_doc", None), \
+        bool(getattr(request, "_upsert", False))
+
+
+class EmbeddedCollection:
+    """
+        Collection API over a storage of documents keyed by _id, subclasses persist the changes
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = RLock()
+        self._changes = None        # (document, replaced) of every write while recording, see record()
+
+    # Storage, implemented by the subclasses
+    def _candidates(self, query: dict) -> list:
+        raise NotImplementedError
+
+    def _put(self, document: dict, replaced: dict = None) -> None:
+        raise NotImplementedError
+
+    def _delete(self, document: dict) -> None:
+        raise NotImplementedError
+
+    def _commit(self) -> None:
+        pass
+
+    def _new_document(self, document: dict) -> dict:
+        raise NotImplementedError
+
+    def _write(self, document: dict, replaced: dict = None) -> None:
+        self._put(document, replaced)
+        if self._changes is not None:
+            self._changes.append((document, replaced))
+
+    def _erase(self, document: dict) -> None:
+        self._delete(document)
+        if self._changes is not None:
+            self._changes.append((None, document))
+
+    def record(self, requests: list) -> list:
+        """
+            bulk_write() returning the changes it made, for undo(). The changes made
+            before a failing request are attached to the exception as changes.
+        """
+        with self._lock:
+            self._changes = changes = []
+            try:
+                self.bulk_write(requests, ordered=True)
+            except Exception as e:
+                e.changes = changes
+                raise
+            finally:
+                self._changes = None
+            return changes
+
+    def undo(self, changes: list) -> None:
+        """
+            Reverts changes returned by record(), latest first
+        """
+        with self._lock:
+            try:
+                for document, replaced in reversed(changes):
+                    if document is None:
+                        self._put(replaced)
+                    elif replaced is None:
+                        self._delete(document)
+                    else:
+                        self._put(replaced, document)
+            finally:
+                self._commit()
+
+    def _find(self, query: dict) -> list:
+        return [document for document in self._candidates(query or {}) if matches(document, query)]
+
+    def find(self, query: dict = None, projection: dict = None) -> Cursor:
+        def load():
+            with self._lock:
+                return self._find(query)
+        return Cursor(load, projection)
+
+    def find_one(self, query: dict = None, projection: dict = None) -> dict:
+        with self._lock:
+            for document in self._candidates(query or {}):
+                if matches(document, query):
+                    return project(document, projection)
+        return None
+
+    def count_documents(self, query: dict) -> int:
+        with self._lock:
+            return len(self._find(query))
+
+    def _insert(self, document: dict) -> WriteResult:
+        document = self._new_document(document)
+        self._write(document)
+        return WriteResult(inserted_id=document.get("_id"))
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool) -> WriteResult:
+        if many and not any(key.startswith("$") for key in update):
+            raise ValueError("update only works with $ operators")
+        found = self._find(query)
+        if not many:
+            found = found[:1]
+        if not found:
+            if upsert:
+                document = self._new_document(upsert_document(query, update))
+                self._write(document)
+                return WriteResult(upserted_id=document.get("_id"))
+            return WriteResult()
+
+        modified = 0
+        for document in found:
+            updated = apply_update(document, update)
+            if updated != document:
+                self._write(updated, document)
+                modified += 1
+        return WriteResult(matched_count=len(found), modified_count=modified)
+
+    def _remove(self, query: dict, many: bool) -> WriteResult:
+        found = self._find(query)
+        if not many:
+            found = found[:1]
+        for document in found:
+            self._erase(document)
+        return WriteResult(deleted_count=len(found))
+
+    def insert_one(self, document: dict) -> WriteResult:
+        with self._lock:
+            try:
+                return self._insert(document)
+            finally:
+                self._commit()
+
+    def insert_many(self, documents: list) -> BulkWriteResult:
+        return self.bulk_write([("InsertOne", None, document, False) for document in documents])
+
+    def update_one(self, query: dict, update: dict, upsert: bool = False) -> WriteResult:
+        with self._lock:
+            try:
+                return self._update(query, update, upsert, many=False)
+            finally:
+                self._commit()
+
+    def update_many(self, query: dict, update: dict, upsert: bool = False) -> WriteResult:
+        with self._lock:
+            try:
+                return self._update(query, update, upsert, many=True)
+            finally:
+                self._commit()
+
+    def replace_one(self, query: dict, document: dict, upsert: bool = False) -> WriteResult:
+        return self.update_one(query, document, upsert)
+
+    def delete_one(self, query: dict) -> WriteResult:
+        with self._lock:
+            try:
+                return self._remove(query, many=False)
+            finally:
+                self._commit()
+
+    def delete_many(self, query: dict) -> WriteResult:
+        with self._lock:
+            try:
+                return self._remove(query, many=True)
+            finally:
+                self._commit()
+
+    def bulk_write(self, requests: list, ordered: bool = True) -> BulkWriteResult:
+        """
+            Applies the requests in order and persists them together, stops at the first failing one
+        """
+        result = BulkWriteResult()
+        with self._lock:
+            try:
+                for request in requests:
+                    kind, query, document, upsert = _operation_of(request)
+                    if kind == "InsertOne":
+                        result.add(self._insert(document))
+                    elif kind in ("UpdateOne", "ReplaceOne"):
+                        result.add(self._update(query, document, upsert, many=False))
+                    elif kind == "UpdateMany":
+                        result.add(self._update(query, document, upsert, many=True))
+                    elif kind == "DeleteOne":
+                        result.add(self._remove(query, many=False))
+                    elif kind == "DeleteMany":
+                        result.add(self._remove(query, many=True))
+                    else:
+                        raise ValueError(f"Unsupported bulk write request {kind}")
+            finally:
+                self._commit()
+        return result
+
+    def close(self) -> None:
+        pass
+
+
+class HashIndex:
+
+    __slots__ = ("name", "fields", "unique", "entries", "leading")
+
+    def __init__(self, name: str, fields: list, unique: bool = False):
+        self.name = name
+        self.fields = fields
+        self.unique = unique
+        self.entries = {}
+        self.leading = {} if len(fields) > 1 else None     # first field value -> ids, for compound indexes
+
+    def key_of(self, document: dict) -> tuple:
+        return tuple(_field_value(document, field) for field in self.fields)
+
+    def add(self, key: tuple, document_id) -> None:
+        self.entries.setdefault(key, set()).add(document_id)
+        if self.leading is not None:
+            self.leading.setdefault(key[0], set()).add(document_id)
+
+    def discard(self, key: tuple, document_id) -> None:
+        for entries, entry_key in ((self.entries, key), (self.leading, key[0] if self.leading is not None else None)):
+            if entries is None:
+                continue
+            ids = entries.get(entry_key)
+            if ids is not None:
+                ids.discard(document_id)
+                if not ids:
+                    del entries[entry_key]
+
+    def information(self) -> dict:
+        information = {"key": [(field, 1) for field in self.fields]}
+        if self.unique:
+            information["unique"] = True
+        return information
+
+
+class JournaledCollection(EmbeddedCollection):
+
+    def __init__(self, name: str, directory: str):
+        super().__init__(name)
+        self.path = os.path.join(directory, f"{name}.journal")
+        self.index_path = os.path.join(directory, f"{name}.indexes")
+        self.documents = {}
+        self.indexes = {"_id_": HashIndex("_id_", ["_id"], unique=True)}
+        self._next_id = 1
+        self._pending = []
+        self._journal_entries = 0
+        self._load_indexes()
+        self._replay()
+        self._journal = open(self.path, "a", encoding="utf-8")
+
+    def _load_indexes(self) -> None:
+        # Empty until the journal is replayed, which fills them
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as index_file:
+                for name, fields, unique in _loads(index_file.read()):
+                    self.indexes[name] = HashIndex(name, fields, unique)
+
+    def _save_indexes(self) -> None:
+        temporary = self.index_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as index_file:
+            index_file.write(_dumps([[index.name, index.fields, index.unique]
+                                     for name, index in self.indexes.items() if name != "_id_"]))
+            _sync(index_file)
+        os.replace(temporary, self.index_path)
+
+    def _replay(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        valid_size = 0
+        with open(self.path, "rb") as journal:
+            for line in journal:
+                try:
+                    entry = _loads(line)
+                except ValueError:
+                    # Torn write at the end of the journal
+                    break
+                if entry[0] == "put":
+                    self._store(entry[1])
+                elif _freeze(entry[1]) in self.documents:
+                    self._unstore(self.documents[_freeze(entry[1])])
+                self._journal_entries += 1
+                valid_size += len(line)
+        if valid_size < os.path.getsize(self.path):
+            with open(self.path, "r+b") as journal:
+                journal.truncate(valid_size)
+
+    # Memory
+    def _store(self, document: dict, replaced: dict = None) -> None:
+        if replaced is not None:
+            self._unstore(replaced)
+        for index in self.indexes.values():
+            index.add(index.key_of(document), _freeze(document["_id"]))
+        self.documents[_freeze(document["_id"])] = document
+        if isinstance(document["_id"], int) and document["_id"] >= self._next_id:
+            self._next_id = document["_id"] + 1
+
+    def _unstore(self, document: dict) -> None:
+        document_id = _freeze(document["_id"])
+        for index in self.indexes.values():
+            index.discard(index.key_of(document), document_id)
+        del self.documents[document_id]
+
+    def _check_unique(self, document: dict, replaced: dict = None) -> None:
+        replaced_id = _freeze(replaced["_id"]) if replaced is not None else None
+        for index in self.indexes.values():
+            if index.unique:
+                ids = index.entries.get(index.key_of(document), ())
+                if any(document_id != replaced_id for document_id in ids):
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} "
+                                            f"index: {index.name}")
+
+    def _new_document(self, document: dict) -> dict:
+        document = dict(document)
+        if "_id" not in document:
+            document["_id"] = self._next_id
+            self._next_id += 1
+        return _loads(_dumps(document))
+
+    def _put(self, document: dict, replaced: dict = None) -> None:
+        self._check_unique(document, replaced)
+        self._store(document, replaced)
+        self._pending.append(["put", document])
+
+    def _delete(self, document: dict) -> None:
+        self._unstore(document)
+        self._pending.append(["delete", document["_id"]])
+
+    def _commit(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self._journal.write("".join(_dumps(entry) + "\n" for entry in pending))
+        _sync(self._journal)
+        self._journal_entries += len(pending)
+        if self._journal_entries > max(JOURNAL_COMPACT_MIN, 2 * len(self.documents)):
+            self.compact()
+
+    def compact(self) -> None:
+        """
+            Rewrites the journal as one put per document
+        """
+        with self._lock:
+            temporary = self.path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as snapshot:
+                for document in self.documents.values():
+                    snapshot.write(_dumps(["put", document]) + "\n")
+                _sync(snapshot)
+            self._journal.close()
+            os.replace(temporary, self.path)
+            self._journal = open(self.path, "a", encoding="utf-8")
+            self._journal_entries = len(self.documents)
+
+    def _candidates(self, query: dict) -> list:
+        best = None
+        for index in self.indexes.values():
+            if not all(field in query for field in index.fields):
+                # A compound index still narrows a query on its first field
+                leading = query.get(index.fields[0])
+                if index.leading is not None and index.fields[0] in query and not _is_condition(leading):
+                    ids = index.leading.get(_freeze(leading), set())
+                    if best is None or len(ids) < len(best):
+                        best = ids
+                continue
+            conditions = [query[field] for field in index.fields]
+            if all(not _is_condition(condition) for condition in conditions):
+                ids = index.entries.get(tuple(_freeze(condition) for condition in conditions), set())
+            elif len(conditions) == 1 and set(conditions[0]) == {"$in"}:
+                ids = set().union(*(index.entries.get((_freeze(value),), ()) for value in conditions[0]["$in"]))
+            else:
+                continue
+            if best is None or len(ids) < len(best):
+                best = ids
+        if best is None:
+            return list(self.documents.values())
+        return [self.documents[document_id] for document_id in best]
+
+    def create_indexes(self, indexes: list) -> list:
+        """
+            Builds the indexes and saves their definitions, an index already present is left as is
+        """
+        with self._lock:
+            names = []
+            created = False
+            try:
+                for index_model in indexes:
+                    document = index_model.document
+                    index = HashIndex(document["name"], list(document["key"]), document.get("unique", False))
+                    existing = self.indexes.get(index.name)
+                    if existing is not None and (existing.fields, existing.unique) == (index.fields, index.unique):
+                        names.append(index.name)
+                        continue
+                    for document_id, stored in self.documents.items():
+                        key = index.key_of(stored)
+                        if index.unique and key in index.entries:
+                            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} "
+                                                    f"index: {index.name}")
+                        index.add(key, document_id)
+                    self.indexes[index.name] = index
+                    names.append(index.name)
+                    created = True
+            finally:
+                if created:
+                    self._save_indexes()
+            return names
+
+    def index_information(self) -> dict:
+        return {name: index.information() for name, index in self.indexes.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            self._journal.close()
+
+
+class BlockFileCollection(EmbeddedCollection):
+
+    def __init__(self, name: str, directory: str, key: str = "block_id"):
+        super().__init__(name)
+        self.key = key
+        self.directory = os.path.join(directory, name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.locations = {}             # key -> (segment, offset, length)
+        self._maps = {}                 # segment -> mmap
+        self._pending = []
+        self._load_index()
+        self._recover()
+        self._segment = max(self._segments(), default=0)
+        self._segment_file = open(self._segment_path(self._segment), "ab")
+        self._index_file = open(self._index_path(), "a", encoding="utf-8")
+        self._commit()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "index.log")
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment_{segment:05d}.dat")
+
+    def _segments(self) -> list:
+        return sorted(int(file_name[8:13]) for file_name in os.listdir(self.directory)
+                      if file_name.startswith("segment_") and file_name.endswith(".dat"))
+
+    def _load_index(self) -> None:
+        self._indexed_ends = {}
+        self._cuts = {}                 # segment -> offset its end was cut at, until a record follows
+        if not os.path.exists(self._index_path()):
+            return
+        valid_size = 0
+        with open(self._index_path(), "rb") as index_file:
+            for line in index_file:
+                try:
+                    key, location = _loads(line)
+                except ValueError:
+                    break
+                valid_size += len(line)
+                if key is None:
+                    segment, offset = location
+                    self._indexed_ends[segment] = self._cuts[segment] = offset
+                    continue
+                if location is None:
+                    self.locations.pop(key, None)
+                    continue
+                segment, offset, length = location
+                self.locations[key] = (segment, offset, length)
+                end = offset + RECORD_HEADER.size + length
+                self._indexed_ends[segment] = max(self._indexed_ends.get(segment, 0), end)
+                self._cuts.pop(segment, None)
+        if valid_size < os.path.getsize(self._index_path()):
+            with open(self._index_path(), "r+b") as index_file:
+                index_file.truncate(valid_size)
+
+    def _recover(self) -> None:
+        """
+            Indexes records written after the last index.log entry, drops a torn record at the end
+        """
+        for segment in self._segments():
+            path = self._segment_path(segment)
+            offset = self._indexed_ends.get(segment, 0)
+            size = os.path.getsize(path)
+            if segment in self._cuts and size > offset:
+                # Interrupted after the cut was logged, the reverted records are still there
+                with open(path, "r+b") as segment_file:
+                    segment_file.truncate(offset)
+                size = offset
+            if offset >= size:
+                continue
+            with open(path, "rb") as segment_file:
+                segment_file.seek(offset)
+                while offset + RECORD_HEADER.size <= size:
+                    length, = RECORD_HEADER.unpack(segment_file.read(RECORD_HEADER.size))
+                    payload = segment_file.read(length)
+                    if len(payload) < length:
+                        break
+                    try:
+                        document = _loads(payload)
+                    except ValueError:
+                        break
+                    self.locations[document[self.key]] = (segment, offset, length)
+                    self._pending.append([document[self.key], [segment, offset, length]])
+                    offset += RECORD_HEADER.size + length
+            if offset < size:
+                with open(path, "r+b") as segment_file:
+                    segment_file.truncate(offset)
+
+    def _read(self, location: tuple) -> dict:
+        segment, offset, length = location
+        end = offset + RECORD_HEADER.size + length
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            # The segment grew since it was mapped
+            if mapped is not None:
+                mapped.close()
+            self._segment_file.flush()
+            with open(self._segment_path(segment), "rb") as segment_file:
+                mapped = self._maps[segment] = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return _loads(mapped[offset + RECORD_HEADER.size:end])
+
+    def _candidates(self, query: dict) -> list:
+        condition = query.get(self.key)
+        if condition is not None and not _is_condition(condition):
+            location = self.locations.get(condition)
+            return [self._read(location)] if location is not None else []
+        if isinstance(condition, dict) and set(condition) == {"$in"}:
+            keys = [key for key in condition["$in"] if key in self.locations]
+            return [self._read(self.locations[key]) for key in keys]
+        return [self._read(location) for location in list(self.locations.values())]
+
+    def _new_document(self, document: dict) -> dict:
+        return dict(document)
+
+    def _put(self, document: dict, replaced: dict = None) -> None:
+        if replaced is not None:
+            raise ReadOnlyCollectionError(f"{self.name} is append only, {document.get(self.key)} can't be replaced")
+        key = document.get(self.key)
+        if key is None or key in self.locations:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {self.key}_unique")
+
+        payload = _dumps(document).encode("utf-8")
+        offset = self._segment_file.tell()
+        if offset and offset + RECORD_HEADER.size + len(payload) > BLOCK_SEGMENT_SIZE:
+            self._segment_file.close()
+            self._segment += 1
+            self._segment_file = open(self._segment_path(self._segment), "ab")
+            offset = 0
+        self._segment_file.write(RECORD_HEADER.pack(len(payload)) + payload)
+
+        location = (self._segment, offset, len(payload))
+        self.locations[key] = location
+        self._pending.append([key, list(location)])
+
+    def undo(self, changes: list) -> None:
+        """
+            Reverts changes returned by record(), latest first. Reverted appends that end
+            the segment files are cut off.
+        """
+        with self._lock:
+            appended = [self.locations.get(document[self.key]) for document, replaced in changes
+                        if document is not None and replaced is None]
+            super().undo(changes)
+            self._cut(sorted(filter(None, appended), reverse=True))
+
+    def _cut(self, locations: list) -> None:
+        """
+            Cuts the records at locations, latest first, off the end of the segment files. Stops at
+            the first record something was written after.
+        """
+        segment, end = self._segment, self._segment_file.tell()
+        for location_segment, offset, length in locations:
+            if (location_segment, offset + RECORD_HEADER.size + length) != (segment, end):
+                break
+            end = offset
+            # An emptied segment was started by a reverted append, it goes too
+            while end == 0 and segment > 0:
+                segment -= 1
+                end = os.path.getsize(self._segment_path(segment))
+        if (segment, end) == (self._segment, self._segment_file.tell()):
+            return
+
+        # Logged first, a cut interrupted by a crash is completed by _recover()
+        self._index_file.write(_dumps([None, [segment, end]]) + "\n")
+        _sync(self._index_file)
+        self._segment_file.close()
+        for mapped_segment in [mapped_segment for mapped_segment in self._maps if mapped_segment >= segment]:
+            self._maps.pop(mapped_segment).close()
+        for emptied in range(segment + 1, self._segment + 1):
+            os.remove(self._segment_path(emptied))
+        with open(self._segment_path(segment), "r+b") as segment_file:
+            segment_file.truncate(end)
+        self._segment = segment
+        self._segment_file = open(self._segment_path(segment), "ab")
+
+    def _delete(self, document: dict) -> None:
+        # The record stays in its segment, only the index entry goes
+        self.locations.pop(document[self.key], None)
+        self._pending.append([document[self.key], None])
+
+    def _commit(self) -> None:
+        if not self._pending:
+            return
+        # Records reach their segment before the index entries pointing at them
+        _sync(self._segment_file)
+        pending, self._pending = self._pending, []
+        self._index_file.write("".join(_dumps(entry) + "\n" for entry in pending))
+        _sync(self._index_file)
+
+    def create_indexes(self, indexes: list) -> list:
+        """
+            Blocks are only indexed by their key, which always is. Nothing is created.
+        """
+        for index_model in indexes:
+            if list(index_model.document["key"]) != [self.key]:
+                raise NotImplementedError(f"{self.name} is only indexed by {self.key}")
+        return [index_model.document["name"] for index_model in indexes]
+
+    def index_information(self) -> dict:
+        return {f"{self.key}_unique": {"key": [(self.key, 1)], "unique": True}}
+
+    def close(self) -> None:
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
+            self._segment_file.close()
+            self._index_file.close()
+
+
+class EmbeddedBackend(StorageBackend):
+
+    name = "embedded"
+
+    def __init__(self, directory: str = DATA_DIRECTORY):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.collections = {}
+        self._lock = RLock()
+        self._replay_batch()
+
+    def _batch_path(self) -> str:
+        return os.path.join(self.directory, "batch.pending")
+
+    def _apply_batch(self, operations: dict, applied: list) -> None:
+        """
+            Applies every collection's operations, appending (collection, changes) to applied
+        """
+        for collection_name, collection_operations in operations.items():
+            if collection_operations:
+                collection = self.get_collection(collection_name)
+                try:
+                    applied.append((collection, collection.record(collection_operations)))
+                except Exception as e:
+                    applied.append((collection, getattr(e, "changes", [])))
+                    raise
+
+    def _replay_batch(self) -> None:
+        """
+            Reapplies a batch interrupted by a crash. Updates and deletes are idempotent,
+            inserts already applied before the crash are skipped: the collection holds the
+            same document already, or it holds one with the same unique key.
+        """
+        path = self._batch_path()
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as batch_file:
+            try:
+                batch = _loads(batch_file.read())
+            except ValueError:
+                batch = None
+        if batch is not None:
+            for collection_name, collection_operations in batch.items():
+                collection = self.get_collection(collection_name)
+                for operation in map(operation_from_json, collection_operations):
+                    if operation.kind == "InsertOne" and collection.find_one(operation.document) is not None:
+                        continue
+                    try:
+                        collection.bulk_write([operation], ordered=True)
+                    except DuplicateKeyError:
+                        if operation.kind != "InsertOne":
+                            raise
+        os.remove(path)
+
+    def write_batch(self, operations: dict) -> bool:
+        """
+            Writes the batch ahead to batch.pending before applying it. A batch that fails
+            is reverted, one interrupted by a crash is applied again at the next start,
+            so it is all or nothing.
+        """
+        with self._lock:
+            path = self._batch_path()
+            temporary = path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as batch_file:
+                batch_file.write(_dumps({
+                    collection_name: [operation.to_json() for operation in collection_operations]
+                    for collection_name, collection_operations in operations.items()
+                }))
+                batch_file.flush()
+                os.fsync(batch_file.fileno())
+            os.replace(temporary, path)
+
+            applied = []
+            try:
+                self._apply_batch(operations, applied)
+            except Exception:
+                # Should the revert fail too, batch.pending stays and the batch is completed at the next start
+                for collection, changes in reversed(applied):
+                    collection.undo(changes)
+                os.remove(path)
+                raise
+            os.remove(path)
+            return True
+
+    def get_collection(self, name: str):
+        with self._lock:
+            collection = self.collections.get(name)
+            if collection is None:
+                if name == BLOCK_COLLECTION_NAME:
+                    collection = BlockFileCollection(name, self.directory)
+                else:
+                    collection = JournaledCollection(name, self.directory)
+                self.collections[name] = collection
+            return collection
+
+    def close(self) -> None:
+        with self._lock:
+            for collection in self.collections.values():
+                collection.close()
+            self.collections = {}
@@ -0,0 +1,82 @@
+import zlib
+import json
+from .settings import STORAGE_FORMATS, COMPRESSION_LEVEL
+
+"""
+
+    Storage formats
+
+        A format turns the documents of a model into what is stored and back, so the
+        models keep handing out plain documents whatever the collection holds.
+        STORAGE_FORMATS in database/settings.py chooses the format per collection.
+
+            "document"     the document as is
+            "compressed"   the header fields of the document, kept queryable, and a
+                           payload holding zlib over the compact json of the rest
+
+        Documents written before the format of a collection changed are still read,
+        decode() tells the formats apart by the payload field.
+
+        class DocumentFormat / CompressedFormat
+        - encode(document: dict) -> dict
+        - decode(stored: dict) -> dict
+
+        Methods
+        - get_format(collection_name: str, header) -> DocumentFormat | CompressedFormat
+
+"""
+
+PAYLOAD_FIELD = "payload"
+
+
+def decompress(stored: dict) -> dict:
+    if stored is None or PAYLOAD_FIELD not in stored:
+        return stored
+    document = {key: value for key, value in stored.items() if key != PAYLOAD_FIELD}
+    document.update(json.loads(zlib.decompress(stored[PAYLOAD_FIELD])))
+    return document
+
+
+class DocumentFormat:
+
+    name = "document"
+
+    def encode(self, document: dict) -> dict:
+        return document
+
+    def decode(self, stored: dict) -> dict:
+        return decompress(stored)
+
+
+class CompressedFormat(DocumentFormat):
+
+    name = "compressed"
+
+    def __init__(self, header, level: int = COMPRESSION_LEVEL):
+        """
+            Parameters:
+                header: function(document) -> dict     // the stored fields queries and projections use
+                level: int                             // zlib level
+        """
+        self.header = header
+        self.level = level
+
+    def encode(self, document: dict) -> dict:
+        # Header fields the document lacks stay absent, decoding must not add them
+        stored = {key: value for key, value in self.header(document).items() if key in document}
+        # Fields the header holds as they are stay out of the payload
+        body = {key: value for key, value in document.items() if key not in stored or stored[key] != value}
+        stored[PAYLOAD_FIELD] = zlib.compress(json.dumps(body, separators=(",", ":")).encode("utf-8"), self.level)
+        return stored
+
+
+def get_format(collection_name: str, header=None) -> DocumentFormat:
+    """
+        Format of the collection, a collection without a header function is always stored as documents
+    """
+    name = STORAGE_FORMATS.get(collection_name, DocumentFormat.name)
+    if name == CompressedFormat.name and header is not None:
+        return CompressedFormat(header)
+    if name not in (DocumentFormat.name, CompressedFormat.name):
+        raise ValueError(f"Unknown storage format {name} for {collection_name}")
+    return DocumentFormat()
@@ -0,0 +1,195 @@
+from datetime import datetime, timezone
+from pymongo import ASCENDING, IndexModel
+from .backend import get_backend
+from .operations import WriteBatch, UpdateOne
+from .settings import UNUSED_INDEX_MIN_AGE
+from . import addressdb, blockchaindb, blockdb, transactiondb, unspent_transactiondb
+
+"""
+
+    Index bootstrap
+
+        INDEXES lists the indexes every lookup of the models relies on. ensure_indexes()
+        creates the missing ones at startup, creating an index that already exists is
+        a no-op on the server. Unspent outputs written before they recorded public_key,
+        value and block_id are backfilled once, BlockChainConfig remembers it was done.
+
+        Methods
+        - ensure_indexes(database) -> dict
+        - find_missing_indexes(database) -> {collection: [index_name]}
+        - find_unused_indexes(database, min_age: float) -> {collection: [index_name]}
+        - backfill_unspent_outputs(database) -> int
+        - bootstrap(database, log) -> dict
+
+"""
+
+INDEXES = {
+    blockdb.COLLECTION_NAME: [
+        IndexModel([("block_id", ASCENDING)], name="block_id_unique", unique=True),
+    ],
+    blockchaindb.COLLECTION_NAME: [
+        IndexModel([("block_number", ASCENDING)], name="block_number_unique", unique=True),
+        IndexModel([("block_id", ASCENDING)], name="block_id_unique", unique=True),
+    ],
+    blockchaindb.CONFIG_COLLECTION_NAME: [
+        IndexModel([("config", ASCENDING)], name="config_unique", unique=True),
+    ],
+    transactiondb.COLLECTION_NAME: [
+        IndexModel([("transaction_id", ASCENDING)], name="transaction_id_unique", unique=True),
+        IndexModel([("block_id", ASCENDING), ("received_at", ASCENDING)], name="free_received_at"),
+    ],
+    unspent_transactiondb.COLLECTION_NAME: [
+        IndexModel([("transaction_id", ASCENDING), ("output_index", ASCENDING)],
+                   name="outpoint_unique", unique=True),
+        IndexModel([("spend_block", ASCENDING)], name="spend_block"),
+        IndexModel([("public_key", ASCENDING), ("spend_block", ASCENDING)], name="public_key_unspent"),
+        IndexModel([("block_id", ASCENDING)], name="block_id"),
+    ],
+    addressdb.COLLECTION_NAME: [
+        IndexModel([("public_key", ASCENDING), ("transaction_id", ASCENDING)],
+                   name="address_transaction_unique", unique=True),
+        IndexModel([("public_key", ASCENDING), ("_id", ASCENDING)], name="public_key_history"),
+        IndexModel([("block_id", ASCENDING)], name="block_id"),
+    ],
+}
+
+
+def _key(index_document: dict) -> tuple:
+    key = index_document["key"]
+    items = key.items() if isinstance(key, dict) else key
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                 for field, direction in items)
+
+
+def find_missing_indexes(database=None) -> dict:
+    """
+        Indexes of INDEXES whose key pattern is not on the collection yet
+    """
+    database = database if database is not None else get_backend()
+    missing = {}
+    for collection_name, indexes in INDEXES.items():
+        existing = {_key(info) for info in database.get_collection(collection_name).index_information().values()}
+        names = [index.document["name"] for index in indexes if _key(index.document) not in existing]
+        if names:
+            missing[collection_name] = names
+    return missing
+
+
+def _tracked_for(stat: dict, now: datetime) -> float:
+    # Seconds since $indexStats started counting the index, at its creation or the last server start
+    since = stat["accesses"]["since"]
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return (now - since).total_seconds()
+
+
+def find_unused_indexes(database=None, min_age: float = UNUSED_INDEX_MIN_AGE) -> dict:
+    """
+        Indexes no query used in the min_age seconds or more $indexStats has counted them
+        for, from $indexStats. Indexes counted for less, like the ones bootstrap just
+        created, are left out, as is the _id index.
+    """
+    database = database if database is not None else get_backend()
+    now = datetime.now(timezone.utc)
+    unused = {}
+    for collection_name in INDEXES:
+        try:
+            stats = database.get_collection(collection_name).aggregate([{"$indexStats": {}}])
+            names = [stat["name"] for stat in stats
+                     if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0 and _tracked_for(stat, now) >= min_age]
+        except Exception:
+            # $indexStats needs MongoDB 3.2 and the indexStats privilege, the embedded backend has no aggregate()
+            continue
+        if names:
+            unused[collection_name] = names
+    return unused
+
+
+def ensure_indexes(database=None) -> dict:
+    """
+        Creates every missing index of INDEXES
+
+        Returns:
+            {
+                created: {collection: [index_name]},
+                failed: {collection: str},       // e.g. duplicates blocking a unique index
+            }
+    """
+    database = database if database is not None else get_backend()
+    missing = find_missing_indexes(database)
+    report = {"created": {}, "failed": {}}
+    for collection_name, names in missing.items():
+        indexes = [index for index in INDEXES[collection_name] if index.document["name"] in names]
+        try:
+            database.get_collection(collection_name).create_indexes(indexes)
+            report["created"][collection_name] = names
+        except Exception as e:
+            report["failed"][collection_name] = str(e)
+    return report
+
+
+BACKFILL_CONFIG = {"config": "unspent_outputs_backfill"}
+
+
+def backfill_unspent_outputs(database=None) -> int:
+    """
+        Copies public_key, value and block_id from their transactions onto unspent outputs
+        written before those fields were recorded, once. Returns the number of outputs updated.
+    """
+    database = database if database is not None else get_backend()
+    config_collection = database.get_collection(blockchaindb.CONFIG_COLLECTION_NAME)
+    if config_collection.find_one(BACKFILL_CONFIG) is not None:
+        return 0
+
+    missing = list(database.get_collection(unspent_transactiondb.COLLECTION_NAME).find(
+        {"$or": [{"public_key": {"$exists": False}}, {"value": {"$exists": False}},
+                 {"block_id": {"$exists": False}}]},
+        {"_id": 0, "transaction_id": 1, "output_index": 1}
+    ))
+    transactions = {
+        document["transaction_id"]: document
+        for document in database.get_collection(transactiondb.COLLECTION_NAME).find(
+            {"transaction_id": {"$in": list({output["transaction_id"] for output in missing})}},
+            {"_id": 0, "transaction_id": 1, "block_id": 1, "outputs": 1}
+        )
+    }
+
+    batch = WriteBatch()
+    for output in missing:
+        transaction = transactions.get(output["transaction_id"])
+        if transaction is None:
+            continue
+        for transaction_output in transaction.get("outputs") or []:
+            if transaction_output.get("index") == output["output_index"]:
+                batch.add(unspent_transactiondb.COLLECTION_NAME, UpdateOne(
+                    {"transaction_id": output["transaction_id"], "output_index": output["output_index"]},
+                    {"$set": {"public_key": transaction_output.get("public_key"),
+                              "value": transaction_output.get("value"),
+                              "block_id": transaction.get("block_id")}}
+                ))
+                break
+    updated = len(batch)
+    batch.add(blockchaindb.CONFIG_COLLECTION_NAME, UpdateOne(BACKFILL_CONFIG, {"$set": BACKFILL_CONFIG}, upsert=True))
+    batch.commit()
+    return updated
+
+
+def bootstrap(database=None, log=print) -> dict:
+    """
+        Runs ensure_indexes() and backfill_unspent_outputs(), then logs what was created,
+        what failed, what was backfilled and which indexes look unused
+    """
+    database = database if database is not None else get_backend()
+    report = ensure_indexes(database)
+    report["backfilled"] = backfill_unspent_outputs(database)
+    report["unused"] = find_unused_indexes(database)
+
+    for collection_name, names in report["created"].items():
+        log(f"Created indexes {', '.join(names)} on {collection_name}.")
+    for collection_name, error in report["failed"].items():
+        log(f"Could not create indexes on {collection_name}: {error}")
+    if report["backfilled"]:
+        log(f"Backfilled {report['backfilled']} unspent outputs.")
+    for collection_name, names in report["unused"].items():
+        log(f"Unused indexes on {collection_name}: {', '.join(names)}")
+    return report
@@ -0,0 +1,102 @@
+from .backend import get_backend
+
+"""
+
+    Backend agnostic writes
+
+        Write operations are plain objects that every backend understands, the mongodb
+        backend turns them into pymongo requests. A WriteBatch collects them per
+        collection and commit() hands the whole batch to the backend, which writes one
+        ordered bulk_write per collection and makes the batch atomic where it can,
+        see StorageBackend.write_batch().
+
+        Writes meant to be retried after a crash should be idempotent, i.e. upserts
+        and $set updates rather than plain inserts.
+
+        class WriteBatch
+        - add(collection_name: str, operation: Operation) -> None
+        - extend(collection_name: str, operations: list) -> None
+        - commit() -> bool
+
+"""
+
+
+class Operation:
+
+    __slots__ = ("query", "document", "upsert")
+
+    kind = None
+
+    def __init__(self, query: dict = None, document: dict = None, upsert: bool = False):
+        self.query = query
+        self.document = document
+        self.upsert = upsert
+
+    def to_json(self) -> list:
+        return [self.kind, self.query, self.document, self.upsert]
+
+    def __repr__(self):
+        return f"{self.kind}({self.query}, {self.document}, upsert={self.upsert})"
+
+
+class InsertOne(Operation):
+
+    kind = "InsertOne"
+
+    def __init__(self, document: dict):
+        super().__init__(None, document)
+
+
+class UpdateOne(Operation):
+    kind = "UpdateOne"
+
+
+class UpdateMany(Operation):
+    kind = "UpdateMany"
+
+
+class DeleteOne(Operation):
+
+    kind = "DeleteOne"
+
+    def __init__(self, query: dict):
+        super().__init__(query)
+
+
+class DeleteMany(Operation):
+
+    kind = "DeleteMany"
+
+    def __init__(self, query: dict):
+        super().__init__(query)
+
+
+OPERATIONS = {operation.kind: operation for operation in (InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany)}
+
+
+def operation_from_json(data: list) -> Operation:
+    kind, query, document, upsert = data
+    operation = OPERATIONS[kind].__new__(OPERATIONS[kind])
+    Operation.__init__(operation, query, document, upsert)
+    return operation
+
+
+class WriteBatch:
+
+    def __init__(self):
+        self.operations = {}        # collection name -> [Operation], in write order
+
+    def add(self, collection_name: str, operation: Operation) -> None:
+        self.operations.setdefault(collection_name, []).append(operation)
+
+    def extend(self, collection_name: str, operations: list) -> None:
+        if operations:
+            self.operations.setdefault(collection_name, []).extend(operations)
+
+    def __len__(self) -> int:
+        return sum(len(operations) for operations in self.operations.values())
+
+    def commit(self) -> bool:
+        if not len(self):
+            return True
+        return get_backend().write_batch(self.operations)
@@ -0,0 +1,231 @@
+from copy import deepcopy
+
+"""
+
+    Query helpers of the embedded backend
+
+        The subset of MongoDB query, projection and update documents the models use,
+        evaluated against plain dict documents.
+
+        Filters:      {field: value}, dotted paths, $in, $nin, $ne, $exists, $lt, $lte, $gt, $gte
+        Projections:  inclusion or exclusion of (dotted) fields, _id included unless excluded
+        Updates:      $set, $unset, $inc, or a replacement document
+
+        Methods
+        - matches(document: dict, query: dict) -> bool
+        - project(document: dict, projection: dict) -> dict
+        - apply_update(document: dict, update: dict) -> dict
+        - upsert_document(query: dict, update: dict) -> dict
+        - sort_documents(documents: list, sort: list) -> list
+
+"""
+
+_MISSING = object()
+
+
+def get_values(document, path: str) -> list:
+    """
+        Values found at a dotted path, arrays along the path are expanded
+    """
+    values = [document]
+    for key in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if key in value:
+                    found.append(value[key])
+            elif isinstance(value, list):
+                if key.isdigit() and int(key) < len(value):
+                    found.append(value[int(key)])
+                else:
+                    found.extend(item[key] for item in value if isinstance(item, dict) and key in item)
+        values = found
+    expanded = []
+    for value in values:
+        if isinstance(value, list):
+            expanded.extend(value)
+        expanded.append(value)
+    return expanded
+
+
+def _compare(value, other, operator) -> bool:
+    try:
+        return operator(value, other)
+    except TypeError:
+        return False
+
+
+_COMPARISONS = {
+    "$lt": lambda value, other: value < other,
+    "$lte": lambda value, other: value <= other,
+    "$gt": lambda value, other: value > other,
+    "$gte": lambda value, other: value >= other,
+}
+
+
+def _match_condition(values: list, condition) -> bool:
+    if not isinstance(condition, dict) or not any(key.startswith("$") for key in condition):
+        if condition is None:
+            return not values or None in values
+        return condition in values
+
+    for operator, operand in condition.items():
+        if operator == "$in":
+            if not any(_match_condition(values, item) for item in operand):
+                return False
+        elif operator == "$nin":
+            if any(_match_condition(values, item) for item in operand):
+                return False
+        elif operator == "$ne":
+            if _match_condition(values, operand):
+                return False
+        elif operator == "$eq":
+            if not _match_condition(values, operand):
+                return False
+        elif operator == "$exists":
+            if bool(values) != bool(operand):
+                return False
+        elif operator in _COMPARISONS:
+            if not any(value is not None and _compare(value, operand, _COMPARISONS[operator]) for value in values):
+                return False
+        else:
+            raise ValueError(f"Unsupported query operator {operator}")
+    return True
+
+
+def matches(document: dict, query: dict) -> bool:
+    if not query:
+        return True
+    for path, condition in query.items():
+        if path == "$and":
+            if not all(matches(document, sub_query) for sub_query in condition):
+                return False
+        elif path == "$or":
+            if not any(matches(document, sub_query) for sub_query in condition):
+                return False
+        elif not _match_condition(get_values(document, path), condition):
+            return False
+    return True
+
+
+def _path_tree(paths: list) -> dict:
+    tree = {}
+    for path in paths:
+        node = tree
+        keys = path.split(".")
+        for key in keys[:-1]:
+            child = node.get(key)
+            if child is True:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = True
+    return tree
+
+
+def _include(value, tree: dict):
+    if isinstance(value, list):
+        return [_include(item, tree) for item in value if isinstance(item, (dict, list))]
+    result = {}
+    for key, sub_tree in tree.items():
+        if key in value:
+            result[key] = deepcopy(value[key]) if sub_tree is True else _include(value[key], sub_tree)
+    return result
+
+
+def _exclude(value, tree: dict):
+    if isinstance(value, list):
+        return [_exclude(item, tree) if isinstance(item, dict) else deepcopy(item) for item in value]
+    result = {}
+    for key, item in value.items():
+        sub_tree = tree.get(key)
+        if sub_tree is True:
+            continue
+        result[key] = deepcopy(item) if sub_tree is None or not isinstance(item, (dict, list)) else \
+            _exclude(item, sub_tree)
+    return result
+
+
+def project(document: dict, projection: dict = None) -> dict:
+    if not projection:
+        return deepcopy(document)
+
+    include_id = projection.get("_id", 1)
+    fields = {path: flag for path, flag in projection.items() if path != "_id"}
+    if fields and any(fields.values()):
+        result = _include(document, _path_tree([path for path, flag in fields.items() if flag]))
+        if include_id and "_id" in document:
+            result["_id"] = document["_id"]
+        return result
+
+    excluded = list(fields)
+    if not include_id:
+        excluded.append("_id")
+    return _exclude(document, _path_tree(excluded))
+
+
+def _set_path(document: dict, path: str, value) -> None:
+    keys = path.split(".")
+    for key in keys[:-1]:
+        document = document.setdefault(key, {})
+    document[keys[-1]] = value
+
+
+def _unset_path(document: dict, path: str) -> None:
+    keys = path.split(".")
+    for key in keys[:-1]:
+        document = document.get(key)
+        if not isinstance(document, dict):
+            return
+    document.pop(keys[-1], None)
+
+
+def apply_update(document: dict, update: dict) -> dict:
+    """
+        Returns the updated copy of document
+    """
+    if not any(key.startswith("$") for key in update):
+        # Replacement document, only the _id is kept
+        replaced = deepcopy(update)
+        if "_id" in document:
+            replaced["_id"] = document["_id"]
+        return replaced
+
+    updated = deepcopy(document)
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if operator == "$set":
+                _set_path(updated, path, deepcopy(value))
+            elif operator == "$unset":
+                _unset_path(updated, path)
+            elif operator == "$inc":
+                current = get_values(updated, path)
+                _set_path(updated, path, (current[-1] if current else 0) + value)
+            else:
+                raise ValueError(f"Unsupported update operator {operator}")
+    return updated
+
+
+def upsert_document(query: dict, update: dict) -> dict:
+    """
+        Document inserted by an upsert that matched nothing, the equality fields of the query plus the update
+    """
+    document = {}
+    for path, condition in query.items():
+        if not path.startswith("$") and not (isinstance(condition, dict) and
+                                             any(key.startswith("$") for key in condition)):
+            _set_path(document, path, deepcopy(condition))
+    return apply_update(document, update)
+
+
+def sort_documents(documents: list, sort: list) -> list:
+    """
+        sort: [(path, 1 | -1)], None sorts before every other value as in MongoDB
+    """
+    for path, direction in reversed(sort):
+        def key(document, path=path):
+            values = get_values(document, path)
+            value = values[0] if values else None
+            return (value is not None, value if value is not None else 0)
+        documents = sorted(documents, key=key, reverse=direction < 0)
+    return documents
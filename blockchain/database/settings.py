@@ -1,2 +1,21 @@
 SERVER = "mongodb://localhost:27017"
 DATABASE_NAME = "BlockChain_DB"
+MAX_POOL_SIZE = 50                     # Sockets the shared client keeps open to the server
+MIN_POOL_SIZE = 0                      # Sockets kept open even when idle
+SERVER_SELECTION_TIMEOUT_MS = 30000    # Time an operation waits for a reachable server
+USE_TRANSACTIONS = True                # Connect blocks inside a multi-document transaction when the server allows it
+
+BACKEND = "mongodb"                    # "mongodb" or "embedded", see backend.py
+DATA_DIRECTORY = "data"                # Files of the embedded backend
+BLOCK_SEGMENT_SIZE = 64 * 1024 * 1024  # Bytes written to a block file before the next one is started
+JOURNAL_COMPACT_MIN = 10000            # Journal entries before an embedded collection may be compacted
+SYNC_WRITES = False                    # fsync embedded backend files after every write
+
+UNUSED_INDEX_MIN_AGE = 7 * 86400       # Seconds an index must be tracked by $indexStats before it is reported unused
+
+UNDO_BLOCKS = 100                      # Connected blocks whose UTXO undo data is kept in memory
+
+STORAGE_FORMATS = {                    # Collection name -> "document" or "compressed", see formats.py
+    "Block": "document",
+}
+COMPRESSION_LEVEL = 6                  # zlib level of the compressed format
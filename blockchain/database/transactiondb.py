@@ -1,7 +1,9 @@
-import pymongo
-from .settings import SERVER, DATABASE_NAME
+import time
+from .backend import get_collection
+from .operations import UpdateOne, UpdateMany
 
 COLLECTION_NAME = "Transaction"
+QUERY_CHUNK_SIZE = 1000        # ids per $in query
 
 transaction_format = """
 
@@ -17,6 +19,7 @@ Transaction Format
         question: Question,   // Random question
         signature: str,       // signature of hash of all above details
         transaction_id: str,  // hash of all above details
+        received_at: float,   // when it was stored as a free transaction, seconds from Unix Epoch
     }
 
 Input Format
@@ -52,25 +55,26 @@ Question Format
 class TransactionModel:
 
     def __init__(self):
-        client = pymongo.MongoClient(SERVER)
-        db = client.get_database(DATABASE_NAME)
-        self.collection = db.get_collection(COLLECTION_NAME)
+        self.collection = get_collection(COLLECTION_NAME)
 
     def add_free_transaction(self, transaction_document: dict) -> bool:
-        if not self.transaction_exists(transaction_id=transaction.transaction_id):
+        if not self.transaction_exists(transaction_id=transaction_document["transaction_id"]):
             document = transaction_document
             if "block_id" not in document.keys():
                 document["block_id"] = None
+            document["received_at"] = time.time()
             ack = self.collection.insert_one(document)
             return ack.acknowledged
         return False
 
     def add_chain_transaction(self, transaction_document: dict, block_id: str) -> bool:
-        free_transaction = self.get_transaction(transaction_document["transaction_id"])
-        if free_transaction is not None and free_transaction['block_id'] is None:
+        # Free transactions, including the ones of blocks detached by a reorg, are moved to the block.
+        # One already in a block is never moved, transaction_id stays unique.
+        if self.transaction_exists(transaction_document["transaction_id"]):
             ack = self.collection.update_one(
                 {
                     "transaction_id": transaction_document["transaction_id"],
+                    "block_id": None,
                 },
                 {
                     "$set": {
@@ -78,17 +82,94 @@ class TransactionModel:
                     } 
                 }
             )
-            return ack.acknowledged
+            return ack.acknowledged and ack.matched_count == 1
         else:
             document = transaction_document
             document['block_id'] = block_id
             ack = self.collection.insert_one(document)
             return ack.acknowledged
 
+    def chain_transaction_operations(self, transaction_documents: list, block_id: str) -> list:
+        """
+            Upserts storing the transactions as part of block_id, for a WriteBatch. Free
+            transactions are moved to the block, missing ones are inserted. A transaction
+            already in a block matches nothing, so its upsert fails the batch on transaction_id_unique.
+        """
+        return [
+            UpdateOne(
+                {"transaction_id": document["transaction_id"], "block_id": None},
+                {"$set": dict(document, block_id=block_id)},
+                upsert=True
+            ) for document in transaction_documents
+        ]
+
+    def disconnect_operations(self, block_ids: list) -> list:
+        """
+            Frees the transactions of detached blocks, for a WriteBatch
+        """
+        return [UpdateMany({"block_id": {"$in": list(block_ids)}},
+                           {"$set": {"block_id": None, "received_at": time.time()}})]
+
     def transaction_exists(self, transaction_id: str) -> bool:
-        transaction = self.collection.find_one({"transaction_id": transaction_id})
+        transaction = self.collection.find_one({"transaction_id": transaction_id}, {"_id": 0, "transaction_id": 1})
         return transaction is not None
 
+    def get_free_transaction_ids(self, limit: int) -> list:
+        """
+            Ids of at most limit free transactions, read with an id-only projection
+        """
+        cursor = self.collection.find({"block_id": None}, {"_id": 0, "transaction_id": 1}).limit(limit)
+        return [document["transaction_id"] for document in cursor]
+
+    def get_block_transaction_ids(self, block_ids: list, limit: int) -> list:
+        """
+            Ids of at most limit transactions of the given blocks, the blocks are read in the
+            given order, QUERY_CHUNK_SIZE blocks per query with an id-only projection
+        """
+        transaction_ids = []
+        for start in range(0, len(block_ids), QUERY_CHUNK_SIZE):
+            if len(transaction_ids) >= limit:
+                break
+            cursor = self.collection.find({"block_id": {"$in": block_ids[start:start + QUERY_CHUNK_SIZE]}},
+                                          {"_id": 0, "transaction_id": 1}).limit(limit - len(transaction_ids))
+            transaction_ids.extend(document["transaction_id"] for document in cursor)
+        return transaction_ids
+
     def get_transaction(self, transaction_id: str) -> dict:
         transaction = self.collection.find_one({"transaction_id": transaction_id}, {"_id": 0})
         return transaction
+
+    def get_transactions(self, transaction_ids: list) -> dict:
+        """
+            Fetches all given transactions with a single query, returns {transaction_id: document}
+        """
+        documents = self.collection.find({"transaction_id": {"$in": list(transaction_ids)}}, {"_id": 0})
+        return {document["transaction_id"]: document for document in documents}
+
+    def get_block_id(self, transaction_id: str) -> str:
+        """
+            Id of the block holding the transaction, None for free or unknown transactions
+        """
+        transaction = self.collection.find_one({"transaction_id": transaction_id}, {"_id": 0, "block_id": 1})
+        return transaction.get("block_id") if transaction is not None else None
+
+    def prune_free_transactions(self, max_age: float) -> dict:
+        """
+            Deletes free transactions received more than max_age seconds ago
+
+            Free transactions stored before received_at was recorded are stamped with
+            the current time, so they expire max_age after the first prune.
+
+            Returns:
+                {
+                    removed: int,
+                    stamped: int,
+                }
+        """
+        now = time.time()
+        stamped = self.collection.update_many(
+            {"block_id": None, "received_at": {"$exists": False}},
+            {"$set": {"received_at": now}}
+        )
+        removed = self.collection.delete_many({"block_id": None, "received_at": {"$lt": now - max_age}})
+        return {"removed": removed.deleted_count, "stamped": stamped.modified_count}
@@ -1,5 +1,6 @@
-import pymongo
-from .settings import SERVER, DATABASE_NAME
+from .backend import get_collection
+from .operations import WriteBatch, UpdateMany, DeleteMany
+from .utxo_set import UTXOSet
 
 COLLECTION_NAME = "Unspent_Transaction"
 
@@ -9,6 +10,9 @@ COLLECTION_NAME = "Unspent_Transaction"
             {
                 transaction_id: str,
                 output_index: int,
+                public_key: str,     // public_key of the output, the owner of the value
+                value: float,
+                block_id: str,       // block that created the output
                 spend_block: str,    // None if not spent yet
                 spend_transaction: str, 
             }
@@ -16,62 +20,134 @@ COLLECTION_NAME = "Unspent_Transaction"
 """
 
 
+UTXO_SET = UTXOSet()
+
+
 class UnspentTransactionModel:
 
     def __init__(self):
-        client = pymongo.MongoClient(SERVER)
-        db = client.get_database(DATABASE_NAME)
-        self.collection = db.get_collection(COLLECTION_NAME)
+        self.collection = get_collection(COLLECTION_NAME)
+        self.utxo_set = UTXO_SET
+
+    def load_utxo_set(self) -> int:
+        """
+            Loads the unspent outputs into memory, later lookups are answered from there
+        """
+        return self.utxo_set.load(self.collection)
 
     def add_chain_transaction(self, transaction, block_id: str) -> bool:
+        """
+            Spends the inputs and adds the outputs of transaction in the in-memory set,
+            the writes reach the collection on the next flush()
+        """
         inputs = transaction.inputs
         outputs = transaction.outputs
         transaction_id = transaction.transaction_id
 
         if inputs is not None:
             for i in inputs:
-                self.collection.update_one(
-                    {
-                        "transaction_id": i.transaction_id,
-                        "output_index": i.index,
-                    },
-                    {
-                        "$set": {
-                            "spend_block": block_id,
-                            "spend_transaction": transaction.transaction_id,
-                        }
-                    }
-                )
+                self.utxo_set.spend((i.transaction_id, i.index), block_id, transaction_id)
 
-        unspent_documents = [
-            {
-                "transaction_id": transaction_id,
-                "output_index": output.index,
-                "spend_block": None,
-                "spend_transaction": None,
-            } for output in outputs
-        ]
+        self.utxo_set.add_outputs(transaction_id, [(output.index, output.public_key, output.value)
+                                                   for output in outputs], block_id)
+        return True
+
+    def connect_block(self, transactions: list, block_id: str, batch: WriteBatch = None) -> bool:
+        """
+            Applies all transactions of a block and commits the changes with batch, which may
+            already hold the other writes of the block. If the commit fails the in-memory set
+            is rolled back.
+        """
+        for transaction in transactions:
+            self.add_chain_transaction(transaction, block_id)
+
+        batch = batch if batch is not None else WriteBatch()
+        batch.extend(COLLECTION_NAME, self.utxo_set.take_pending())
+        try:
+            return batch.commit()
+        except Exception:
+            self.utxo_set.disconnect_block(block_id, write=False)
+            raise
 
-        self.collection.insert_many(unspent_documents)
+    def flush(self) -> bool:
+        """
+            Writes the queued changes of the in-memory set in one batch
+        """
+        pending = self.utxo_set.take_pending()
+        batch = WriteBatch()
+        batch.extend(COLLECTION_NAME, pending)
+        try:
+            return batch.commit()
+        except Exception:
+            # Kept queued, so the next flush retries them in order
+            self.utxo_set.requeue(pending)
+            raise
 
     def free_block_transactions(self, block_id: str) -> bool:
         """
-            Removes all inputs of transactions used in a block from spent transactions list
+            Rolls back a detached block, its spent outputs are unspent again and the outputs it created are removed
         """
-        ack = self.collection.update_many(
-            {
-                'spend_block': block_id
-            },
-            {
-                'spend_block': None,
-                'spend_transaction': None,
-            }
-        )
+        return self.disconnect_blocks([block_id])
+
+    def disconnect_blocks(self, block_ids: list, batch: WriteBatch = None) -> bool:
+        """
+            Rolls back detached blocks, tip first, and commits the changes with batch, which may
+            already hold the other writes of the reorg. If the commit fails the in-memory set
+            is reloaded from the collection.
+        """
+        batch = batch if batch is not None else WriteBatch()
+        batch.extend(COLLECTION_NAME, self.disconnect_operations(block_ids))
+        try:
+            return batch.commit()
+        except Exception:
+            self.load_utxo_set()
+            raise
 
-        return ack.acknowledged
+    def disconnect_operations(self, block_ids: list) -> list:
+        """
+            Rolls back detached blocks, tip first, in the in-memory set and returns the writes,
+            the caller reloads the set with load_utxo_set() if their commit fails
+        """
+        operations = []
+        for block_id in block_ids:
+            if self.utxo_set.disconnect_block(block_id):
+                operations.extend(self.utxo_set.take_pending())
+            else:
+                operations.extend(self._disconnect_without_undo(block_id))
+        return operations
+
+    def _disconnect_without_undo(self, block_id: str) -> list:
+        # No undo data kept for the block, find what it spent and created in the collection
+        if self.utxo_set.loaded:
+            projection = {"_id": 0, "transaction_id": 1, "output_index": 1}
+            spent = [(document["transaction_id"], document["output_index"])
+                     for document in self.collection.find({'spend_block': block_id}, projection)]
+            created = [(document["transaction_id"], document["output_index"])
+                       for document in self.collection.find({'block_id': block_id}, projection)]
+            # Outputs created and spent inside the block are restored, then discarded again
+            self.utxo_set.restore(spent)
+            self.utxo_set.discard(created)
+
+        return [
+            UpdateMany(
+                {
+                    'spend_block': block_id
+                },
+                {
+                    '$set': {
+                        'spend_block': None,
+                        'spend_transaction': None,
+                    }
+                }
+            ),
+            DeleteMany({'block_id': block_id}),
+        ]
 
 
     def is_unspent(self, transaction_input):
+        if self.utxo_set.loaded:
+            return self.utxo_set.is_unspent((transaction_input.transaction_id, transaction_input.index))
+
         queryset = self.collection.find_one(
             {
                 "transaction_id": transaction_input.transaction_id,
@@ -80,4 +156,21 @@ class UnspentTransactionModel:
                 "spend_transaction": None,
             }
         )
-        return queryset.count()
+        return queryset is not None
+
+    def get_unspent_outputs(self, transaction_ids: list) -> set:
+        """
+            Unspent outputs of all given transactions with a single query, returns {(transaction_id, output_index)}
+        """
+        if self.utxo_set.loaded:
+            return self.utxo_set.get_unspent(transaction_ids)
+
+        documents = self.collection.find(
+            {
+                "transaction_id": {"$in": list(transaction_ids)},
+                "spend_block": None,
+                "spend_transaction": None,
+            },
+            {"_id": 0, "transaction_id": 1, "output_index": 1}
+        )
+        return {(document["transaction_id"], document["output_index"]) for document in documents}
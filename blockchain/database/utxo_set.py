@@ -0,0 +1,183 @@
+from threading import RLock
+from collections import OrderedDict
+from .operations import UpdateOne, UpdateMany, DeleteMany
+from .settings import UNDO_BLOCKS
+
+"""
+
+    class UTXOSet
+
+        In process copy of the unspent outputs in Unspent_Transaction, keyed by
+        (transaction_id, output_index). Spends and new outputs update the set right
+        away and are queued as writes, which take_pending() hands to a WriteBatch once
+        per block. Every connected block keeps undo data,
+        so disconnecting one of the last UNDO_BLOCKS blocks needs no collection scan.
+
+        - loaded: bool
+        - unspent: {transaction_id: {output_index}}
+        - undo: {block_id: BlockUndo}
+
+        Methods
+        - load(collection) -> int
+        - is_unspent(outpoint: tuple) -> bool
+        - get_unspent(transaction_ids: list) -> set
+        - spend(outpoint: tuple, block_id: str, transaction_id: str) -> None
+        - add_outputs(transaction_id: str, outputs: list, block_id: str) -> None
+        - disconnect_block(block_id: str, write: bool) -> bool
+        - restore(outpoints: list) -> None
+        - discard(outpoints: list) -> None
+        - take_pending() -> [Operation]
+        - requeue(operations: list) -> None
+
+"""
+
+
+class BlockUndo:
+
+    __slots__ = ("spent", "created")
+
+    def __init__(self):
+        self.spent = []        # outpoints spent by the block
+        self.created = []      # outpoints created by the block
+
+
+class UTXOSet:
+
+    def __init__(self):
+        self.loaded = False
+        self.unspent = {}
+        self.undo = OrderedDict()
+        self.pending = []
+        self._lock = RLock()
+
+    def load(self, collection) -> int:
+        """
+            Streams every unspent output of the collection into memory, returns the number loaded
+        """
+        with self._lock:
+            self.unspent = {}
+            count = 0
+            cursor = collection.find(
+                {"spend_block": None, "spend_transaction": None},
+                {"_id": 0, "transaction_id": 1, "output_index": 1}
+            )
+            for document in cursor:
+                self._add((document["transaction_id"], document["output_index"]))
+                count += 1
+            self.loaded = True
+            return count
+
+    def _add(self, outpoint: tuple) -> None:
+        self.unspent.setdefault(outpoint[0], set()).add(outpoint[1])
+
+    def _remove(self, outpoint: tuple) -> None:
+        indexes = self.unspent.get(outpoint[0])
+        if indexes is not None:
+            indexes.discard(outpoint[1])
+            if not indexes:
+                del self.unspent[outpoint[0]]
+
+    def _get_undo(self, block_id: str) -> BlockUndo:
+        block_undo = self.undo.get(block_id)
+        if block_undo is None:
+            block_undo = self.undo[block_id] = BlockUndo()
+            while len(self.undo) > UNDO_BLOCKS:
+                self.undo.popitem(last=False)
+        return block_undo
+
+    def is_unspent(self, outpoint: tuple) -> bool:
+        return outpoint[1] in self.unspent.get(outpoint[0], ())
+
+    def get_unspent(self, transaction_ids: list) -> set:
+        with self._lock:
+            return {
+                (transaction_id, index)
+                for transaction_id in transaction_ids
+                for index in self.unspent.get(transaction_id, ())
+            }
+
+    def spend(self, outpoint: tuple, block_id: str, transaction_id: str) -> None:
+        with self._lock:
+            self._remove(outpoint)
+            self._get_undo(block_id).spent.append(outpoint)
+            self.pending.append(UpdateOne(
+                {"transaction_id": outpoint[0], "output_index": outpoint[1]},
+                {"$set": {"spend_block": block_id, "spend_transaction": transaction_id}}
+            ))
+
+    def add_outputs(self, transaction_id: str, outputs: list, block_id: str) -> None:
+        """
+            outputs: [(output_index, public_key, value)]
+        """
+        with self._lock:
+            block_undo = self._get_undo(block_id)
+            for index, public_key, value in outputs:
+                outpoint = (transaction_id, index)
+                self._add(outpoint)
+                block_undo.created.append(outpoint)
+                # Upserted, so reconnecting a block freed without undo data does not duplicate its outputs.
+                # A spent output matches nothing, its upsert fails the batch on outpoint_unique.
+                self.pending.append(UpdateOne(
+                    {"transaction_id": transaction_id, "output_index": index, "spend_block": None},
+                    {"$set": {"public_key": public_key, "value": value, "block_id": block_id,
+                              "spend_block": None, "spend_transaction": None}},
+                    upsert=True
+                ))
+
+    def disconnect_block(self, block_id: str, write: bool = True) -> bool:
+        """
+            Rolls a connected block back from its undo data, False if no undo data is kept for it.
+            write=False only rolls back the memory, for a block whose writes never reached the collection.
+        """
+        with self._lock:
+            block_undo = self.undo.pop(block_id, None)
+            if block_undo is None:
+                return False
+
+            # Outputs created and spent inside the block are re-added, then removed again
+            for outpoint in block_undo.spent:
+                self._add(outpoint)
+            for outpoint in block_undo.created:
+                self._remove(outpoint)
+            if not write:
+                return True
+
+            self.pending.append(UpdateMany(
+                {"spend_block": block_id},
+                {"$set": {"spend_block": None, "spend_transaction": None}}
+            ))
+            created_transactions = list({transaction_id for transaction_id, _ in block_undo.created})
+            if created_transactions:
+                self.pending.append(DeleteMany({"transaction_id": {"$in": created_transactions}}))
+            return True
+
+    def restore(self, outpoints: list) -> None:
+        """
+            Marks outpoints unspent again, for blocks freed without undo data
+        """
+        with self._lock:
+            for outpoint in outpoints:
+                self._add(outpoint)
+
+    def discard(self, outpoints: list) -> None:
+        """
+            Forgets outpoints created by a block freed without undo data
+        """
+        with self._lock:
+            for outpoint in outpoints:
+                self._remove(outpoint)
+
+    def take_pending(self) -> list:
+        """
+            Removes and returns the queued writes, in order
+        """
+        with self._lock:
+            pending, self.pending = self.pending, []
+            return pending
+
+    def requeue(self, operations: list) -> None:
+        """
+            Puts writes that could not be sent back in front of the queue
+        """
+        with self._lock:
+            self.pending[:0] = operations
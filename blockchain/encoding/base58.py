@@ -2,56 +2,169 @@ from ecdsa import VerifyingKey as PublicKey, SECP256k1 as curve, SigningKey as P
 
 base58_string = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
 
+"""
 
-def encode(hex_string: str) -> str:
-    global base58_string
-    number = int(hex_string, 16)
-    encoded_string = ""
+Base58 Codec
 
-    while number > 0:
-        r = number % 58
-        encoded_string = base58_string[r] + encoded_string
-        number //= 58
+    encode_bytes(data: bytes) -> str         // raw bytes -> Base58
+    decode_bytes(encoded_string: str) -> bytes
+    encode(hex_string: str) -> str           // hex -> Base58
+    decode(encoded_string: str) -> str       // Base58 -> hex
+    encode_many(values: list) -> list        // bytes or hex items
+    decode_many(encoded_strings: list, raw: bool) -> list
+    matches_digest(digest: bytes, encoded_string: str) -> bool
 
-    return encoded_string
+    Every leading zero byte is written as a leading '1' and restored on decoding,
+    so encoding round trips for any input.
 
+"""
+
+BASE = 58
+ZERO_DIGIT = base58_string[0]
+
+# Reverse lookup table: ascii code -> digit value, -1 for characters outside the alphabet
+DECODE_TABLE = [-1] * 128
+for _value, _character in enumerate(base58_string):
+    DECODE_TABLE[ord(_character)] = _value
+
+# Digits are peeled off CHUNK_DIGITS at a time so the big integer is divided
+# once per chunk instead of once per digit
+CHUNK_DIGITS = 10
+CHUNK_BASE = BASE ** CHUNK_DIGITS
+
+
+def encode_bytes(data: bytes) -> str:
+    """
+        Bytes -> Base58 String
+    """
+    stripped = data.lstrip(b"\0")
+    leading_zeros = len(data) - len(stripped)
+    number = int.from_bytes(stripped, "big")
+
+    digits = []
+    while number:
+        number, chunk = divmod(number, CHUNK_BASE)
+        for _ in range(CHUNK_DIGITS):
+            chunk, r = divmod(chunk, BASE)
+            digits.append(base58_string[r])
+
+    # Chunks are fixed width, so the most significant one may carry padding zeros
+    while digits and digits[-1] == ZERO_DIGIT:
+        digits.pop()
+
+    digits.extend(ZERO_DIGIT * leading_zeros)
+    digits.reverse()
+    return "".join(digits)
+
+
+def decode_bytes(encoded_string: str) -> bytes:
+    """
+        Base58 String -> Bytes
+    """
+    stripped = encoded_string.lstrip(ZERO_DIGIT)
+    leading_zeros = len(encoded_string) - len(stripped)
 
-def decode(encoded_string: str) -> str:
-    global base58_string
-    n = len(encoded_string)
     number = 0
-    for i in range(n - 1, -1, -1):
-        number += base58_string.index(encoded_string[i]) * 58 ** (n - i - 1)
-    return hex(number)[2:]
+    for character in stripped:
+        code = ord(character)
+        value = DECODE_TABLE[code] if code < 128 else -1
+        if value < 0:
+            raise ValueError(f"Invalid Base58 character: {character!r}")
+        number = number * BASE + value
+
+    return b"\0" * leading_zeros + number.to_bytes((number.bit_length() + 7) // 8, "big")
+
+
+def encode(hex_string) -> str:
+    """
+        Hex String (or bytes) -> Base58 String
+    """
+    if isinstance(hex_string, (bytes, bytearray)):
+        return encode_bytes(bytes(hex_string))
+    if len(hex_string) % 2:
+        hex_string = "0" + hex_string
+    return encode_bytes(bytes.fromhex(hex_string))
+
+
+def decode(encoded_string: str) -> str:
+    """
+        Base58 String -> Hex String
+    """
+    return decode_bytes(encoded_string).hex()
+
+
+def encode_many(values: list) -> list:
+    """
+        Encodes a batch of bytes or hex strings
+
+        Parameters:
+            values: [bytes | str]
+
+        Returns:
+            [str]
+    """
+    return [encode(value) for value in values]
+
+
+def decode_many(encoded_strings: list, raw: bool = False) -> list:
+    """
+        Decodes a batch of Base58 strings
+
+        Parameters:
+            encoded_strings: [str]
+            raw: bool     // return bytes instead of hex strings
+
+        Returns:
+            [str] or [bytes]
+    """
+    if raw:
+        return [decode_bytes(encoded_string) for encoded_string in encoded_strings]
+    return [decode_bytes(encoded_string).hex() for encoded_string in encoded_strings]
+
+
+def matches_digest(digest: bytes, encoded_string: str) -> bool:
+    """
+        True if encoded_string is the digest, in the current or the legacy encoding
+
+        Parameters:
+            digest: bytes
+            encoded_string: str
+
+        Returns:
+            bool
+    """
+    if encode_bytes(digest) == encoded_string:
+        return True
+    # Legacy hashes were encoded from the integer value and carry no leading zeros
+    return digest[:1] == b"\0" and encode_bytes(digest.lstrip(b"\0")) == encoded_string
 
 
 def encode_public_key(public_key: PublicKey) -> str:
     """
         PublicKey -> Base58 String
     """
-    hex_key = public_key.to_string().hex()
-    return encode(hex_key)
+    return encode_bytes(public_key.to_string())
 
 
 def decode_public_key(public_key_string: str) -> PublicKey:
     """
         Base58 String -> PublicKey
     """
-    hex_key = bytes.fromhex(decode(public_key_string))
-    return PublicKey.from_string(hex_key, curve=curve)
+    # Keys encoded before leading zeros were preserved come back short, pad them to the curve size
+    key = decode_bytes(public_key_string).rjust(2 * curve.baselen, b"\0")
+    return PublicKey.from_string(key, curve=curve)
 
 
 def encode_private_key(private_key: PrivateKey) -> str:
     """
-        PublicKey -> Base58 String
+        PrivateKey -> Base58 String
     """
-    hex_key = private_key.to_string().hex()
-    return encode(hex_key)
+    return encode_bytes(private_key.to_string())
 
 
 def decode_private_key(private_key_string: str) -> PrivateKey:
     """
         Base58 String -> Private Key
     """
-    hex_key = bytes.fromhex(decode(private_key_string))
-    return PrivateKey.from_string(hex_key, curve=curve)
+    key = decode_bytes(private_key_string).rjust(curve.baselen, b"\0")
+    return PrivateKey.from_string(key, curve=curve)
@@ -0,0 +1,236 @@
+import struct
+from hashlib import sha256
+
+"""
+
+Canonical Encoding
+
+    Deterministic binary encoding used for hashing and signing. Every value is a
+    one byte tag followed by its payload, variable sized payloads are length
+    prefixed with a big endian uint32.
+
+        None      N
+        bool      T | F
+        int       I <len> <signed big endian bytes>     // integral floats are written as ints
+        float     D <ieee754 double>
+        str       S <len> <utf-8 bytes>
+        bytes     B <len> <bytes>
+        list      L <count> <value>...
+        dict      M <count> (<str key> <value>)...       // keys in sorted order
+
+    The typed writers below stream Input, Output, Question, Transaction and
+    SolvedTransaction with their fields in that same sorted order, so they emit
+    exactly the bytes the generic writer would for the object's json_data().
+    A Block commits to its transactions through their id digests instead of
+    their full encodings.
+
+"""
+
+_UINT32 = struct.Struct(">I")
+_DOUBLE = struct.Struct(">d")
+
+
+def _write_length(write, length: int) -> None:
+    write(_UINT32.pack(length))
+
+
+def _write_str(write, value: str) -> None:
+    data = value.encode("utf-8")
+    write(b"S")
+    _write_length(write, len(data))
+    write(data)
+
+
+def _write_int(write, value: int) -> None:
+    data = value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True)
+    write(b"I")
+    _write_length(write, len(data))
+    write(data)
+
+
+def _write_map_header(write, count: int) -> None:
+    write(b"M")
+    _write_length(write, count)
+
+
+def write_value(write, value) -> None:
+    """
+        Streams the canonical encoding of a json-like value into write (eg. hashlib's update)
+    """
+    if value is None:
+        write(b"N")
+    elif value is True:
+        write(b"T")
+    elif value is False:
+        write(b"F")
+    elif isinstance(value, int):
+        _write_int(write, value)
+    elif isinstance(value, float):
+        if value.is_integer():
+            _write_int(write, int(value))
+        else:
+            write(b"D")
+            write(_DOUBLE.pack(value))
+    elif isinstance(value, str):
+        _write_str(write, value)
+    elif isinstance(value, (bytes, bytearray)):
+        write(b"B")
+        _write_length(write, len(value))
+        write(bytes(value))
+    elif isinstance(value, (list, tuple)):
+        write(b"L")
+        _write_length(write, len(value))
+        for item in value:
+            write_value(write, item)
+    elif isinstance(value, dict):
+        _write_map_header(write, len(value))
+        for key in sorted(value):
+            _write_str(write, key)
+            write_value(write, value[key])
+    else:
+        raise TypeError(f"Cannot canonically encode {type(value).__name__}")
+
+
+def write_input(write, inp) -> None:
+    _write_map_header(write, 4)
+    _write_str(write, "index")
+    write_value(write, inp.index)
+    _write_str(write, "script_signature")
+    write_value(write, inp.script_signature)
+    _write_str(write, "transaction_id")
+    write_value(write, inp.transaction_id)
+    _write_str(write, "value")
+    write_value(write, inp.value)
+
+
+def write_output(write, output) -> None:
+    _write_map_header(write, 4)
+    _write_str(write, "index")
+    write_value(write, output.index)
+    _write_str(write, "public_key")
+    write_value(write, output.public_key)
+    _write_str(write, "script_public_signature")
+    write_value(write, output.script_public_signature)
+    _write_str(write, "value")
+    write_value(write, output.value)
+
+
+def write_question(write, question) -> None:
+    if question is None:
+        write(b"N")
+        return
+    _write_map_header(write, 3)
+    _write_str(write, "answer_hash")
+    write_value(write, question.answer_hash)
+    _write_str(write, "question")
+    write_value(write, question.question)
+    _write_str(write, "question_id")
+    write_value(write, question.question_id)
+
+
+def write_transaction(write, transaction, include_signature: bool = True, include_id: bool = True) -> None:
+    _write_map_header(write, 6 + include_signature + include_id)
+    _write_str(write, "description")
+    write_value(write, transaction.description)
+
+    _write_str(write, "inputs")
+    write(b"L")
+    _write_length(write, len(transaction.inputs))
+    for inp in transaction.inputs:
+        write_input(write, inp)
+
+    _write_str(write, "outputs")
+    write(b"L")
+    _write_length(write, len(transaction.outputs))
+    for output in transaction.outputs:
+        write_output(write, output)
+
+    _write_str(write, "public_key")
+    write_value(write, transaction.public_key)
+    _write_str(write, "question")
+    write_question(write, transaction.question)
+    if include_signature:
+        _write_str(write, "signature")
+        write_value(write, transaction.signature)
+    _write_str(write, "timestamp")
+    write_value(write, transaction.timestamp)
+    if include_id:
+        _write_str(write, "transaction_id")
+        write_value(write, transaction.transaction_id)
+
+
+def write_solved_transaction(write, solved) -> None:
+    _write_map_header(write, 2)
+    _write_str(write, "solution")
+    write_value(write, solved.solution)
+    _write_str(write, "transaction")
+    write_transaction(write, solved.transaction)
+
+
+def transaction_digest(transaction, include_signature: bool = True) -> bytes:
+    """
+        sha256 over the canonical transaction without its transaction_id
+
+            include_signature=True  -> digest behind the transaction_id
+            include_signature=False -> digest that gets signed
+    """
+    hash_fun = sha256()
+    write_transaction(hash_fun.update, transaction, include_signature=include_signature, include_id=False)
+    return hash_fun.digest()
+
+
+def block_digest(block, transaction_digest=transaction_digest,
+                 transaction_id=lambda transaction: transaction.transaction_id) -> bytes:
+    """
+        sha256 over the canonical block header, committing to every transaction through its id digest.
+        The reward transaction is not checked against its digest elsewhere, so its transaction_id is hashed too.
+    """
+    hash_fun = sha256()
+    write = hash_fun.update
+
+    _write_map_header(write, 6)
+    _write_str(write, "miner_public_key")
+    write_value(write, block.miner_public_key)
+    _write_str(write, "previous_block")
+    write_value(write, block.previous_block)
+
+    _write_str(write, "reward_transaction")
+    if block.reward_transaction is None:
+        write(b"N")
+    else:
+        _write_map_header(write, 2)
+        _write_str(write, "digest")
+        write_value(write, transaction_digest(block.reward_transaction))
+        _write_str(write, "transaction_id")
+        write_value(write, transaction_id(block.reward_transaction))
+
+    _write_str(write, "solved_transactions")
+    write(b"L")
+    _write_length(write, len(block.solved_transactions))
+    for solved in block.solved_transactions:
+        _write_map_header(write, 2)
+        _write_str(write, "solution")
+        write_value(write, solved.solution)
+        _write_str(write, "transaction")
+        write_value(write, transaction_digest(solved.transaction))
+
+    _write_str(write, "timestamp")
+    write_value(write, block.timestamp)
+    _write_str(write, "version")
+    write_value(write, block.version)
+    return hash_fun.digest()
+
+
+def document_digest(document) -> bytes:
+    """
+        sha256 over the canonical encoding of any json-like document
+    """
+    hash_fun = sha256()
+    write_value(hash_fun.update, document)
+    return hash_fun.digest()
+
+
+def encode_value(value) -> bytes:
+    parts = []
+    write_value(parts.append, value)
+    return b"".join(parts)
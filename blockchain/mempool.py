@@ -0,0 +1,277 @@
+import heapq
+import time
+from threading import RLock
+from .encoding import canonical
+from .settings import MEMPOOL_MAX_BYTES
+
+"""
+
+    class Mempool
+
+        Verified transactions waiting for their question to be solved.
+
+        - entries: {transaction_id: MempoolEntry}      // in arrival order
+        - spends: {(transaction_id, index): str}        // outpoint -> id of the pooled transaction spending it
+        - reserved: {(transaction_id, index): str}      // outpoints of solved transactions not in a block yet
+        - solved: {transaction_id: MempoolEntry}       // solved transactions holding reservations, in solve order
+        - max_bytes: int
+
+        A transaction spending an outpoint that a pooled or solved transaction
+        already spends is rejected, the first one seen wins. The pool holds at most
+        max_bytes of canonical encoded transactions, when full the lowest fee rate
+        entries are evicted first, as long as their fee rate is lower than the one of
+        the incoming transaction. Reservations are released once the solved
+        transaction is in a connected block, is double spent by one, or was solved
+        before the expire() cutoff.
+
+        Methods
+        - add(transaction: Transaction, received_at: float) -> bool
+        - get(transaction_id: str) -> Transaction
+        - holds(transaction_id: str) -> bool
+        - remove(transaction_id: str, reserve: bool) -> Transaction
+        - release(transaction_id: str) -> bool
+        - remove_for_block(transactions: [Transaction]) -> int
+        - expire(cutoff: float) -> [str]
+        - find_conflicts(transaction: Transaction) -> [str]
+        - has_conflict(transaction: Transaction) -> bool
+        - by_fee_rate(limit: int, solved: bool) -> [Transaction]
+        - stats() -> dict
+
+"""
+
+
+class MempoolEntry:
+
+    __slots__ = ("transaction", "size", "fee", "fee_rate", "received_at", "outpoints", "reserved_at")
+
+    def __init__(self, transaction, received_at: float):
+        self.transaction = transaction
+        self.size = len(canonical.encode_value(transaction.json_data()))
+        self.fee = transaction.get_total_input_value() - transaction.get_total_output_value()
+        self.fee_rate = self.fee / self.size         # fee per byte
+        self.received_at = received_at
+        self.outpoints = [(inp.transaction_id, inp.index) for inp in transaction.inputs]
+        self.reserved_at = None
+
+
+class Mempool:
+
+    def __init__(self, max_bytes: int = MEMPOOL_MAX_BYTES):
+        self.entries = {}
+        self.spends = {}
+        self.reserved = {}
+        self.solved = {}
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._by_fee_rate = []      # heap of (fee_rate, received_at, transaction_id), stale items skipped
+        self._lock = RLock()
+        self.counters = {
+            "added": 0,
+            "duplicates": 0,
+            "conflicts": 0,
+            "rejected_full": 0,
+            "evicted": 0,
+            "expired": 0,
+            "removed": 0,
+            "released": 0,
+        }
+
+    def __contains__(self, transaction_id: str) -> bool:
+        return transaction_id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, transaction_id: str):
+        entry = self.entries.get(transaction_id)
+        return entry.transaction if entry is not None else None
+
+    def holds(self, transaction_id: str) -> bool:
+        """
+            True if the transaction is pooled or solved and not in a block yet
+        """
+        return transaction_id in self.entries or transaction_id in self.solved
+
+    def find_conflicts(self, transaction) -> list:
+        """
+            Ids of the pooled or solved transactions spending an input of the transaction
+        """
+        conflicts = []
+        for inp in transaction.inputs:
+            outpoint = (inp.transaction_id, inp.index)
+            spender = self.spends.get(outpoint) or self.reserved.get(outpoint)
+            if spender is not None and spender != transaction.transaction_id and spender not in conflicts:
+                conflicts.append(spender)
+        return conflicts
+
+    def has_conflict(self, transaction) -> bool:
+        """
+            True if the transaction double spends a pooled or solved transaction. Not counted,
+            only add() counts the conflicts it rejects.
+        """
+        return bool(self.find_conflicts(transaction))
+
+    def add(self, transaction, received_at: float = None) -> bool:
+        """
+            Pools a verified transaction. Returns False for a double spend of a pooled
+            or solved transaction, or if the pool is full of transactions paying a higher fee rate.
+            A transaction already pooled or solved is a duplicate and left where it is.
+        """
+        with self._lock:
+            if self.holds(transaction.transaction_id):
+                self.counters["duplicates"] += 1
+                return True
+            if self.has_conflict(transaction):
+                self.counters["conflicts"] += 1
+                return False
+
+            entry = MempoolEntry(transaction, received_at if received_at is not None else time.time())
+            if not self._make_room(entry):
+                self.counters["rejected_full"] += 1
+                return False
+
+            self.entries[transaction.transaction_id] = entry
+            for outpoint in entry.outpoints:
+                self.spends[outpoint] = transaction.transaction_id
+            self.bytes += entry.size
+            heapq.heappush(self._by_fee_rate, (entry.fee_rate, entry.received_at, transaction.transaction_id))
+            self.counters["added"] += 1
+            return True
+
+    def _make_room(self, entry: MempoolEntry) -> bool:
+        if entry.size > self.max_bytes:
+            return False
+        heap = self._by_fee_rate
+        popped = []
+        freed = 0
+        # Cheapest entries first, nothing is evicted unless enough room is found
+        while self.bytes - freed + entry.size > self.max_bytes:
+            item = heapq.heappop(heap)
+            if item[2] not in self.entries:
+                continue
+            if item[0] >= entry.fee_rate:
+                heapq.heappush(heap, item)
+                for popped_item in popped:
+                    heapq.heappush(heap, popped_item)
+                return False
+            popped.append(item)
+            freed += self.entries[item[2]].size
+
+        for _, _, transaction_id in popped:
+            self._remove(transaction_id)
+            self.counters["evicted"] += 1
+        return True
+
+    def _remove(self, transaction_id: str, reserve: bool = False):
+        entry = self.entries.pop(transaction_id, None)
+        if entry is None:
+            return None
+        for outpoint in entry.outpoints:
+            if self.spends.get(outpoint) == transaction_id:
+                del self.spends[outpoint]
+                if reserve:
+                    self.reserved[outpoint] = transaction_id
+        if reserve:
+            entry.reserved_at = time.time()
+            self.solved[transaction_id] = entry
+        self.bytes -= entry.size
+        # Drop heap items of removed entries once they make up half of it
+        if len(self._by_fee_rate) > 2 * len(self.entries) + 16:
+            self._by_fee_rate = [item for item in self._by_fee_rate if item[2] in self.entries]
+            heapq.heapify(self._by_fee_rate)
+        return entry.transaction
+
+    def remove(self, transaction_id: str, reserve: bool = False):
+        """
+            Removes the transaction from the pool, returns it or None if it was not pooled
+
+            Parameters:
+                transaction_id: str
+                reserve: bool       // keep its outpoints spent until released, for solved transactions
+        """
+        with self._lock:
+            transaction = self._remove(transaction_id, reserve)
+            if transaction is not None:
+                self.counters["removed"] += 1
+            return transaction
+
+    def _release(self, transaction_id: str) -> bool:
+        entry = self.solved.pop(transaction_id, None)
+        if entry is None:
+            return False
+        for outpoint in entry.outpoints:
+            if self.reserved.get(outpoint) == transaction_id:
+                del self.reserved[outpoint]
+        self.counters["released"] += 1
+        return True
+
+    def release(self, transaction_id: str) -> bool:
+        """
+            Drops the reservations of a solved transaction, False if it holds none
+        """
+        with self._lock:
+            return self._release(transaction_id)
+
+    def remove_for_block(self, transactions: list) -> int:
+        """
+            Drops the transactions of a connected block, releases their reservations and the ones
+            of solved transactions it double spends, and removes every pooled transaction spending
+            the same outpoints. Returns the number of pooled transactions removed.
+        """
+        with self._lock:
+            removed = 0
+            for transaction in transactions:
+                if self._remove(transaction.transaction_id) is not None:
+                    removed += 1
+                self._release(transaction.transaction_id)
+                for conflict in self.find_conflicts(transaction):
+                    if self._remove(conflict) is not None:
+                        removed += 1
+                    self._release(conflict)
+            self.counters["removed"] += removed
+            return removed
+
+    def expire(self, cutoff: float) -> list:
+        """
+            Removes the transactions received before cutoff and releases the reservations
+            of transactions solved before it, returns their ids
+        """
+        with self._lock:
+            expired = []
+            # entries are in arrival order and solved in solve order, the oldest come first
+            for transaction_id, entry in self.entries.items():
+                if entry.received_at >= cutoff:
+                    break
+                expired.append(transaction_id)
+            for transaction_id in expired:
+                self._remove(transaction_id)
+            self.counters["expired"] += len(expired)
+
+            released = []
+            for transaction_id, entry in self.solved.items():
+                if entry.reserved_at >= cutoff:
+                    break
+                released.append(transaction_id)
+            for transaction_id in released:
+                self._release(transaction_id)
+            return expired + released
+
+    def by_fee_rate(self, limit: int = None, solved: bool = False) -> list:
+        """
+            Pooled transactions, or solved ones holding reservations, highest fee rate first
+        """
+        with self._lock:
+            pool = self.solved if solved else self.entries
+            entries = sorted(pool.values(), key=lambda entry: (-entry.fee_rate, entry.received_at))
+            return [entry.transaction for entry in entries[:limit]]
+
+    def stats(self) -> dict:
+        return dict(
+            self.counters,
+            count=len(self.entries),
+            bytes=self.bytes,
+            max_bytes=self.max_bytes,
+            spends=len(self.spends),
+            reserved=len(self.reserved),
+            solved=len(self.solved),
+        )
@@ -0,0 +1,54 @@
+import threading
+from .settings import FREE_TRANSACTION_TTL, PRUNE_INTERVAL
+
+"""
+
+    class TransactionPruner
+
+        Background thread calling BlockChain.prune_transactions() every PRUNE_INTERVAL
+        seconds, so unconfirmed transactions expire FREE_TRANSACTION_TTL seconds after
+        they were received.
+
+        - totals: {pool: int, removed: int, stamped: int}     // counts over every run
+        - last_report: dict
+
+        Methods
+        - run_once() -> dict
+        - start() -> None
+        - stop() -> None
+
+"""
+
+LOG = print
+
+
+class TransactionPruner(threading.Thread):
+
+    def __init__(self, blockchain, interval: float = PRUNE_INTERVAL, max_age: float = FREE_TRANSACTION_TTL):
+        super().__init__(name="TransactionPruner", daemon=True)
+        self.blockchain = blockchain
+        self.interval = interval
+        self.max_age = max_age
+        self.totals = {"pool": 0, "removed": 0, "stamped": 0}
+        self.last_report = None
+        self._stopped = threading.Event()
+
+    def run_once(self) -> dict:
+        report = self.blockchain.prune_transactions(self.max_age)
+        for key, count in report.items():
+            self.totals[key] = self.totals.get(key, 0) + count
+        self.last_report = report
+        if report["pool"] or report["removed"]:
+            LOG(f"Pruned {report['pool']} pool transactions and {report['removed']} stored free transactions.")
+        return report
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                LOG(e)
+            self._stopped.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stopped.set()
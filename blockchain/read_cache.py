@@ -0,0 +1,120 @@
+import time
+from copy import deepcopy
+from threading import Lock
+from .lru_cache import LRUCache
+
+"""
+
+    class ReadThroughCache
+
+        Caches what load(key) returns. A None result is remembered as a known missing
+        entry for missing_ttl seconds, so lookups of ids we don't have skip the
+        database too. Both kinds of entries are evicted least recently used first.
+        Values are copied in and out, so callers may modify what they get.
+
+        - found: LRUCache             // key -> value
+        - missing: LRUCache           // key -> time the missing entry expires
+        - missing_ttl: float
+
+        Methods
+        - get(key) -> value
+        - contains(key) -> bool
+        - put(key, value) -> None
+        - invalidate(key) -> None
+        - clear() -> None
+        - stats() -> dict
+
+"""
+
+
+class ReadThroughCache:
+
+    def __init__(self, load, maxsize: int, missing_maxsize: int, missing_ttl: float):
+        """
+            Parameters:
+                load: function(key) -> value | None     // the database read behind the cache
+                maxsize: int
+                missing_maxsize: int
+                missing_ttl: float                      // seconds a known missing entry is trusted
+        """
+        self.load = load
+        self.found = LRUCache(maxsize)
+        self.missing = LRUCache(missing_maxsize)
+        self.missing_ttl = missing_ttl
+        self.hits = 0
+        self.missing_hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._generation = 0        # bumped by every invalidation, a load racing one is not cached
+
+    def get(self, key):
+        """
+            Returns a copy of the cached value, None for a known missing key, else reads it with load()
+        """
+        with self._lock:
+            value = self.found.get(key)
+            if value is not None:
+                self.hits += 1
+            else:
+                expires = self.missing.get(key)
+                if expires is not None and expires > time.monotonic():
+                    self.missing_hits += 1
+                    return None
+                if expires is not None:
+                    self.missing.pop(key)
+                self.misses += 1
+                generation = self._generation
+        if value is not None:
+            return deepcopy(value)
+
+        value = self.load(key)
+        with self._lock:
+            if generation == self._generation:
+                if value is None:
+                    self.missing.put(key, time.monotonic() + self.missing_ttl)
+                else:
+                    self.found.put(key, deepcopy(value))
+        return value
+
+    def contains(self, key) -> bool:
+        """
+            True if a value is cached for the key, never reads the database
+        """
+        return key in self.found
+
+    def put(self, key, value) -> None:
+        value = deepcopy(value)
+        with self._lock:
+            self._generation += 1
+            self.missing.pop(key)
+            self.found.put(key, value)
+
+    def invalidate(self, key) -> None:
+        """
+            Forgets the key, the next get() reads it again
+        """
+        with self._lock:
+            self._generation += 1
+            self.found.pop(key)
+            self.missing.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self.found.clear()
+            self.missing.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, missing_hits, misses = self.hits, self.missing_hits, self.misses
+        lookups = hits + missing_hits + misses
+        return {
+            "size": len(self.found),
+            "maxsize": self.found.maxsize,
+            "missing_size": len(self.missing),
+            "hits": hits,
+            "missing_hits": missing_hits,
+            "misses": misses,
+            "evictions": self.found.evictions + self.missing.evictions,
+            "hit_rate": (hits + missing_hits) / lookups if lookups else 0.0,
+        }
@@ -1,2 +1,21 @@
 TRANSACTIONS_PER_BLOCK = 10
-VERSION = 1
\ No newline at end of file
+VERSION = 1
+LEGACY_HASH_VERSION = 1                # sha256 of str(document)
+HASH_VERSION = 2                       # sha256 of the canonical encoding (encoding/canonical.py)
+ACCEPT_LEGACY_HASHES = True            # Still accept ids and signatures made with LEGACY_HASH_VERSION
+
+FREE_TRANSACTION_TTL = 24 * 60 * 60    # Seconds a transaction may stay unconfirmed before it is pruned
+PRUNE_INTERVAL = 10 * 60               # Seconds between two runs of the background pruner
+
+DEFAULT_PAGE_SIZE = 20                 # Entries per page of the balance and history endpoints
+MAX_PAGE_SIZE = 100
+
+BLOCK_CACHE_SIZE = 256                 # Block documents kept by the read cache of BlockChain
+TRANSACTION_CACHE_SIZE = 4096          # Transaction documents kept by the read cache of BlockChain
+MISSING_CACHE_SIZE = 4096              # Known missing ids kept per read cache
+MISSING_TTL = 30                       # Seconds an id found missing is not looked up again
+
+SEEN_FILTER_CAPACITY = 100000          # Ids per generation of the gossip "already seen" filters
+SEEN_FILTER_FP_RATE = 0.001            # False positive rate of the seen filters, positives are checked exactly
+
+MEMPOOL_MAX_BYTES = 32 * 1024 * 1024   # Canonical encoded bytes of transactions the pool holds before evicting
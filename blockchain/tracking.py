@@ -0,0 +1,53 @@
+from itertools import count
+
+"""
+
+    class Tracked
+
+        Stamps the object with a fresh process wide revision number every time one of
+        its public attributes is assigned. Containers compare the revisions of
+        their parts to find out whether a memoized hash is still valid.
+
+        - _revision: int
+        - _untracked: tuple     // public attributes whose assignment keeps the revision
+
+"""
+
+_revisions = count(1)
+
+
+class Tracked:
+
+    _revision = 0
+    _untracked = ()
+
+    def __setattr__(self, name: str, value) -> None:
+        object.__setattr__(self, name, value)
+        if name[0] != "_" and name not in self._untracked:
+            object.__setattr__(self, "_revision", next(_revisions))
+
+
+def revision_of(item) -> int:
+    return item._revision if item is not None else 0
+
+
+class DigestCache:
+    """
+        Memoized digests valid for a single state of the owning object
+    """
+
+    __slots__ = ("state", "values")
+
+    def __init__(self):
+        self.state = None
+        self.values = {}
+
+    def get(self, state, key, compute):
+        if state != self.state:
+            self.state = state
+            self.values = {}
+        try:
+            return self.values[key]
+        except KeyError:
+            value = self.values[key] = compute()
+            return value
@@ -1,4 +1,4 @@
-
+from ..tracking import Tracked
 
 """
 
@@ -14,7 +14,7 @@ Input Format
 """
 
 
-class Input:
+class Input(Tracked):
 
     def __init__(self, transaction_id: str = None, index: int = None, value: float = None,
                  script_signature: str = None):
@@ -37,6 +37,7 @@ class Input:
         self.index = input_document['index']
         self.value = input_document['value']
         self.script_signature = input_document['script_signature']
+        return self
 
     def __str__(self) -> str:
         return f"transaction_id: {self.transaction_id}, index: {self.index}, value: {self.value}, " + \
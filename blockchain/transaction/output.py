@@ -1,3 +1,5 @@
+from ..tracking import Tracked
+
 """
 
 Output Format
@@ -12,7 +14,7 @@ Output Format
 """
 
 
-class Output:
+class Output(Tracked):
 
     def __init__(self, index: int = None, value: float = None, script_public_signature: str = None,
                  public_key: str = None):
@@ -35,6 +37,7 @@ class Output:
         self.value = output_document['value']
         self.public_key = output_document['public_key']
         self.script_public_signature = output_document['script_public_signature']
+        return self
 
     def __str__(self):
         return f"index: {self.index}, value: {self.value}, public_key: {self.public_key}, script_public_signature: {self.script_public_signature} "
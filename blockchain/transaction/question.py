@@ -1,5 +1,6 @@
 import hashlib
 from ..encoding import base58
+from ..tracking import Tracked
 
 """
 
@@ -14,7 +15,7 @@ Question Format
 """
 
 
-class Question:
+class Question(Tracked):
 
     def __init__(self, question: str = None, question_id: str = None, answer_hash: str = None):
         self.question = question
@@ -24,8 +25,7 @@ class Question:
     def verify(self):
         sha2 = hashlib.sha256()
         sha2.update(self.question.encode("utf-8"))
-        q_id = sha2.hexdigest()
-        return base58.encode(q_id) == self.question_id
+        return base58.matches_digest(sha2.digest(), self.question_id)
 
     def from_json(self, question_document: dict):
         self.question = question_document["question"]
@@ -1,5 +1,12 @@
 import hashlib
-from ..encoding.base58 import encode, decode, decode_public_key
+from time import perf_counter
+from threading import Lock
+from ecdsa import BadSignatureError
+from ..encoding.base58 import encode_bytes, decode_bytes
+from ..address.key_cache import get_public_key
+from ..lru_cache import LRUCache
+from .settings import COMPILED_SCRIPT_CACHE_SIZE, MAX_SCRIPT_SIZE, MAX_SCRIPT_OPS, MAX_STACK_DEPTH, \
+    SCRIPT_INSTRUMENTATION
 
 """
 
@@ -14,62 +21,230 @@ Script Format
     For unlocking the LOCKING script is concatenated to the UNLOCKING script and verified
         " <signature> <pub_key> OP_DUP OP_HASH160 <pub_key_hash> OP_EQUALVERIFY OP_CHECKSIG "
 
+    Scripts are compiled once into a tuple of opcodes and ScriptData pushes. Compiled
+    locking scripts are kept in an LRU cache, and the standard pay to public key hash
+    template above is verified without running the interpreter.
+
+    Scripts over MAX_SCRIPT_SIZE characters or MAX_SCRIPT_OPS opcodes are rejected
+    before anything is hashed, and execution stops once the stack grows past
+    MAX_STACK_DEPTH. Opcode counts, timings and rejections are collected in
+    SCRIPT_STATS.
+
 """
 
+OP_DUP = "OP_DUP"
+OP_HASH160 = "OP_HASH160"
+OP_EQUALVERIFY = "OP_EQUALVERIFY"
+OP_CHECKSIG = "OP_CHECKSIG"
+OP_NOP = "OP_NOP"
+OP_EQUAL = "OP_EQUAL"
+OP_RIPEMD160 = "OP_RIPEMD160"
+OP_SHA256 = "OP_SHA256"
+OP_HASH256 = "OP_HASH256"
+P2PKH_FAST_PATH = "P2PKH_FAST_PATH"
+
+
+class ScriptError(Exception):
+    pass
+
+
+class ScriptLimitError(ScriptError):
+
+    def __init__(self, limit: str, value: int):
+        super().__init__(f"Script exceeds {limit} limit: {value}")
+        self.limit = limit
+        self.value = value
 
-class Script:
 
-    def __init__(self, script: str, transaction_id: str):
-        self.script = script
-        self.transaction_id = transaction_id
-        self.stack = []
+class ScriptStats:
+    """
+        Process wide counters of script verification
+
+        Methods
+        - record(op_counts: dict, op_seconds: dict) -> None
+        - reject(limit: str) -> None
+        - snapshot() -> dict
+        - reset() -> None
+    """
 
-    def verify_script(self) -> bool:
-        script_operations = self.script.split()
-        script_operations = [i.strip() for i in script_operations if i.strip() != ""]
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.scripts = 0
+            self.op_counts = {}
+            self.op_seconds = {}
+            self.rejected = {}
+
+    def record(self, op_counts: dict, op_seconds: dict) -> None:
+        with self._lock:
+            self.scripts += 1
+            for operation, count in op_counts.items():
+                self.op_counts[operation] = self.op_counts.get(operation, 0) + count
+            for operation, seconds in op_seconds.items():
+                self.op_seconds[operation] = self.op_seconds.get(operation, 0.0) + seconds
+
+    def reject(self, limit: str) -> None:
+        with self._lock:
+            self.rejected[limit] = self.rejected.get(limit, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            operations = {
+                operation: {
+                    "count": count,
+                    "seconds": self.op_seconds.get(operation, 0.0),
+                    "average": self.op_seconds.get(operation, 0.0) / count,
+                } for operation, count in self.op_counts.items()
+            }
+            return {
+                "scripts": self.scripts,
+                "operations": operations,
+                "rejected": dict(self.rejected),
+            }
+
+
+SCRIPT_STATS = ScriptStats()
+
+
+class ScriptData:
+    """
+        Data pushed by a script. Holds the raw bytes and the Base58 text, each
+        converted from the other only when first needed.
+
+        Legacy Base58 values were encoded without their leading zero bytes, so data
+        compares equal with leading zero bytes stripped.
+    """
+
+    __slots__ = ("_text", "_raw")
+
+    def __init__(self, text: str = None, raw: bytes = None):
+        self._text = text
+        self._raw = raw
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = encode_bytes(self._raw)
+        return self._text
+
+    @property
+    def raw(self) -> bytes:
+        if self._raw is None:
+            self._raw = decode_bytes(self._text)
+        return self._raw
+
+    @property
+    def normalized(self) -> bytes:
+        return self.raw.lstrip(b"\0")
 
-        try:
-            for operation in script_operations:
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ScriptData) and self.normalized == other.normalized
+
+    def __hash__(self) -> int:
+        return hash(self.normalized)
 
-                if operation == "OP_DUP":
-                    # Duplicate the topmost of stack
-                    self.stack.append(self.stack[-1])
 
-                elif operation == "OP_HASH160":
-                    # Hash the topmost with SHA_256 and then with RIPEMD160
-                    self.op_hash160()
+class CompiledScript:
+
+    __slots__ = ("operations", "op_count", "p2pkh_hash")
+
+    def __init__(self, operations: tuple):
+        self.operations = operations
+        self.op_count = sum(1 for operation in operations if not isinstance(operation, ScriptData))
+        self.p2pkh_hash = None
+
+        # OP_DUP OP_HASH160 <pub_key_hash> OP_EQUALVERIFY OP_CHECKSIG
+        if len(operations) == 5 and operations[0] == OP_DUP and operations[1] == OP_HASH160 and \
+                isinstance(operations[2], ScriptData) and operations[3] == OP_EQUALVERIFY and \
+                operations[4] == OP_CHECKSIG:
+            self.p2pkh_hash = operations[2]
+
+    def is_push_only(self) -> bool:
+        return all(isinstance(operation, ScriptData) for operation in self.operations)
+
+
+def compile_script(script: str) -> CompiledScript:
+    operations = []
+    for token in script.split():
+        if token in OPERATIONS:
+            operations.append(token)
+        else:
+            #  not an operation, it might be pubkey, signature, hash etc.
+            operations.append(ScriptData(text=token))
+    return CompiledScript(tuple(operations))
 
-                elif operation == "OP_EQUALVERIFY":
-                    # Take two top elements of stack and check if equal, if not equal throw error
-                    self.op_equalverify()
 
-                elif operation == "OP_CHECKSIG":
-                    # Take top two and check whether the signature is correct
-                    self.op_checksig()
+COMPILED_SCRIPT_CACHE = LRUCache(COMPILED_SCRIPT_CACHE_SIZE)
 
-                elif operation == "OP_NOP":
-                    # No operation
-                    continue
 
-                elif operation == "OP_EQUAL":
-                    # Equates top two stack elements and push the result to stack
-                    self.op_equal()
+def compile_locking_script(script: str) -> CompiledScript:
+    """
+        Compiles an output's locking script, reusing the cached compilation when there is one
+    """
+    compiled = COMPILED_SCRIPT_CACHE.get(script)
+    if compiled is None:
+        compiled = compile_script(script)
+        COMPILED_SCRIPT_CACHE.put(script, compiled)
+    return compiled
 
-                elif operation == "OP_RIPEMD160":
-                    # Hash the top element of stack using ripemd160
-                    self.op_ripemd160()
 
-                elif operation == "OP_SHA256":
-                    # Hash the top element of stack using sha256
-                    self.op_sha256()
+def hash160(data: bytes) -> bytes:
+    ripemd160 = hashlib.new('ripemd160')
+    ripemd160.update(hashlib.sha256(data).digest())
+    return ripemd160.digest()
 
-                elif operation == "OP_HASH256":
-                    # Hash the top element of stack using sha256 twice
-                    self.op_hash256()
 
-                else:
-                    #  not an operation, it might be pubkey, signature, hash etc.
-                    self.stack.append(operation)
+class Script:
+
+    def __init__(self, script: str, transaction_id: str, locking_script: str = None, signature_checks: list = None):
+        """
+            script: unlocking script, or the whole script when locking_script is None
+            signature_checks: when given, OP_CHECKSIG appends its (public_key, signature, message)
+                              here for a batched signature_verifier call instead of verifying it
+        """
+        self.script = script
+        self.transaction_id = transaction_id
+        self.locking_script = locking_script
+        self.signature_checks = signature_checks
+        self.stack = []
+
+    def verify_script(self) -> bool:
+        self.stack = []
+        self.op_counts = {}
+        self.op_seconds = {}
+        try:
+            script_size = len(self.script) + len(self.locking_script or "")
+            if script_size > MAX_SCRIPT_SIZE:
+                raise ScriptLimitError("size", script_size)
+
+            if self.locking_script is None:
+                unlocking, locking = compile_script(self.script), None
+            else:
+                unlocking, locking = compile_script(self.script), compile_locking_script(self.locking_script)
+
+            op_count = unlocking.op_count + (locking.op_count if locking is not None else 0)
+            if op_count > MAX_SCRIPT_OPS:
+                raise ScriptLimitError("ops", op_count)
+
+            if locking is not None and locking.p2pkh_hash is not None and len(unlocking.operations) == 2 and \
+                    unlocking.is_push_only():
+                start = perf_counter()
+                try:
+                    return self.verify_p2pkh(unlocking.operations[0], unlocking.operations[1], locking.p2pkh_hash)
+                finally:
+                    self.op_counts[P2PKH_FAST_PATH] = 1
+                    self.op_seconds[P2PKH_FAST_PATH] = perf_counter() - start
+
+            self.execute(unlocking)
+            if locking is not None:
+                self.execute(locking)
+
+        except ScriptLimitError as e:
+            SCRIPT_STATS.reject(e.limit)
+            return False
 
         except IndexError:
             return False
@@ -78,55 +253,77 @@ class Script:
             print(e)
             return False
 
+        finally:
+            if SCRIPT_INSTRUMENTATION:
+                SCRIPT_STATS.record(self.op_counts, self.op_seconds)
+
         if len(self.stack) == 1 and self.stack[0] is True:
             return True
         return False
 
-    def op_ripemd160(self):
-        val = self.stack.pop(-1)
+    def execute(self, compiled: CompiledScript) -> None:
+        stack = self.stack
+        op_counts = self.op_counts
+        op_seconds = self.op_seconds
+        for operation in compiled.operations:
+            if isinstance(operation, ScriptData):
+                stack.append(operation)
+            elif SCRIPT_INSTRUMENTATION:
+                start = perf_counter()
+                try:
+                    DISPATCH[operation](self)
+                finally:
+                    op_counts[operation] = op_counts.get(operation, 0) + 1
+                    op_seconds[operation] = op_seconds.get(operation, 0.0) + perf_counter() - start
+            else:
+                DISPATCH[operation](self)
+
+            if len(stack) > MAX_STACK_DEPTH:
+                raise ScriptLimitError("stack_depth", len(stack))
+
+    def verify_p2pkh(self, signature: ScriptData, public_key: ScriptData, public_key_hash: ScriptData) -> bool:
+        """
+            <signature> <pub_key> OP_DUP OP_HASH160 <pub_key_hash> OP_EQUALVERIFY OP_CHECKSIG without the interpreter
+        """
+        if hash160(public_key.raw).lstrip(b"\0") != public_key_hash.normalized:
+            return False
+        return self.check_signature(public_key, signature)
 
-        val = decode(val)
-        val_decoded = bytes.fromhex(val)
+    def check_signature(self, public_key: ScriptData, signature: ScriptData) -> bool:
+        if self.signature_checks is not None:
+            self.signature_checks.append((public_key.text, bytes.fromhex(signature.text),
+                                          decode_bytes(self.transaction_id)))
+            return True
+        try:
+            return get_public_key(public_key.text).verify(bytes.fromhex(signature.text),
+                                                          decode_bytes(self.transaction_id))
+        except BadSignatureError:
+            return False
 
-        ripemd160 = hashlib.new('ripemd160')
-        ripemd160.update(val_decoded)
-        ripemd_hash = ripemd160.hexdigest()
+    def op_dup(self):
+        # Duplicate the topmost of stack
+        self.stack.append(self.stack[-1])
 
-        out_decode = encode(ripemd_hash)
-        self.stack.append(out_decode)
+    def op_nop(self):
+        # No operation
+        pass
 
-    def op_sha256(self):
+    def op_ripemd160(self):
         val = self.stack.pop(-1)
+        ripemd160 = hashlib.new('ripemd160')
+        ripemd160.update(val.raw)
+        self.stack.append(ScriptData(raw=ripemd160.digest()))
 
-        val = decode(val)
-        val_decoded = bytes.fromhex(val)
-
-        sha256 = hashlib.sha256()
-        sha256.update(val_decoded)
-        sha256_hash = sha256.hexdigest()
-
-        out_decode = encode(sha256_hash)
-        self.stack.append(out_decode)
+    def op_sha256(self):
+        val = self.stack.pop(-1)
+        self.stack.append(ScriptData(raw=hashlib.sha256(val.raw).digest()))
 
     def op_hash160(self):
         """
-            op_hash160(val) = Base58_encode( RIPEMD160( SHA_256( Base58_decode( val ) ) ) )
+            op_hash160(val) = RIPEMD160( SHA_256( val ) )
         """
         val = self.stack.pop(-1)
-
-        val = decode(val)
-        val_decoded = bytes.fromhex(val)
-
-        sha256 = hashlib.sha256()
-        sha256.update(val_decoded)
-        sha256_hash = sha256.digest()
-
-        ripemd160 = hashlib.new('ripemd160')
-        ripemd160.update(sha256_hash)
-        ripemd_hash = ripemd160.hexdigest()
-
-        out_decode = encode(ripemd_hash)
-        self.stack.append(out_decode)
+        self.stack.append(ScriptData(raw=hash160(val.raw)))
 
     def op_equal(self):
         val1 = self.stack.pop(-1)
@@ -141,32 +338,36 @@ class Script:
         val2 = self.stack.pop(-1)
         if val1 == val2:
             return True
-        raise Exception("Script Verification Error")
+        raise ScriptError("Script Verification Error")
 
     def op_checksig(self):
         public_key = self.stack.pop(-1)
         signature = self.stack.pop(-1)
 
-        public_key = decode_public_key(public_key)
-        signature = bytes.fromhex(signature)
-        transaction_id = bytes.fromhex(self.transaction_id)
-
-        public_key.verify(signature, transaction_id)
+        if not self.check_signature(public_key, signature):
+            raise ScriptError("Script Verification Error")
         self.stack.append(True)
 
     def op_hash256(self):
         val = self.stack.pop(-1)
+        sha256_hash = hashlib.sha256(hashlib.sha256(val.raw).digest()).digest()
+        self.stack.append(ScriptData(raw=sha256_hash))
+
 
-        val = decode(val)
-        val_decoded = bytes.fromhex(val)
+DISPATCH = {
+    OP_DUP: Script.op_dup,
+    OP_HASH160: Script.op_hash160,
+    OP_EQUALVERIFY: Script.op_equalverify,
+    OP_CHECKSIG: Script.op_checksig,
+    OP_NOP: Script.op_nop,
+    OP_EQUAL: Script.op_equal,
+    OP_RIPEMD160: Script.op_ripemd160,
+    OP_SHA256: Script.op_sha256,
+    OP_HASH256: Script.op_hash256,
+}
 
-        sha256 = hashlib.sha256()
-        sha256.update(val_decoded)
-        sha256_hash = sha256.digest()
+OPERATIONS = frozenset(DISPATCH)
 
-        sha256 = hashlib.sha256()
-        sha256.update(sha256_hash)
-        sha256_hash = sha256.hexdigest()
 
-        out_encode = encode(sha256_hash)
-        self.stack.append(out_encode)
+def get_script_stats() -> dict:
+    return SCRIPT_STATS.snapshot()
@@ -0,0 +1,11 @@
+
+
+VERIFY_WORKERS = None                  # Processes used for signature verification, None uses every core
+PARALLEL_VERIFY_THRESHOLD = 16         # Smaller batches are verified in the calling thread
+COMPILED_SCRIPT_CACHE_SIZE = 8192      # Number of compiled locking scripts kept in memory
+VALIDATION_CACHE_SIZE = 50000          # Number of validated transactions remembered
+
+MAX_SCRIPT_SIZE = 10000                # Characters allowed in unlocking + locking script
+MAX_SCRIPT_OPS = 201                   # Opcodes (not counting data pushes) allowed in unlocking + locking script
+MAX_STACK_DEPTH = 1000                 # Items allowed on the script stack
+SCRIPT_INSTRUMENTATION = True          # Record per opcode counts and timings in script.SCRIPT_STATS
@@ -0,0 +1,94 @@
+import os
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from ecdsa import BadSignatureError
+from ..address.key_cache import get_public_key
+from .settings import VERIFY_WORKERS, PARALLEL_VERIFY_THRESHOLD
+
+"""
+
+Signature Check Format
+
+    (
+        public_key: str,     // Base58 encoded public key
+        signature: bytes,    // raw ecdsa signature
+        message: bytes,      // signed message
+    )
+
+    Methods
+    - verify_signature(public_key: str, signature: bytes, message: bytes) -> bool
+    - verify_batch(checks: [<Signature Check>]) -> [bool]
+    - shutdown_pool() -> None
+
+"""
+
+_pool = None
+_pool_lock = Lock()
+
+
+def verify_signature(public_key: str, signature: bytes, message: bytes) -> bool:
+    try:
+        return get_public_key(public_key).verify(signature, message)
+    except BadSignatureError:
+        return False
+    except Exception:
+        # Malformed keys or signatures are just invalid signatures
+        return False
+
+
+def _verify_chunk(checks: list) -> list:
+    return [verify_signature(*check) for check in checks]
+
+
+def _worker_count() -> int:
+    return VERIFY_WORKERS or os.cpu_count() or 1
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn keeps workers clear of the locks held by the server threads at fork time
+            _pool = ProcessPoolExecutor(max_workers=_worker_count(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def verify_batch(checks: list) -> list:
+    """
+        Verifies a batch of signature checks, spreading them across the process pool
+
+        Parameters:
+            checks: [(public_key, signature, message)]
+
+        Returns:
+            [bool]      // in the same order as checks
+    """
+    workers = _worker_count()
+    if workers == 1 or len(checks) < PARALLEL_VERIFY_THRESHOLD:
+        return _verify_chunk(checks)
+
+    # One chunk per worker keeps the pickling overhead to a message per process
+    chunk_size = -(-len(checks) // workers)
+    chunks = [checks[i: i + chunk_size] for i in range(0, len(checks), chunk_size)]
+
+    try:
+        results = list(_get_pool().map(_verify_chunk, chunks))
+    except Exception:
+        # Broken or unavailable pool, verify here instead of rejecting valid signatures
+        shutdown_pool()
+        return _verify_chunk(checks)
+
+    return [result for chunk in results for result in chunk]
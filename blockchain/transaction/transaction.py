@@ -1,12 +1,16 @@
 import hashlib
-from ecdsa import BadSignatureError
-from ..encoding import base58
+from ..encoding import base58, canonical
 from ..database.transactiondb import TransactionModel
 from .Input import Input
 from .output import Output
 from .script import Script
 from .question import Question
+from .settings import VALIDATION_CACHE_SIZE
+from ..lru_cache import LRUCache
+from . import signature_verifier
 from ..database.unspent_transactiondb import UnspentTransactionModel
+from ..settings import HASH_VERSION, LEGACY_HASH_VERSION, ACCEPT_LEGACY_HASHES
+from ..tracking import Tracked, DigestCache, revision_of
 
 """
 
@@ -38,43 +42,100 @@ Transaction Format
         - transaction_id: str
 
         - get_transaction(transaction_id: str) -> <Transaction>
+        - from_stored_json(transaction_document: dict) -> <Transaction>
+        - resolve_inputs(transactions: [<Transaction>]) -> <ResolvedInputs>  (@static)
         - add_free_transaction(transaction: Transaction) -> bool 
         - add_chain_transaction(transaction: Transaction, block_id: str) -> bool 
+        - get_state() -> tuple
+        - get_id_digest(version: int) -> bytes
+        - compute_transaction_id(version: int) -> str
         - find_transaction_id() -> str
+        - get_hash_version() -> int
         - get_total_input_value() -> float
         - get_total_output_value() -> float
-        - get_signing_message_hash() -> str
+        - get_signing_message_hash(version: int) -> str
+        - get_signing_digest(version: int) -> bytes
+        - get_signature_check() -> tuple
         - is_reward_transaction() -> bool
         - is_free_transaction() -> bool
         - is_chain_transaction() -> bool
         - verify_question() -> bool
-        - verify_inputs() -> bool
+        - verify_inputs(resolved: ResolvedInputs, check_scripts: bool, signature_checks: list) -> bool
         - verify_outputs() -> bool
         - verify_timestamp() -> bool             // to be done
         - verify_transaction_id() -> bool
         - verify_signature() -> bool
-        - verify() -> bool
+        - is_validated() -> bool
+        - mark_validated() -> None
+        - verify(check_signature: bool, resolved: ResolvedInputs) -> bool
         - json_data() -> dict
         - from_json() -> <Transaction>
 
 """
 
+# (transaction_id, signature) of transactions whose scripts and signature were verified
+VALIDATION_CACHE = LRUCache(VALIDATION_CACHE_SIZE)
 
-def verify_script(inp: Input, public_key: str) -> bool:
-    transaction = Transaction().get_transaction(inp.transaction_id)
+
+def verify_script(inp: Input, public_key: str, transaction=None, check_script: bool = True,
+                  signature_checks: list = None) -> bool:
+    """
+        transaction: the transaction spent by inp, fetched from the database when not given
+        check_script=False only matches inp against the spent output, for already validated transactions
+        signature_checks: collects the script's signature checks instead of verifying them
+    """
+    if transaction is None:
+        transaction = Transaction().get_transaction(inp.transaction_id)
+    if not 0 <= inp.index < len(transaction.outputs):
+        return False
     if not transaction.outputs[inp.index].value == inp.value or public_key != transaction.public_key:
         return False
+    if not check_script:
+        return True
 
-    locking_script = transaction.outputs[inp.index].script_publickey
-    script_string = inp.script_signature + " " + locking_script
-
-    script = Script(script_string, inp.transaction_id)
+    locking_script = transaction.outputs[inp.index].script_public_signature
+    script = Script(inp.script_signature, inp.transaction_id, locking_script, signature_checks)
     if script.verify_script():
         return True
     return False
 
 
-class Transaction:
+class ResolvedInputs:
+    """
+        Parent transactions and unspent outputs referenced by a batch of transactions,
+        fetched with one query per collection
+
+        Methods
+        - get_parent(transaction_id: str) -> Transaction
+        - is_unspent(inp: Input) -> bool
+    """
+
+    def __init__(self, transactions: list):
+        transaction_ids = {inp.transaction_id for transaction in transactions for inp in transaction.inputs}
+        self.parents = {}
+        if transaction_ids:
+            self.documents = TransactionModel().get_transactions(transaction_ids)
+            self.unspent = UnspentTransactionModel().get_unspent_outputs(transaction_ids)
+        else:
+            self.documents = {}
+            self.unspent = set()
+
+    def get_parent(self, transaction_id: str):
+        parent = self.parents.get(transaction_id)
+        if parent is None:
+            document = self.documents.get(transaction_id)
+            if document is None:
+                return None
+            parent = self.parents[transaction_id] = Transaction().from_stored_json(document)
+        return parent
+
+    def is_unspent(self, inp: Input) -> bool:
+        return (inp.transaction_id, inp.index) in self.unspent
+
+
+class Transaction(Tracked):
+
+    _untracked = ("transaction_id",)  # the id is derived from the rest, setting it keeps the memoized digests
 
     def __init__(self, public_key: str = None, inputs: list = None, outputs: list = None, timestamp: str = None,
                  transaction_id: str = None, signature: str = None, description: str = None, question: Question = None,
@@ -91,21 +152,35 @@ class Transaction:
         self.__metadata = {
             "block_id": block_id,  # block id is not None, if the transaction is added in the block chain
         }
+        self._digests = DigestCache()
 
     def get_transaction(self, transaction_id: str):
         """
             Fetches transaction from transaction database given transaction id
         """
         transaction_document = TransactionModel().get_transaction(transaction_id)
+        return self.from_stored_json(transaction_document)
+
+    def from_stored_json(self, transaction_document: dict):
+        """
+            from_json for documents read from the transaction database, which also carry the block_id
+        """
         self.from_json(transaction_document)
         self.__metadata['block_id'] = transaction_document['block_id']
         return self
 
+    @staticmethod
+    def resolve_inputs(transactions: list) -> ResolvedInputs:
+        """
+            Fetches everything the inputs of the given transactions refer to, for verify_inputs
+        """
+        return ResolvedInputs(transactions)
+
     def add_free_transaction(self) -> bool:
         """
             Inserts transaction as free transaction in database
         """
-        return TransactionModel().add_free_transaction(transaction=self.json_data())
+        return TransactionModel().add_free_transaction(self.json_data())
 
     def add_chain_transaction(self, block_id: str) -> bool:
         """
@@ -128,59 +203,101 @@ class Transaction:
             return False
         return True
 
-    def find_transaction_id(self) -> str:
+    def get_state(self) -> tuple:
+        """
+            Revisions of the transaction and all its parts, changes whenever any hashed field does
+        """
+        return (self._revision, tuple(i._revision for i in self.inputs),
+                tuple(o._revision for o in self.outputs), revision_of(self.question))
+
+    def get_id_digest(self, version: int = HASH_VERSION) -> bytes:
+        """
+            sha256 of the details of entire transaction, memoized until a field changes
+        """
+        return self._digests.get(self.get_state(), ("id", version), lambda: self._compute_digest(version, True))
+
+    def _compute_digest(self, version: int, include_signature: bool) -> bytes:
+        assert self.outputs is not None and self.timestamp is not None and self.description is not None
+        if version == LEGACY_HASH_VERSION:
+            document = self.json_data()
+            document.pop("transaction_id")
+            if not include_signature:
+                document.pop("signature")
+            return hashlib.sha256(str(document).encode('utf-8')).digest()
+        return canonical.transaction_digest(self, include_signature=include_signature)
+
+    def compute_transaction_id(self, version: int = HASH_VERSION) -> str:
         """
             base58 of sha256 hash of the details of entire transaction
         """
-        assert self.outputs is not None and self.timestamp is not None and self.signature is not None and \
-               self.description is not None and self.question is not None
-        document = self.json_data()
-        document.pop("transaction_id")
-        document_str = str(document)
+        assert self.signature is not None
+        return self._digests.get(self.get_state(), ("transaction_id", version), lambda: self._encode_id(version))
 
-        sha256 = hashlib.sha256()
-        sha256.update(document_str.encode('utf-8'))
-        transaction_id = sha256.hexdigest()
-        transaction_id = base58.encode(transaction_id)
+    def _encode_id(self, version: int) -> str:
+        digest = self.get_id_digest(version)
+        if version == LEGACY_HASH_VERSION:
+            # Legacy ids were encoded from the integer value and carry no leading zeros
+            return base58.encode_bytes(digest.lstrip(b"\0"))
+        return base58.encode_bytes(digest)
 
+    def find_transaction_id(self) -> str:
+        transaction_id = self.compute_transaction_id()
         self.transaction_id = transaction_id
         return transaction_id
 
-    def get_signing_message_hash(self) -> str:
-        document = self.json_data()
-        document.pop("signature")
-        document.pop("transaction_id")
-        document_str = str(document)
-
-        sha256 = hashlib.sha256()
-        sha256.update(document_str.encode('utf-8'))
-        message_hash = sha256.hexdigest()
-
-        return message_hash
+    def get_hash_version(self) -> int:
+        """
+            Hash version the transaction_id was made with, None if it matches none of the accepted ones
+        """
+        if self.compute_transaction_id(HASH_VERSION) == self.transaction_id:
+            return HASH_VERSION
+        if ACCEPT_LEGACY_HASHES and self.compute_transaction_id(LEGACY_HASH_VERSION) == self.transaction_id:
+            return LEGACY_HASH_VERSION
+        return None
 
-    def verify_signature(self) -> bool:
-        pubkey = base58.decode_public_key(self.public_key)
+    def get_signing_message_hash(self, version: int = HASH_VERSION) -> str:
+        return self.get_signing_digest(version).hex()
 
-        msg = self.get_signing_message_hash()
-        msg = bytes.fromhex(msg)
-        sign = bytes.fromhex(self.signature)
+    def get_signing_digest(self, version: int = HASH_VERSION) -> bytes:
+        """
+            sha256 of all details except signature and transaction_id, memoized until a field changes
+        """
+        return self._digests.get(self.get_state(), ("signing", version), lambda: self._compute_digest(version, False))
 
+    def get_signature_check(self) -> tuple:
+        """
+            (public_key, signature, message) tuple for the signature_verifier
+        """
+        # Transactions are signed with the same hash version as their id
+        version = self.get_hash_version() or HASH_VERSION
+        msg = self.get_signing_digest(version)
         try:
-            if pubkey.verify(sign, msg):
-                return True
-        except BadSignatureError:
-            pass
+            sign = bytes.fromhex(self.signature)
+        except (TypeError, ValueError):
+            sign = b""
+        return self.public_key, sign, msg
 
-        return False
+    def verify_signature(self) -> bool:
+        return signature_verifier.verify_signature(*self.get_signature_check())
 
-    def verify_inputs(self):
+    def verify_inputs(self, resolved: ResolvedInputs = None, check_scripts: bool = True, signature_checks: list = None):
+        """
+            resolved: inputs resolved for a whole batch, resolved for this transaction alone when not given
+            check_scripts=False skips running the input scripts, the spends are still checked
+            signature_checks: collects the scripts' signature checks instead of verifying them
+        """
         if self.is_reward_transaction():
             return True
 
+        if resolved is None:
+            resolved = ResolvedInputs([self])
+
         for inp in self.inputs:
-            if not UnspentTransactionModel().is_unspent(inp) or not Transaction().get_transaction(
-                    inp.transaction_id).is_chain_transaction() or \
-                    not verify_script(inp, self.public_key):
+            if not resolved.is_unspent(inp):
+                return False
+            parent = resolved.get_parent(inp.transaction_id)
+            if parent is None or not parent.is_chain_transaction() or \
+                    not verify_script(inp, self.public_key, parent, check_scripts, signature_checks):
                 return False
         return True
 
@@ -203,11 +320,34 @@ class Transaction:
         return True
 
     def verify_transaction_id(self):
-        return self.find_transaction_id() == self.transaction_id
+        return self.get_hash_version() is not None
+
+    def is_validated(self) -> bool:
+        """
+            True if this transaction_id and signature already passed the script and signature checks
+        """
+        return (self.transaction_id, self.signature) in VALIDATION_CACHE
+
+    def mark_validated(self) -> None:
+        VALIDATION_CACHE.put((self.transaction_id, self.signature), True)
+
+    def verify(self, check_signature: bool = True, resolved: ResolvedInputs = None) -> bool:
+        """
+            check_signature=False leaves the signature to a batched signature_verifier call,
+            which calls mark_validated() for the transactions that pass
+            resolved: inputs resolved for a whole batch with Transaction.resolve_inputs
+
+            Validated transactions skip their script and signature checks, everything
+            depending on the unspent outputs is checked again.
+        """
+        validated = self.is_validated()
+        valid = self.verify_inputs(resolved, check_scripts=not validated) and self.verify_outputs() and \
+            self.verify_question() and self.verify_timestamp() and \
+            (validated or not check_signature or self.verify_signature()) and self.verify_transaction_id()
 
-    def verify(self) -> bool:
-        return self.verify_inputs() and self.verify_outputs() and self.verify_question() and self.verify_timestamp() \
-            and self.verify_signature() and self.verify_transaction_id()
+        if valid and check_signature and not validated:
+            self.mark_validated()
+        return valid
 
     def get_total_input_value(self) -> float:
         total_input = 0
@@ -230,7 +370,7 @@ class Transaction:
             "timestamp": self.timestamp,
             "signature": self.signature,
             "transaction_id": self.transaction_id,
-            "question": self.question.json_data()
+            "question": self.question.json_data() if self.question is not None else None,
         }
         return document
 
@@ -242,7 +382,8 @@ class Transaction:
         self.transaction_id = transaction_document['transaction_id']
         self.inputs = [Input().from_json(doc) for doc in transaction_document['inputs']]
         self.outputs = [Output().from_json(doc) for doc in transaction_document['outputs']]
-        self.question = Question().from_json(transaction_document["question"])
+        question_document = transaction_document["question"]
+        self.question = Question().from_json(question_document) if question_document is not None else None
 
         return self
 
@@ -1,5 +1,7 @@
 import requests
 from blockchain.blockchain import BlockChain
+from blockchain.block.blockheader import BlockHeader
+from blockchain.block.merkle import verify_proof, transaction_leaf
 
 
 LOG = print
@@ -40,6 +42,61 @@ class BlockChain_Client:
         return None
 
 
+    def get_merkle_proof(self, transaction_id: str, ip_address: str) -> dict:
+
+        try:
+            address = f"http://{ ip_address }/get_merkle_proof"
+            req = requests.get(address, {"transaction_id": transaction_id})
+            if req.ok:
+                response = req.json()
+                if not response["error"]:
+                    return response["data"]
+
+        except Exception as e:
+            LOG(e)
+        return None
+
+
+    @staticmethod
+    def verify_merkle_proof(proof_data: dict, trusted_block_ids, transaction_id: str = None) -> bool:
+        """
+            Checks a /get_merkle_proof response. Block ids don't commit to the merkle root, so the
+            block id is rebuilt from the header's fields, solutions and transaction ids and must be
+            one we already trust, then the proof is checked against the root of those transactions.
+
+            Parameters:
+                proof_data: dict
+                trusted_block_ids: container of str     // eg. the block ids of our own chain
+                transaction_id: str
+        """
+        try:
+            if transaction_id is not None and proof_data["transaction_id"] != transaction_id:
+                return False
+            block_header = BlockHeader().from_json(proof_data["block_header"])
+            if block_header.block_id not in trusted_block_ids:
+                return False
+            if block_header.find_block_id() != block_header.block_id:
+                return False
+            return verify_proof(
+                transaction_leaf(proof_data["transaction_id"]),
+                proof_data["index"],
+                [bytes.fromhex(sibling) for sibling in proof_data["proof"]],
+                block_header.tree.root()
+            )
+
+        except (KeyError, TypeError, ValueError) as e:
+            LOG(e)
+        return False
+
+
+    def confirm_transaction(self, transaction_id: str, ip_address: str, trusted_block_ids) -> bool:
+        """
+            True if the node proves the transaction is in one of the trusted blocks, without downloading the block
+        """
+        proof_data = self.get_merkle_proof(transaction_id, ip_address)
+        return proof_data is not None and self.verify_merkle_proof(proof_data, trusted_block_ids, transaction_id)
+
+
     def send_transaction_invite(self, transaction_id: str, connected_nodes: list) -> None:
         for nodes in connected_nodes:
             address = f"http://{ node }/invite_for_transaction"
@@ -1,11 +1,13 @@
 
 from blockchain.blockchain import BlockChain
+from blockchain.pruner import TransactionPruner
 from blockchain_client import BlockChain_Client
-from blockchain.encoding.base58 import encode, decode_private_key
+from blockchain.encoding.base58 import encode, encode_bytes, decode_bytes, decode_private_key
+from blockchain.encoding import canonical
+from blockchain.settings import HASH_VERSION, LEGACY_HASH_VERSION, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 from flask import Flask, jsonify, request, render_template, url_for, redirect
 
-import random
 import hashlib
 
 LOG = print
@@ -13,8 +15,11 @@ LOG = print
 IP = None
 PORT = None
 CONNECTED_NODES = set([])
-BLOCKCHAIN = BlockChain()
-CLIENT = BlockChain_Client(IP, PORT)
+# Built by initialise_node(), importing this module has no side effects. Signature
+# verification workers are spawned processes that re-import main.py, and so this module.
+BLOCKCHAIN = None
+CLIENT = None
+PRUNER = None
 
 ACK_MSG = {
     "error": False,
@@ -34,10 +39,37 @@ def SEND_DATA(data: dict) -> dict:
         "data": data,
     }
 
+
+def PAGE_ARGS() -> tuple:
+    """
+        page and page_size of the request, clamped to page >= 1 and 1 <= page_size <= MAX_PAGE_SIZE.
+        Raises ValueError if one is not an integer.
+    """
+    page = int(request.args.get("page", 1))
+    page_size = int(request.args.get("page_size", DEFAULT_PAGE_SIZE))
+    return max(page, 1), min(max(page_size, 1), MAX_PAGE_SIZE)
+
+
 app = Flask(__name__)
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 
 
+def initialise_node() -> None:
+    """
+        Builds the node once, when the server starts or on the first request
+    """
+    global BLOCKCHAIN, CLIENT, PRUNER
+    if BLOCKCHAIN is None:
+        BLOCKCHAIN = BlockChain()
+        CLIENT = BlockChain_Client(IP, PORT)
+        PRUNER = TransactionPruner(BLOCKCHAIN)
+
+
+@app.before_request
+def before_request():
+    initialise_node()
+
+
 @app.errorhandler(500)
 def error_500(err):
     return jsonify(ERROR_MSG("INVALID_DATA")), 500
@@ -68,7 +100,7 @@ def invite_for_block():
     block_id = request.args.get("block_id")
     ip_address = request.args.get("ip_address")
     print(block_id, ip_address)
-    if BLOCKCHAIN.get_blockby_id(block_id) is None and block_id not in BLOCKCHAIN.block_pool.keys():
+    if not BLOCKCHAIN.has_block(block_id):
         block_data = CLIENT.get_invited_block(block_id, ip_address)
         if block_data is not None:
             BLOCKCHAIN.add_block_pool(block_data)
@@ -81,8 +113,7 @@ def invite_for_transaction():
     transaction_id = request.args.get("transaction_id")
     ip_address = request.args.get("ip_address")
     LOG(f"Invited for transaction {transaction_id} at {ip_address}.")
-    if BLOCKCHAIN.get_transaction(transaction_id) is None and transaction_id not in BLOCKCHAIN.transaction_pool.keys() and \
-         transaction_id not in BLOCKCHAIN.solved_transaction_pool.keys():
+    if not BLOCKCHAIN.has_transaction(transaction_id):
         transaction_data = CLIENT.get_invited_transaction(transaction_id, ip_address)
         if transaction_data is not None:
             BLOCKCHAIN.add_transaction_pool(transaction_data)
@@ -95,8 +126,8 @@ def get_transaction():
     transaction_id = request.args.get('transaction_id')
     transaction_data = BLOCKCHAIN.get_transaction(transaction_id)
     if transaction_data is None:
-        if transaction_id in BLOCKCHAIN.transaction_pool.keys():
-            transaction_data = BLOCKCHAIN.transaction_pool[transaction_id].json_data()
+        if transaction_id in BLOCKCHAIN.transaction_pool:
+            transaction_data = BLOCKCHAIN.transaction_pool.get(transaction_id).json_data()
         elif transaction_id in BLOCKCHAIN.solved_transaction_pool.keys():
             transaction_data = BLOCKCHAIN.solved_transaction_pool[transaction_id].transaction.json_data()
     if transaction_data is None:
@@ -107,7 +138,7 @@ def get_transaction():
 @app.route('/get_block')
 def get_block():
     block_id = request.args.get('block_id')
-    block_data = BLOCKCHAIN.get_block(block_id)
+    block_data = BLOCKCHAIN.get_blockby_id(block_id)
     if block_data is None and block_id in BLOCKCHAIN.block_pool.keys():
         block_data = BLOCKCHAIN.block_pool[block_id].json_data()
     if block_data is None:
@@ -115,6 +146,19 @@ def get_block():
     return jsonify(SEND_DATA(block_data))
 
 
+@app.route('/get_merkle_proof')
+def get_merkle_proof():
+    transaction_id = request.args.get('transaction_id')
+    try:
+        decode_bytes(transaction_id)
+    except (TypeError, ValueError, AttributeError):
+        return jsonify(ERROR_MSG("INVALID_TRANSACTION_ID")), 400
+    proof_data = BLOCKCHAIN.get_merkle_proof(transaction_id)
+    if proof_data is None:
+        return jsonify(ERROR_MSG("NO_SUCH_TRANSACTION"))
+    return jsonify(SEND_DATA(proof_data))
+
+
 @app.route('/get_block_by_number')
 def get_block_by_number():
     block_number = int(request.args.get('block_number'))
@@ -130,6 +174,16 @@ def get_last_block_number():
     return jsonify(SEND_DATA({'block_number': block_number}))
 
 
+@app.route('/get_cache_stats')
+def get_cache_stats():
+    return jsonify(SEND_DATA(BLOCKCHAIN.cache_stats()))
+
+
+@app.route('/get_mempool_stats')
+def get_mempool_stats():
+    return jsonify(SEND_DATA(BLOCKCHAIN.mempool_stats()))
+
+
 @app.route('/create_transaction', methods=["POST"])                     #   To be completed
 def create_transaction():
     transaction_data = request.get_json()
@@ -152,13 +206,21 @@ def create_address():
 def find_hash():
     """
         /find_hash => gives base58 of sha256 of given document
+
+        ?version=1 hashes str(document) the legacy way, otherwise the canonical
+        encoding is hashed, which for a transaction document without its
+        transaction_id gives the transaction id.
     """
     document = request.get_json()
-    document_data = str(document)
-    sha = hashlib.sha256()
-    sha.update(document_data.encode('utf-8'))
-    hash_str = sha.hexdigest()
-    hash_base58 = encode(hash_str)
+    version = int(request.args.get("version", HASH_VERSION))
+    if version == LEGACY_HASH_VERSION:
+        document_data = str(document)
+        sha = hashlib.sha256()
+        sha.update(document_data.encode('utf-8'))
+        # Legacy hashes were encoded from the integer value and carry no leading zeros
+        hash_base58 = encode_bytes(sha.digest().lstrip(b"\0"))
+    else:
+        hash_base58 = encode_bytes(canonical.document_digest(document))
     return jsonify(SEND_DATA({"hash": hash_base58}))
 
 
@@ -176,35 +238,39 @@ def get_signature():
     return jsonify(SEND_DATA({"sign": data}))
 
 
-@app.route("/get_client_transactions")                 # To be completed
+@app.route("/get_balance")
+def get_balance():
+    """
+        /get_balance?public_key=&page=&page_size= => balance and one page of unspent outputs
+    """
+    public_key = request.args.get("public_key")
+    if not public_key:
+        return jsonify(ERROR_MSG("NO_PUBLIC_KEY"))
+    try:
+        page, page_size = PAGE_ARGS()
+    except ValueError:
+        return jsonify(ERROR_MSG("INVALID_PAGE")), 400
+    return jsonify(SEND_DATA(BLOCKCHAIN.get_balance(public_key, page, page_size)))
+
+
+@app.route("/get_client_transactions")
 def get_client_transactions():
-    transaction = {
-        "transaction_id": "fgdjAGFUGu" + str(random.randrange(5000)),
-        "description": "Hello World",
-        "public_key": "dgyZGGuf",
-        "signature": "fgvujAGFU",
-        "timestamp": "17-01-2000 12:00:00",
-        "inputs": [
-            {
-                "previous_transaction": "gfkbgbghg",
-                "index": 0,
-                "value": random.randrange(0, 500),
-                "script": "OP_CHKSIG SIG",
-            }
-        ],
-        "outputs": [
-            {
-                "value": 4.5,
-                "script": "OP_CHKSIG",
-            },
-        ],
-    }
+    """
+        /get_client_transactions?public_key=&page=&page_size= => chain transactions of the public key, latest first
 
-    data = {
-        "transactions": [transaction],
-    }
-    return jsonify(data)
+        The transactions stay at the top level of the response, the frontend reads data.transactions
+    """
+    public_key = request.args.get("public_key")
+    if not public_key:
+        return jsonify({"transactions": [], "page": 1, "page_size": DEFAULT_PAGE_SIZE, "total": 0})
+    try:
+        page, page_size = PAGE_ARGS()
+    except ValueError:
+        return jsonify(ERROR_MSG("INVALID_PAGE")), 400
+    return jsonify(BLOCKCHAIN.get_client_transactions(public_key, page, page_size))
 
 
 def run_server():
+    initialise_node()
+    PRUNER.start()
     app.run(IP, PORT, debug=False)
@@ -0,0 +1,14 @@
+import pytest
+from blockchain.database import backend
+from blockchain.database.embedded import EmbeddedBackend
+
+
+@pytest.fixture
+def embedded(tmp_path, monkeypatch):
+    """
+        Embedded backend in a temporary directory, used by every model while the test runs
+    """
+    store = EmbeddedBackend(str(tmp_path))
+    monkeypatch.setattr(backend, "_backend", store)
+    yield store
+    store.close()
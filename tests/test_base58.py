@@ -0,0 +1,76 @@
+import hashlib
+import json
+import pytest
+from blockchain.block.solved_transaction import SolvedTransaction
+from blockchain.encoding.base58 import encode, encode_bytes, decode, decode_bytes
+from blockchain.settings import LEGACY_HASH_VERSION
+from blockchain.transaction.output import Output
+from blockchain.transaction.question import Question
+from blockchain.transaction.transaction import Transaction
+
+
+@pytest.mark.parametrize("data", [b"", b"\0", b"\0\0\1", b"\0\xff" * 8, bytes(32), bytes(range(32))])
+def test_leading_zero_bytes_round_trip(data):
+    encoded = encode_bytes(data)
+    assert encoded.startswith("1" * (len(data) - len(data.lstrip(b"\0"))))
+    assert decode_bytes(encoded) == data
+    assert encode(data.hex()) == encoded
+    assert decode(encoded) == data.hex()
+
+
+def test_invalid_character_is_rejected():
+    with pytest.raises(ValueError):
+        decode_bytes("0OIl")
+
+
+@pytest.fixture(scope="module")
+def zero_prefixed_transaction() -> Transaction:
+    """
+        A transaction whose legacy digest starts with a zero byte, which legacy ids drop
+    """
+    for number in range(100000):
+        transaction = Transaction(public_key="public_key", outputs=[Output(0, 1.0, "script")],
+                                  timestamp=str(number), description="description", signature="signature")
+        if transaction.get_id_digest(LEGACY_HASH_VERSION)[0] == 0:
+            return transaction
+
+
+def test_legacy_id_drops_leading_zeros(zero_prefixed_transaction):
+    digest = zero_prefixed_transaction.get_id_digest(LEGACY_HASH_VERSION)
+    transaction_id = zero_prefixed_transaction.compute_transaction_id(LEGACY_HASH_VERSION)
+    assert transaction_id == encode(digest.hex().lstrip("0"))
+    assert not transaction_id.startswith("1")
+
+
+def test_find_hash_matches_legacy_ids(embedded, zero_prefixed_transaction):
+    from blockchain_server import app
+
+    document = zero_prefixed_transaction.json_data()
+    document.pop("transaction_id")
+    # Sent as is, the test client's json= would sort the keys str(document) hashes
+    response = app.test_client().get(f"/find_hash?version={LEGACY_HASH_VERSION}", data=json.dumps(document),
+                                     content_type="application/json")
+    assert response.get_json()["data"]["hash"] == zero_prefixed_transaction.compute_transaction_id(LEGACY_HASH_VERSION)
+
+
+def _zero_prefixed(suffix: str) -> tuple:
+    """
+        A text and its sha256 digest starting with a zero byte, which legacy encodings drop
+    """
+    for number in range(100000):
+        digest = hashlib.sha256(f"{number}{suffix}".encode("utf-8")).digest()
+        if digest[0] == 0:
+            return str(number), digest
+
+
+@pytest.mark.parametrize("legacy", [True, False])
+def test_question_and_answer_match_zero_prefixed_digests(legacy):
+    question, question_digest = _zero_prefixed("")
+    encoded_question = Question(question, encode_bytes(question_digest.lstrip(b"\0") if legacy else question_digest))
+    answer, answer_digest = _zero_prefixed(encoded_question.question_id)
+    encoded_question.answer_hash = encode_bytes(answer_digest.lstrip(b"\0") if legacy else answer_digest)
+    assert encoded_question.verify()
+
+    transaction = Transaction(question=encoded_question)
+    assert SolvedTransaction(transaction, answer).verify_solution()
+    assert not SolvedTransaction(transaction, answer + "x").verify_solution()
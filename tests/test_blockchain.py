@@ -0,0 +1,60 @@
+import pytest
+from blockchain.block.block import Block
+from blockchain.blockchain import BlockChain
+from blockchain.database import blockchaindb, unspent_transactiondb
+from blockchain.database.blockchaindb import ChainIndex
+from blockchain.database.utxo_set import UTXOSet
+from blockchain.transaction.output import Output
+from blockchain.transaction.transaction import Transaction
+
+
+def _block(previous_block: str, timestamp: str) -> Block:
+    reward = Transaction(public_key="miner", outputs=[Output(0, 4, "script", "miner")], timestamp=timestamp,
+                         description="reward", signature="signature")
+    reward.find_transaction_id()
+    block = Block(previous_block=previous_block, timestamp=timestamp, reward_transaction=reward,
+                  miner_public_key="miner", version=1)
+    block.block_id = block.find_block_id()
+    block.add_block()
+    return block
+
+
+@pytest.fixture
+def chain(embedded, monkeypatch) -> BlockChain:
+    monkeypatch.setattr(blockchaindb, "CHAIN_INDEX", ChainIndex())
+    monkeypatch.setattr(unspent_transactiondb, "UTXO_SET", UTXOSet())
+    return BlockChain()
+
+
+def test_reorg_commits_with_the_new_block(chain, embedded, monkeypatch):
+    first = _block(None, "1")
+    detached = _block(first.block_id, "5")
+    assert chain.add_blockto_chain(first) and chain.add_blockto_chain(detached)
+
+    applied = []
+    write_batch = embedded.write_batch
+    monkeypatch.setattr(embedded, "write_batch", lambda operations: applied.append(operations) or write_batch(operations))
+    replacement = _block(first.block_id, "3")
+    assert chain.add_blockto_chain(replacement)
+
+    assert len(applied) == 1
+    assert chain.block_chain_model.chain.block_ids == [first.block_id, replacement.block_id]
+    assert chain.transaction_model.get_block_id(detached.reward_transaction.transaction_id) is None
+    assert chain.unspent_transaction_model.utxo_set.is_unspent((replacement.reward_transaction.transaction_id, 0))
+    assert not chain.unspent_transaction_model.utxo_set.is_unspent((detached.reward_transaction.transaction_id, 0))
+
+
+def test_failed_reorg_leaves_the_chain_as_it_was(chain, embedded, monkeypatch):
+    first = _block(None, "1")
+    detached = _block(first.block_id, "5")
+    chain.add_blockto_chain(first)
+    chain.add_blockto_chain(detached)
+
+    def failing_write_batch(operations):
+        raise OSError("disk full")
+    monkeypatch.setattr(embedded, "write_batch", failing_write_batch)
+    with pytest.raises(OSError):
+        chain.add_blockto_chain(_block(first.block_id, "3"))
+
+    assert chain.block_chain_model.chain.block_ids == [first.block_id, detached.block_id]
+    assert chain.unspent_transaction_model.utxo_set.is_unspent((detached.reward_transaction.transaction_id, 0))
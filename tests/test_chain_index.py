@@ -0,0 +1,26 @@
+import pytest
+from blockchain.database import blockchaindb
+from blockchain.database.blockchaindb import BlockChainModel, ChainIndex
+
+
+@pytest.fixture
+def model(embedded, monkeypatch) -> BlockChainModel:
+    monkeypatch.setattr(blockchaindb, "CHAIN_INDEX", ChainIndex())
+    model = BlockChainModel()
+    for block_id in ["block 1", "block 2", "block 3"]:
+        model.append(block_id)
+    return model
+
+
+def _reloaded(model) -> list:
+    chain = ChainIndex()
+    chain.load(model.collection)
+    return chain.block_ids
+
+
+def test_removeby_number_truncates_the_chain(model):
+    assert model.removeby_number(2)
+    assert model.chain.block_ids == ["block 1"] == _reloaded(model)
+    assert model.get_last_block_id() == "block 1"
+    assert model.config_collection.find_one({"config": "blockchain"})["last_block_number"] == 1
+    assert not model.removeby_number(5)
@@ -0,0 +1,89 @@
+import pytest
+from blockchain.database import blockdb
+from blockchain.database.blockdb import BlockModel, block_header, HEADER_PROJECTION
+from blockchain.database.formats import CompressedFormat, DocumentFormat, PAYLOAD_FIELD, get_format
+from blockchain.database.settings import STORAGE_FORMATS
+
+
+def _transaction(transaction_id: str) -> dict:
+    return {
+        "public_key": "ключ",                   # non ascii text survives the compact json
+        "inputs": [],
+        "outputs": [{"index": 0, "value": 0.1 + 0.2, "public_key": "owner", "script_public_signature": "script"}],
+        "description": "x" * 1000,
+        "timestamp": "1",
+        "signature": "signature",
+        "transaction_id": transaction_id,
+        "question": None,
+    }
+
+
+def _block(solved_count: int = 2) -> dict:
+    return {
+        "block_id": "block",
+        "version": 1,
+        "previous_block": None,
+        "timestamp": "1",
+        "miner_public_key": "miner",
+        "solved_transactions": [{"transaction": _transaction(f"solved {i}"), "solution": f"answer {i}"}
+                                for i in range(solved_count)],
+        "reward_transaction": _transaction("reward"),
+    }
+
+
+@pytest.mark.parametrize("document", [
+    _block(),
+    _block(solved_count=0),
+    dict(_block(), reward_transaction=None),
+    {key: value for key, value in _block().items() if key != "miner_public_key"},
+    {},
+])
+@pytest.mark.parametrize("level", [0, 1, 9])
+def test_round_trip(document, level):
+    compressed = CompressedFormat(block_header, level)
+    stored = compressed.encode(document)
+    assert set(stored) <= set(document) | {PAYLOAD_FIELD}
+    assert compressed.decode(stored) == document
+    # Either format reads what the other one wrote
+    assert DocumentFormat().decode(stored) == document
+    assert compressed.decode(DocumentFormat().encode(document)) == document
+
+
+def test_header_fields_stay_queryable_and_out_of_the_payload():
+    document = _block()
+    stored = CompressedFormat(block_header).encode(document)
+    assert {key: stored[key] for key in ("block_id", "version", "previous_block", "timestamp")} == \
+        {"block_id": "block", "version": 1, "previous_block": None, "timestamp": "1"}
+    assert stored["reward_transaction"] == {"transaction_id": "reward"}
+    assert len(stored[PAYLOAD_FIELD]) < len(str(document))
+
+
+def test_decode_leaves_none_and_plain_documents_alone():
+    compressed = CompressedFormat(block_header)
+    assert compressed.decode(None) is None
+    assert compressed.decode({"block_id": "block"}) == {"block_id": "block"}
+
+
+def test_unknown_format_is_rejected(monkeypatch):
+    monkeypatch.setitem(STORAGE_FORMATS, "Collection", "packed")
+    with pytest.raises(ValueError):
+        get_format("Collection", block_header)
+    monkeypatch.setitem(STORAGE_FORMATS, "Collection", "compressed")
+    assert isinstance(get_format("Collection"), DocumentFormat)          # no header function
+    assert isinstance(get_format("Collection", block_header), CompressedFormat)
+
+
+@pytest.mark.parametrize("stored_as", ["document", "compressed"])
+def test_blocks_read_back_from_either_format(embedded, monkeypatch, stored_as):
+    monkeypatch.setitem(STORAGE_FORMATS, blockdb.COLLECTION_NAME, stored_as)
+    document = _block()
+    BlockModel().add_block(dict(document))
+
+    monkeypatch.setitem(STORAGE_FORMATS, blockdb.COLLECTION_NAME, "compressed")
+    model = BlockModel()
+    assert model.get_block("block") == document
+    header = model.get_block_header("block")
+    assert header == model.collection.find_one({"block_id": "block"}, HEADER_PROJECTION)
+    assert header["reward_transaction"] == {"transaction_id": "reward"}
+    assert [solved["transaction"]["transaction_id"] for solved in header["solved_transactions"]] == \
+        ["solved 0", "solved 1"]
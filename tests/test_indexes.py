@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta, timezone
+from blockchain.database import indexes
+
+
+class FakeCollection:
+
+    def __init__(self, stats: list):
+        self.stats = stats
+
+    def aggregate(self, pipeline: list) -> list:
+        return self.stats
+
+
+class FakeDatabase:
+
+    def __init__(self, stats: list):
+        self.collection = FakeCollection(stats)
+
+    def get_collection(self, collection_name: str) -> FakeCollection:
+        return self.collection
+
+
+def _stat(name: str, ops: int, age: timedelta) -> dict:
+    # pymongo hands out naive UTC datetimes
+    return {"name": name, "accesses": {"ops": ops, "since": datetime.now(timezone.utc).replace(tzinfo=None) - age}}
+
+
+def test_fresh_indexes_are_not_reported_unused():
+    database = FakeDatabase([
+        _stat("_id_", 0, timedelta(days=30)),
+        _stat("old_unused", 0, timedelta(days=30)),
+        _stat("old_used", 5, timedelta(days=30)),
+        _stat("just_created", 0, timedelta(seconds=1)),
+    ])
+    unused = indexes.find_unused_indexes(database, min_age=timedelta(days=7).total_seconds())
+    assert set(unused) == set(indexes.INDEXES)
+    assert all(names == ["old_unused"] for names in unused.values())
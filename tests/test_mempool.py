@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from blockchain.mempool import Mempool, MempoolEntry
+
+
+class FakeTransaction:
+
+    def __init__(self, transaction_id: str, outpoints: list, fee: float, padding: int = 0):
+        self.transaction_id = transaction_id
+        self.inputs = [SimpleNamespace(transaction_id=parent, index=index) for parent, index in outpoints]
+        self.fee = fee
+        self.padding = padding
+
+    def json_data(self) -> dict:
+        return {"transaction_id": self.transaction_id, "padding": "x" * self.padding}
+
+    def get_total_input_value(self) -> float:
+        return 10 + self.fee
+
+    def get_total_output_value(self) -> float:
+        return 10
+
+
+def test_double_spend_is_rejected_once():
+    pool = Mempool()
+    assert pool.add(FakeTransaction("first", [("parent", 0)], 1.0))
+    second = FakeTransaction("second", [("parent", 0)], 5.0)
+    assert pool.has_conflict(second)        # the pre-check before verifying, not counted
+    assert not pool.add(second)
+    assert pool.stats()["conflicts"] == 1
+    assert "second" not in pool and pool.spends[("parent", 0)] == "first"
+
+
+def test_solved_transaction_keeps_its_outpoints_reserved():
+    pool = Mempool()
+    pool.add(FakeTransaction("solved", [("parent", 0)], 1.0))
+    pool.remove("solved", reserve=True)
+    assert not pool.add(FakeTransaction("double spend", [("parent", 0)], 1.0))
+    assert [transaction.transaction_id for transaction in pool.by_fee_rate(solved=True)] == ["solved"]
+
+
+def test_solved_transaction_is_not_pooled_again():
+    pool = Mempool()
+    solved = FakeTransaction("solved", [("parent", 0)], 1.0)
+    pool.add(solved)
+    pool.remove("solved", reserve=True)
+
+    assert pool.add(solved)                 # re-gossiped, a duplicate
+    assert "solved" not in pool and pool.holds("solved")
+    assert pool.stats()["duplicates"] == 1 and pool.stats()["conflicts"] == 0
+    assert ("parent", 0) not in pool.spends and pool.reserved[("parent", 0)] == "solved"
+
+
+def test_reservations_are_released_by_block_and_expiry():
+    pool = Mempool()
+    for name in ["in block", "double spent", "stale"]:
+        pool.add(FakeTransaction(name, [(name, 0)], 1.0))
+        pool.remove(name, reserve=True)
+    pool.solved["stale"].reserved_at = 0
+
+    block_transaction = FakeTransaction("block spend", [("double spent", 0)], 1.0)
+    pool.remove_for_block([FakeTransaction("in block", [("in block", 0)], 1.0), block_transaction])
+    assert pool.expire(cutoff=1) == ["stale"]
+    assert not pool.solved and not pool.reserved
+    assert pool.stats()["released"] == 3
+
+
+def test_full_pool_evicts_lowest_fee_rate_first():
+    size = MempoolEntry(FakeTransaction("sample", [], 0.0, padding=100), 0).size
+    pool = Mempool(max_bytes=2 * size)
+    pool.add(FakeTransaction("cheap", [("a", 0)], 1.0, padding=100))
+    pool.add(FakeTransaction("medium", [("b", 0)], 2.0, padding=100))
+
+    assert not pool.add(FakeTransaction("cheaper", [("c", 0)], 0.5, padding=100))
+    assert pool.add(FakeTransaction("rich", [("d", 0)], 3.0, padding=100))
+    assert [transaction.transaction_id for transaction in pool.by_fee_rate()] == ["rich", "medium"]
+    assert pool.stats()["evicted"] == 1 and pool.stats()["rejected_full"] == 1
+    assert ("a", 0) not in pool.spends
@@ -0,0 +1,80 @@
+import pytest
+from blockchain.block.block import Block
+from blockchain.block.blockheader import BlockHeader
+from blockchain.block.merkle import MerkleTree, verify_proof, transaction_leaf
+from blockchain.block.solved_transaction import SolvedTransaction
+from blockchain.transaction.output import Output
+from blockchain.transaction.question import Question
+from blockchain.transaction.transaction import Transaction
+from blockchain_client import BlockChain_Client
+
+
+def _transaction(number: int, question: bool = True) -> Transaction:
+    transaction = Transaction(public_key="public_key", outputs=[Output(0, float(number), "script")],
+                              timestamp=str(number), description="description", signature="signature",
+                              question=Question("question", "question_id", "answer_hash") if question else None)
+    transaction.find_transaction_id()
+    return transaction
+
+
+@pytest.fixture
+def block() -> Block:
+    block = Block(previous_block="previous_block", timestamp="1", reward_transaction=_transaction(0, question=False),
+                  miner_public_key="miner", version=1,
+                  solved_transactions=[SolvedTransaction(_transaction(i), f"solution {i}") for i in range(1, 6)])
+    block.block_id = block.find_block_id()
+    return block
+
+
+def _proof_data(block: Block, transaction_id: str) -> dict:
+    block_header = BlockHeader(block)
+    index, proof = block_header.get_proof(transaction_id)
+    return {
+        "block_header": block_header.json_data(),
+        "transaction_id": transaction_id,
+        "index": index,
+        "proof": proof,
+    }
+
+
+@pytest.mark.parametrize("size", range(1, 10))
+def test_every_leaf_proves_against_the_root(size):
+    leaves = [bytes([i]) * 32 for i in range(size)]
+    tree = MerkleTree(leaves)
+    for index, leaf in enumerate(leaves):
+        assert verify_proof(leaf, index, tree.get_proof(index), tree.root())
+    assert not verify_proof(b"\xff" * 32, 0, tree.get_proof(0), tree.root())
+
+
+def test_header_rebuilds_the_block_id(block):
+    block_header = BlockHeader().from_json(BlockHeader(block).json_data())
+    assert block_header.find_block_id() == block.block_id
+
+
+def test_proof_against_trusted_block(block):
+    transaction_id = block.solved_transactions[2].transaction.transaction_id
+    proof_data = _proof_data(block, transaction_id)
+    assert BlockChain_Client.verify_merkle_proof(proof_data, {block.block_id}, transaction_id)
+    assert not BlockChain_Client.verify_merkle_proof(proof_data, {"other block"}, transaction_id)
+
+
+def test_proof_with_forged_header_fails(block):
+    forged = _transaction(99)
+    proof_data = _proof_data(block, block.reward_transaction.transaction_id)
+    # Swap a leaf for a transaction the block never held, the root and proof are made to match
+    header = proof_data["block_header"]
+    header["solved_transactions"][0]["transaction"]["transaction_id"] = forged.transaction_id
+    forged_header = BlockHeader().from_json(header)
+    index, proof = forged_header.get_proof(forged.transaction_id)
+    proof_data.update(transaction_id=forged.transaction_id, index=index, proof=proof,
+                      block_header=forged_header.json_data())
+    assert forged_header.block_id == block.block_id
+    assert not BlockChain_Client.verify_merkle_proof(proof_data, {block.block_id}, forged.transaction_id)
+
+
+def test_malformed_transaction_id_is_rejected(block):
+    proof_data = _proof_data(block, block.reward_transaction.transaction_id)
+    proof_data["transaction_id"] = "0OIl"        # not Base58
+    with pytest.raises(ValueError):
+        transaction_leaf(proof_data["transaction_id"])
+    assert not BlockChain_Client.verify_merkle_proof(proof_data, {block.block_id})
@@ -0,0 +1,86 @@
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from blockchain import pruner as pruner_module
+from blockchain.blockchain import BlockChain
+from blockchain.database import blockchaindb, unspent_transactiondb
+from blockchain.database.blockchaindb import ChainIndex
+from blockchain.database.utxo_set import UTXOSet
+from blockchain.pruner import TransactionPruner
+
+MAX_AGE = 60
+
+
+def _transaction(transaction_id: str):
+    return SimpleNamespace(
+        transaction_id=transaction_id,
+        inputs=[SimpleNamespace(transaction_id=f"{transaction_id} parent", index=0)],
+        json_data=lambda: {"transaction_id": transaction_id},
+        get_total_input_value=lambda: 2.0,
+        get_total_output_value=lambda: 1.0,
+    )
+
+
+@pytest.fixture
+def chain(embedded, monkeypatch) -> BlockChain:
+    monkeypatch.setattr(blockchaindb, "CHAIN_INDEX", ChainIndex())
+    monkeypatch.setattr(unspent_transactiondb, "UTXO_SET", UTXOSet())
+    monkeypatch.setattr(pruner_module, "LOG", lambda *args: None)
+    chain = BlockChain()
+
+    old = time.time() - 2 * MAX_AGE
+    chain.transaction_pool.add(_transaction("old pooled"), received_at=old)
+    chain.transaction_pool.add(_transaction("fresh pooled"))
+    chain.transaction_pool.add(_transaction("old solved"))
+    chain.transaction_pool.remove("old solved", reserve=True)
+    chain.transaction_pool.solved["old solved"].reserved_at = old
+    chain.solved_transaction_pool["old solved"] = "solved transaction"
+
+    model = chain.transaction_model
+    for transaction_id in ["old free", "fresh free", "unstamped free"]:
+        model.add_free_transaction({"transaction_id": transaction_id})
+    model.collection.update_one({"transaction_id": "old free"}, {"$set": {"received_at": old}})
+    model.collection.update_one({"transaction_id": "unstamped free"}, {"$unset": {"received_at": ""}})
+    model.add_chain_transaction({"transaction_id": "old chained", "received_at": old}, "block")
+    return chain
+
+
+def test_run_once_expires_pool_and_stored_free_transactions(chain):
+    pruner = TransactionPruner(chain, interval=1, max_age=MAX_AGE)
+    report = pruner.run_once()
+
+    assert report == {"pool": 2, "removed": 1, "stamped": 1} == pruner.last_report
+    assert [transaction.transaction_id for transaction in chain.transaction_pool.by_fee_rate()] == ["fresh pooled"]
+    assert not chain.transaction_pool.solved and not chain.solved_transaction_pool
+    stored = {document["transaction_id"] for document in chain.transaction_model.collection.find({})}
+    assert stored == {"fresh free", "unstamped free", "old chained"}
+
+    # The unstamped transaction expires max_age after the first run, not now
+    assert pruner.run_once() == {"pool": 0, "removed": 0, "stamped": 0}
+    assert pruner.totals == {"pool": 2, "removed": 1, "stamped": 1}
+
+
+def test_thread_keeps_running_after_a_failed_run(monkeypatch):
+    runs = []
+    ran_twice = threading.Event()
+
+    class FailingOnceBlockChain:
+
+        def prune_transactions(self, max_age: float) -> dict:
+            runs.append(max_age)
+            if len(runs) == 1:
+                raise OSError("database unavailable")
+            ran_twice.set()
+            return {"pool": 0, "removed": 0, "stamped": 0}
+
+    monkeypatch.setattr(pruner_module, "LOG", lambda *args: None)
+    pruner = TransactionPruner(FailingOnceBlockChain(), interval=0.01, max_age=MAX_AGE)
+    pruner.start()
+    try:
+        assert ran_twice.wait(5)
+    finally:
+        pruner.stop()
+        pruner.join(5)
+    assert not pruner.is_alive() and runs[0] == MAX_AGE
+    assert pruner.last_report == {"pool": 0, "removed": 0, "stamped": 0}
@@ -0,0 +1,28 @@
+from threading import Thread
+from blockchain.read_cache import ReadThroughCache
+
+
+def test_callers_get_copies():
+    cache = ReadThroughCache(lambda key: {"key": key, "items": [1]}, 10, 10, 60)
+    loaded = cache.get("a")
+    loaded["items"].append(2)
+    cached = cache.get("a")
+    cached["items"].append(3)
+    assert cache.get("a") == {"key": "a", "items": [1]}
+
+
+def test_counters_add_up_across_threads():
+    cache = ReadThroughCache(lambda key: key if key % 2 else None, 100, 100, 60)
+
+    def lookups():
+        for key in range(1000):
+            cache.get(key % 20)
+
+    threads = [Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats["hits"] + stats["missing_hits"] + stats["misses"] == 8000
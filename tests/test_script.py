@@ -0,0 +1,99 @@
+import ecdsa
+import pytest
+from blockchain.encoding.base58 import encode_bytes, encode_public_key
+from blockchain.transaction import script as script_module
+from blockchain.transaction.script import Script, ScriptData, ScriptStats, hash160, MAX_SCRIPT_SIZE, MAX_SCRIPT_OPS, \
+    MAX_STACK_DEPTH, P2PKH_FAST_PATH
+
+TRANSACTION_ID = encode_bytes(bytes(range(1, 33)))
+
+
+@pytest.fixture(scope="module")
+def zero_prefixed_key():
+    """
+        A key whose hash160 starts with a zero byte, the case legacy Base58 encoded without it
+    """
+    while True:
+        private_key = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
+        public_key_hash = hash160(private_key.get_verifying_key().to_string())
+        if public_key_hash[0] == 0:
+            return private_key, public_key_hash
+
+
+def _unlocking_script(private_key) -> str:
+    signature = private_key.sign(bytes(range(1, 33))).hex()
+    return f"{signature} {encode_public_key(private_key.get_verifying_key())}"
+
+
+@pytest.mark.parametrize("legacy", [False, True])
+@pytest.mark.parametrize("prefix", ["", "OP_NOP "])       # fast path, interpreter
+def test_p2pkh_with_leading_zero_hash(zero_prefixed_key, legacy, prefix):
+    private_key, public_key_hash = zero_prefixed_key
+    encoded_hash = encode_bytes(public_key_hash.lstrip(b"\0") if legacy else public_key_hash)
+    assert encoded_hash.startswith("1") != legacy
+
+    locking_script = f"{prefix}OP_DUP OP_HASH160 {encoded_hash} OP_EQUALVERIFY OP_CHECKSIG"
+    assert Script(_unlocking_script(private_key), TRANSACTION_ID, locking_script).verify_script()
+
+
+def test_p2pkh_rejects_other_hash(zero_prefixed_key):
+    private_key, public_key_hash = zero_prefixed_key
+    other_hash = encode_bytes(bytes(20 - 1) + b"\1")
+    locking_script = f"OP_DUP OP_HASH160 {other_hash} OP_EQUALVERIFY OP_CHECKSIG"
+    assert not Script(_unlocking_script(private_key), TRANSACTION_ID, locking_script).verify_script()
+
+
+def test_script_data_compares_without_leading_zeros():
+    assert ScriptData(raw=b"\0\0ab") == ScriptData(raw=b"ab")
+    assert hash(ScriptData(raw=b"\0ab")) == hash(ScriptData(text=encode_bytes(b"ab")))
+    assert ScriptData(raw=b"ab") != ScriptData(raw=b"ba")
+
+
+@pytest.fixture
+def stats(monkeypatch) -> ScriptStats:
+    stats = ScriptStats()
+    monkeypatch.setattr(script_module, "SCRIPT_STATS", stats)
+    return stats
+
+
+@pytest.mark.parametrize("script, limit", [
+    ("a" * (MAX_SCRIPT_SIZE + 1), "size"),
+    ("OP_NOP " * (MAX_SCRIPT_OPS + 1), "ops"),
+    ("a " * (MAX_STACK_DEPTH + 1), "stack_depth"),
+])
+def test_scripts_over_a_limit_are_rejected(stats, script, limit):
+    assert not Script(script, TRANSACTION_ID).verify_script()
+    assert stats.snapshot()["rejected"] == {limit: 1}
+
+
+def test_scripts_at_the_limits_run(stats):
+    assert Script("OP_NOP " * (MAX_SCRIPT_OPS - 1) + "a a OP_EQUAL", TRANSACTION_ID).verify_script()
+    assert not Script("a " * MAX_STACK_DEPTH, TRANSACTION_ID).verify_script()     # more than one item left
+    assert stats.snapshot()["rejected"] == {}
+
+
+def test_locking_script_counts_towards_the_limits(stats):
+    unlocking = "OP_NOP " * MAX_SCRIPT_OPS
+    assert not Script(unlocking, TRANSACTION_ID, "a a OP_EQUAL").verify_script()
+    assert stats.snapshot()["rejected"] == {"ops": 1}
+
+
+def test_instrumentation_counts_operations(stats, monkeypatch, zero_prefixed_key):
+    monkeypatch.setattr(script_module, "SCRIPT_INSTRUMENTATION", True)
+    assert Script("OP_NOP OP_NOP a a", TRANSACTION_ID, "OP_EQUAL").verify_script()
+
+    private_key, public_key_hash = zero_prefixed_key
+    locking_script = f"OP_DUP OP_HASH160 {encode_bytes(public_key_hash)} OP_EQUALVERIFY OP_CHECKSIG"
+    assert Script(_unlocking_script(private_key), TRANSACTION_ID, locking_script).verify_script()
+
+    snapshot = stats.snapshot()
+    assert snapshot["scripts"] == 2
+    assert {operation: counts["count"] for operation, counts in snapshot["operations"].items()} == \
+        {"OP_NOP": 2, "OP_EQUAL": 1, P2PKH_FAST_PATH: 1}
+    assert all(counts["seconds"] >= 0 for counts in snapshot["operations"].values())
+
+
+def test_instrumentation_can_be_turned_off(stats, monkeypatch):
+    monkeypatch.setattr(script_module, "SCRIPT_INSTRUMENTATION", False)
+    assert Script("a a OP_EQUAL", TRANSACTION_ID).verify_script()
+    assert stats.snapshot() == {"scripts": 0, "operations": {}, "rejected": {}}
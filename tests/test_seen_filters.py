@@ -0,0 +1,56 @@
+import pytest
+from blockchain.database import blockchaindb, transactiondb
+from blockchain.database.blockchaindb import BlockChainModel, ChainIndex
+from blockchain.database.transactiondb import TransactionModel
+
+
+@pytest.fixture
+def blockchain(embedded, monkeypatch):
+    from blockchain.blockchain import BlockChain
+
+    monkeypatch.setattr(blockchaindb, "CHAIN_INDEX", ChainIndex())
+    BlockChainModel().append("chain block")
+    TransactionModel().add_free_transaction({"transaction_id": "free transaction"})
+    TransactionModel().add_chain_transaction({"transaction_id": "chain transaction"}, "chain block")
+    return BlockChain()
+
+
+def _count_calls(monkeypatch, model, name: str) -> list:
+    calls = []
+    method = getattr(model, name)
+    monkeypatch.setattr(model, name, lambda *args: calls.append(args) or method(*args))
+    return calls
+
+
+def test_seeded_ids_are_confirmed_with_one_query(blockchain, monkeypatch):
+    transaction_queries = _count_calls(monkeypatch, blockchain.transaction_model, "transaction_exists")
+    block_queries = _count_calls(monkeypatch, blockchain.block_model, "block_exists")
+
+    assert blockchain.has_transaction("free transaction")
+    assert blockchain.has_transaction("chain transaction")
+    assert blockchain.has_block("chain block")         # confirmed by the chain index
+    assert len(transaction_queries) == 2 and not block_queries
+
+
+def test_unseen_ids_skip_the_database(blockchain, monkeypatch):
+    transaction_queries = _count_calls(monkeypatch, blockchain.transaction_model, "transaction_exists")
+    block_queries = _count_calls(monkeypatch, blockchain.block_model, "block_exists")
+
+    assert not blockchain.has_transaction("unknown transaction")
+    assert not blockchain.has_block("unknown block")
+    assert not transaction_queries and not block_queries
+
+
+def test_false_positive_is_counted(blockchain):
+    blockchain.seen_blocks.add("missing block")
+    assert not blockchain.has_block("missing block")
+    assert blockchain.seen_blocks.stats()["false_positives"] == 1
+
+
+def test_block_transactions_are_read_newest_first_up_to_the_limit(embedded, monkeypatch):
+    monkeypatch.setattr(transactiondb, "QUERY_CHUNK_SIZE", 1)
+    model = TransactionModel()
+    for block_id in ["block 1", "block 2", "block 3"]:
+        model.add_chain_transaction({"transaction_id": f"{block_id} transaction"}, block_id)
+    assert model.get_block_transaction_ids(["block 3", "block 2", "block 1"], 2) == \
+        ["block 3 transaction", "block 2 transaction"]
@@ -0,0 +1,38 @@
+import pytest
+import blockchain_server
+from blockchain.settings import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+
+class FakeBlockChain:
+
+    def get_balance(self, public_key: str, page: int, page_size: int) -> dict:
+        return {"page": page, "page_size": page_size}
+
+    def get_client_transactions(self, public_key: str, page: int, page_size: int) -> dict:
+        return {"page": page, "page_size": page_size}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(blockchain_server, "BLOCKCHAIN", FakeBlockChain())
+    return blockchain_server.app.test_client()
+
+
+@pytest.mark.parametrize("route", ["/get_balance", "/get_client_transactions"])
+@pytest.mark.parametrize("query", ["page=x", "page_size=1.5", "page="])
+def test_malformed_page_is_rejected(client, route, query):
+    response = client.get(f"{route}?public_key=key&{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": True, "msg": "INVALID_PAGE"}
+
+
+@pytest.mark.parametrize("route", ["/get_balance", "/get_client_transactions"])
+@pytest.mark.parametrize("query, expected", [
+    ("", (1, DEFAULT_PAGE_SIZE)),
+    ("page=-3&page_size=0", (1, 1)),
+    (f"page=2&page_size={MAX_PAGE_SIZE + 1}", (2, MAX_PAGE_SIZE)),
+])
+def test_page_is_clamped(client, route, query, expected):
+    data = client.get(f"{route}?public_key=key&{query}").get_json()
+    data = data.get("data", data)
+    assert (data["page"], data["page_size"]) == expected
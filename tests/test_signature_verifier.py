@@ -0,0 +1,70 @@
+import subprocess
+import sys
+import ecdsa
+import pytest
+from blockchain.encoding.base58 import encode_public_key
+from blockchain.transaction import signature_verifier
+from blockchain.transaction.signature_verifier import verify_batch, verify_signature
+
+ROOT = __file__.rsplit("/tests/", 1)[0]
+
+# Run as __main__ like main.py, which spawned workers re-import. Each node built is recorded.
+SPAWN_SCRIPT = """
+import sys
+import blockchain.blockchain
+blockchain.blockchain.BlockChain.__init__ = lambda self: open(sys.argv[1], "a").write("node\\n")
+import blockchain_server
+from blockchain.transaction import signature_verifier
+
+if __name__ == "__main__":
+    signature_verifier.VERIFY_WORKERS = 2
+    signature_verifier.PARALLEL_VERIFY_THRESHOLD = 1
+    results = signature_verifier.verify_batch([("bad key", b"signature", b"message")] * 4)
+    assert results == [False] * 4 and signature_verifier._pool is not None, results
+"""
+
+
+@pytest.fixture(scope="module")
+def checks() -> list:
+    private_key = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
+    public_key = encode_public_key(private_key.get_verifying_key())
+    valid = [(public_key, private_key.sign(bytes([i])), bytes([i])) for i in range(6)]
+    invalid = [(public_key, private_key.sign(b"other"), bytes([i])) for i in range(2)]
+    return valid + invalid + [("not a key", b"signature", b"message")]
+
+
+def test_verify_signature_rejects_malformed_input(checks):
+    assert verify_signature(*checks[0])
+    assert not verify_signature(*checks[-2])
+    assert not verify_signature(*checks[-1])
+
+
+def test_batch_keeps_the_order_of_its_checks(checks, monkeypatch):
+    expected = [True] * 6 + [False] * 3
+    assert verify_batch(checks) == expected
+
+    monkeypatch.setattr(signature_verifier, "VERIFY_WORKERS", 2)
+    monkeypatch.setattr(signature_verifier, "PARALLEL_VERIFY_THRESHOLD", 1)
+    try:
+        assert verify_batch(checks) == expected
+    finally:
+        signature_verifier.shutdown_pool()
+
+
+def test_broken_pool_falls_back_to_the_calling_thread(checks, monkeypatch):
+    monkeypatch.setattr(signature_verifier, "VERIFY_WORKERS", 2)
+    monkeypatch.setattr(signature_verifier, "PARALLEL_VERIFY_THRESHOLD", 1)
+
+    def broken_pool():
+        raise OSError("no processes")
+    monkeypatch.setattr(signature_verifier, "_get_pool", broken_pool)
+    assert verify_batch(checks) == [True] * 6 + [False] * 3
+
+
+def test_importing_the_server_builds_no_node(tmp_path):
+    script = tmp_path / "main.py"
+    script.write_text(SPAWN_SCRIPT)
+    marker = tmp_path / "nodes"
+    subprocess.run([sys.executable, str(script), str(marker)], cwd=ROOT, check=True, timeout=120,
+                   env={"PYTHONPATH": ROOT})
+    assert not marker.exists()
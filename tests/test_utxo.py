@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+import pytest
+from pymongo.errors import DuplicateKeyError
+from blockchain.database import indexes, unspent_transactiondb
+from blockchain.database.addressdb import AddressModel, COLLECTION_NAME as ADDRESS_COLLECTION_NAME
+from blockchain.database.backend import get_collection
+from blockchain.database.operations import WriteBatch
+from blockchain.database.transactiondb import TransactionModel, COLLECTION_NAME as TRANSACTION_COLLECTION_NAME
+from blockchain.database.unspent_transactiondb import UnspentTransactionModel
+from blockchain.database.utxo_set import UTXOSet
+
+
+def _transaction(transaction_id: str, inputs: list, values: list):
+    return SimpleNamespace(
+        transaction_id=transaction_id,
+        inputs=[SimpleNamespace(transaction_id=parent, index=index) for parent, index in inputs],
+        outputs=[SimpleNamespace(index=index, public_key="owner", value=value) for index, value in enumerate(values)],
+    )
+
+
+@pytest.fixture
+def model(embedded, monkeypatch) -> UnspentTransactionModel:
+    monkeypatch.setattr(unspent_transactiondb, "UTXO_SET", UTXOSet())
+    model = UnspentTransactionModel()
+    model.load_utxo_set()
+    model.connect_block([_transaction("reward", [], [5.0, 1.0])], "block 1")
+    # Spends reward:0 and creates change, which it spends again itself
+    model.connect_block([_transaction("payment", [("reward", 0)], [3.0, 2.0]),
+                         _transaction("change", [("payment", 1)], [2.0])], "block 2")
+    return model
+
+
+def _stored_unspent(model) -> set:
+    return {(document["transaction_id"], document["output_index"])
+            for document in model.collection.find({"spend_block": None})}
+
+
+def _memory_unspent(model) -> set:
+    return model.utxo_set.get_unspent(["reward", "payment", "change"])
+
+
+def test_block_connects(model):
+    expected = {("reward", 1), ("payment", 0), ("change", 0)}
+    assert _stored_unspent(model) == expected and _memory_unspent(model) == expected
+
+
+@pytest.mark.parametrize("undo", [True, False])
+def test_detached_block_is_rolled_back(model, undo):
+    if not undo:
+        model.utxo_set.undo.clear()
+    assert model.free_block_transactions("block 2")
+
+    expected = {("reward", 0), ("reward", 1)}
+    assert _stored_unspent(model) == expected and _memory_unspent(model) == expected
+    assert model.collection.find_one({"transaction_id": {"$in": ["payment", "change"]}}) is None
+
+
+def test_rolled_back_block_reconnects(model):
+    model.utxo_set.undo.clear()
+    model.free_block_transactions("block 2")
+    model.connect_block([_transaction("payment", [("reward", 0)], [3.0, 2.0])], "block 2b")
+
+    expected = {("reward", 1), ("payment", 0), ("payment", 1)}
+    assert _stored_unspent(model) == expected and _memory_unspent(model) == expected
+
+
+def test_reorg_commits_address_history_with_utxo_rollback(model, embedded, monkeypatch):
+    address_model = AddressModel()
+    address_model.collection.insert_one({"public_key": "owner", "transaction_id": "payment", "block_id": "block 2"})
+    batch = WriteBatch()
+    batch.extend(ADDRESS_COLLECTION_NAME, address_model.disconnect_operations(["block 2"]))
+
+    applied = []
+    write_batch = embedded.write_batch
+    monkeypatch.setattr(embedded, "write_batch", lambda operations: applied.append(operations) or write_batch(operations))
+    assert model.disconnect_blocks(["block 2"], batch)
+
+    assert len(applied) == 1 and set(applied[0]) == {ADDRESS_COLLECTION_NAME, unspent_transactiondb.COLLECTION_NAME}
+    assert address_model.collection.find_one({"block_id": "block 2"}) is None
+    assert _stored_unspent(model) == {("reward", 0), ("reward", 1)}
+
+
+def test_unspent_outputs_are_backfilled_once(embedded):
+    TransactionModel().add_chain_transaction(
+        {"transaction_id": "old", "outputs": [{"index": 0, "value": 4.0, "public_key": "owner"}]}, "old block")
+    unspent = get_collection(unspent_transactiondb.COLLECTION_NAME)
+    unspent.insert_one({"transaction_id": "old", "output_index": 0, "spend_block": None, "spend_transaction": None})
+
+    assert indexes.backfill_unspent_outputs() == 1
+    document = unspent.find_one({"transaction_id": "old"}, {"_id": 0})
+    assert (document["public_key"], document["value"], document["block_id"]) == ("owner", 4.0, "old block")
+
+    unspent.insert_one({"transaction_id": "old", "output_index": 1, "spend_block": None, "spend_transaction": None})
+    assert indexes.backfill_unspent_outputs() == 0
+
+
+def test_spent_outputs_are_never_rewritten(model, embedded):
+    indexes.ensure_indexes()
+    # block 2 spent reward:0, a block replaying the reward must not un-spend it
+    with pytest.raises(DuplicateKeyError):
+        model.connect_block([_transaction("reward", [], [5.0, 1.0])], "replay")
+    document = model.collection.find_one({"transaction_id": "reward", "output_index": 0})
+    assert document["spend_block"] == "block 2"
+    assert not model.utxo_set.is_unspent(("reward", 0))
+
+
+def test_chained_transactions_are_never_moved(embedded):
+    indexes.ensure_indexes()
+    transaction_model = TransactionModel()
+    transaction_model.add_free_transaction({"transaction_id": "free"})
+    transaction_model.add_chain_transaction({"transaction_id": "chained"}, "block 1")
+
+    batch = WriteBatch()
+    batch.extend(TRANSACTION_COLLECTION_NAME,
+                 transaction_model.chain_transaction_operations([{"transaction_id": "free"}], "block 2"))
+    assert batch.commit()
+    assert transaction_model.get_block_id("free") == "block 2"
+
+    batch = WriteBatch()
+    batch.extend(TRANSACTION_COLLECTION_NAME, transaction_model.chain_transaction_operations([{"transaction_id": "chained"}], "block 3"))
+    with pytest.raises(DuplicateKeyError):
+        batch.commit()
+    assert transaction_model.get_block_id("chained") == "block 1"
+    assert not transaction_model.add_chain_transaction({"transaction_id": "chained"}, "block 3")
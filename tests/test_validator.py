@@ -0,0 +1,174 @@
+import hashlib
+import ecdsa
+import pytest
+from blockchain.block.block import Block
+from blockchain.block.settings import REWARD_VALUE
+from blockchain.block.solved_transaction import SolvedTransaction
+from blockchain.block.validator import BlockValidator, STRUCTURE, REWARD, DOUBLE_SPEND, INPUTS, SIGNATURES
+from blockchain.database import unspent_transactiondb
+from blockchain.database.transactiondb import TransactionModel
+from blockchain.database.unspent_transactiondb import UnspentTransactionModel
+from blockchain.database.utxo_set import UTXOSet
+from blockchain.encoding.base58 import encode_bytes, decode_bytes, encode_public_key
+from blockchain.transaction.Input import Input
+from blockchain.transaction.output import Output
+from blockchain.transaction.question import Question
+from blockchain.transaction.script import hash160
+from blockchain.transaction.transaction import Transaction
+
+
+def _reward(timestamp: str = "1") -> Transaction:
+    reward = Transaction(public_key="miner", outputs=[Output(0, 4, "script", "miner")], timestamp=timestamp,
+                         description="reward", signature="signature")
+    reward.find_transaction_id()
+    return reward
+
+
+def _block(reward: Transaction, solved_transactions: list = None) -> Block:
+    block = Block(previous_block=None, timestamp="1", reward_transaction=reward, miner_public_key="miner",
+                  solved_transactions=solved_transactions, version=1)
+    block.block_id = block.find_block_id()
+    return block
+
+
+def _question(answer: str) -> Question:
+    question_id = encode_bytes(hashlib.sha256(b"question").digest())
+    answer_hash = encode_bytes(hashlib.sha256((answer + question_id).encode("utf-8")).digest())
+    return Question("question", question_id, answer_hash)
+
+
+class Wallet:
+    """
+        A key owning chain outputs of 10, each in a transaction of its own
+    """
+
+    def __init__(self):
+        self.private_key = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
+        self.public_key = encode_public_key(self.private_key.get_verifying_key())
+        public_key_hash = encode_bytes(hash160(self.private_key.get_verifying_key().to_string()))
+        self.locking_script = f"OP_DUP OP_HASH160 {public_key_hash} OP_EQUALVERIFY OP_CHECKSIG"
+
+    def fund(self, timestamp: str) -> Transaction:
+        parent = Transaction(public_key=self.public_key, outputs=[Output(0, 10, self.locking_script, self.public_key)],
+                             timestamp=timestamp, description="parent", signature="signature")
+        parent.find_transaction_id()
+        UnspentTransactionModel().connect_block([parent], "parent block")
+        TransactionModel().add_chain_transaction(parent.json_data(), "parent block")
+        return parent
+
+    def spend(self, parent: Transaction, value: float = 9, timestamp: str = "1") -> SolvedTransaction:
+        # Input scripts sign the id of the transaction they spend
+        script_signature = f"{self.private_key.sign(decode_bytes(parent.transaction_id)).hex()} {self.public_key}"
+        transaction = Transaction(public_key=self.public_key, inputs=[Input(parent.transaction_id, 0, 10, script_signature)],
+                                  outputs=[Output(0, value, self.locking_script, self.public_key)], timestamp=timestamp,
+                                  description="payment", question=_question("answer"))
+        self.sign(transaction)
+        return SolvedTransaction(transaction, "answer")
+
+    def sign(self, transaction: Transaction) -> None:
+        transaction.signature = self.private_key.sign(transaction.get_signing_digest()).hex()
+        transaction.find_transaction_id()
+
+
+@pytest.fixture
+def wallet(embedded, monkeypatch) -> Wallet:
+    monkeypatch.setattr(unspent_transactiondb, "UTXO_SET", UTXOSet())
+    UnspentTransactionModel().load_utxo_set()
+    return Wallet()
+
+
+def _rejected_at(block: Block) -> str:
+    result = BlockValidator(block).validate()
+    assert not result.valid and result.reason
+    return result.stage
+
+
+def test_block_with_only_a_reward_is_valid(embedded):
+    assert BlockValidator(_block(_reward())).validate()
+
+
+def test_block_id_commits_to_the_reward_id():
+    reward = _reward()
+    block = _block(reward)
+    reward.transaction_id = "another id"
+    assert block.find_block_id() != block.block_id
+
+
+def test_reward_with_a_forged_id_is_rejected(embedded):
+    reward = _reward()
+    reward.transaction_id = _reward("2").transaction_id
+    result = BlockValidator(_block(reward)).validate()
+    assert (result.valid, result.stage) == (False, STRUCTURE)
+
+
+def test_reward_reusing_an_id_of_another_block_is_rejected(embedded):
+    reward = _reward()
+    TransactionModel().collection.insert_one(dict(reward.json_data(), block_id="another block"))
+
+    result = BlockValidator(_block(reward)).validate()
+    assert (result.valid, result.stage) == (False, REWARD)
+
+
+@pytest.mark.parametrize("stored_in", ["block", None])       # reconnected, freed by a reorg
+def test_reward_stored_for_the_same_block_or_free_is_accepted(embedded, stored_in):
+    reward = _reward()
+    block = _block(reward)
+    TransactionModel().collection.insert_one(dict(reward.json_data(), block_id=block.block_id if stored_in else None))
+    assert BlockValidator(block).validate()
+
+
+def test_block_spending_chain_outputs_is_valid(wallet):
+    block = _block(_reward(), [wallet.spend(wallet.fund("1")), wallet.spend(wallet.fund("2"))])
+    assert BlockValidator(block).validate()
+
+
+@pytest.mark.parametrize("break_block", [
+    lambda block: setattr(block.reward_transaction.outputs[0], "value", REWARD_VALUE + 1),
+    lambda block: setattr(block, "block_id", _block(_reward("2")).block_id),
+    lambda block: setattr(block.solved_transactions[0], "solution", "wrong answer"),
+    lambda block: setattr(block.solved_transactions[0].transaction, "transaction_id", _reward("2").transaction_id),
+])
+def test_structure_rejections(wallet, break_block):
+    block = _block(_reward(), [wallet.spend(wallet.fund("1"))])
+    break_block(block)
+    assert _rejected_at(block) == STRUCTURE
+
+
+def test_transaction_paying_no_fee_is_rejected(wallet):
+    assert _rejected_at(_block(_reward(), [wallet.spend(wallet.fund("1"), value=10)])) == STRUCTURE
+
+
+def test_transaction_included_twice_is_rejected(wallet):
+    solved = wallet.spend(wallet.fund("1"))
+    assert _rejected_at(_block(_reward(), [solved, solved])) == DOUBLE_SPEND
+
+
+def test_output_spent_twice_is_rejected(wallet):
+    parent = wallet.fund("1")
+    assert _rejected_at(_block(_reward(), [wallet.spend(parent), wallet.spend(parent, timestamp="2")])) == DOUBLE_SPEND
+
+
+def test_spent_or_unknown_output_is_rejected(wallet):
+    parent = wallet.fund("1")
+    UnspentTransactionModel().connect_block([wallet.spend(parent, timestamp="2").transaction], "other block")
+    assert _rejected_at(_block(_reward(), [wallet.spend(parent)])) == INPUTS
+
+    unknown = Transaction(public_key=wallet.public_key, outputs=[Output(0, 10, wallet.locking_script)],
+                          timestamp="3", description="never stored", signature="signature")
+    unknown.find_transaction_id()
+    assert _rejected_at(_block(_reward(), [wallet.spend(unknown)])) == INPUTS
+
+
+def test_bad_signatures_are_rejected(wallet):
+    solved = wallet.spend(wallet.fund("1"))
+    transaction = solved.transaction
+    transaction.signature = wallet.private_key.sign(b"something else").hex()
+    transaction.find_transaction_id()
+    assert _rejected_at(_block(_reward(), [solved])) == SIGNATURES
+
+    solved = wallet.spend(wallet.fund("2"))
+    transaction = solved.transaction
+    public_key = transaction.inputs[0].script_signature.split()[1]
+    transaction.inputs[0].script_signature = f"{wallet.private_key.sign(b'something else').hex()} {public_key}"
+    wallet.sign(transaction)
+    assert _rejected_at(_block(_reward(), [solved])) == SIGNATURES
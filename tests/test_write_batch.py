@@ -0,0 +1,139 @@
+import json
+import os
+import pytest
+from pymongo.errors import DuplicateKeyError
+from blockchain.database import embedded as embedded_module, indexes
+from blockchain.database.backend import to_pymongo
+from blockchain.database.embedded import EmbeddedBackend, ReadOnlyCollectionError
+from blockchain.database.operations import WriteBatch, InsertOne, UpdateOne, UpdateMany, DeleteMany
+
+
+RECORD_SIZE = embedded_module.RECORD_HEADER.size
+
+
+def _documents(store, name):
+    return sorted((document["key"], document.get("value")) for document in store.get_collection(name).find({}))
+
+
+def test_failing_batch_is_reverted(embedded):
+    embedded.get_collection("Unspent").insert_one({"key": "a", "value": 1})
+    embedded.get_collection("Block").insert_one({"block_id": "b1", "key": "b1"})
+
+    batch = WriteBatch()
+    batch.add("Unspent", UpdateOne({"key": "a"}, {"$set": {"value": 2}}))
+    batch.add("Unspent", InsertOne({"key": "c", "value": 3}))
+    batch.add("Block", InsertOne({"block_id": "b2", "key": "b2"}))
+    batch.add("Block", InsertOne({"block_id": "b1", "key": "b1"}))     # duplicate block id
+    with pytest.raises(DuplicateKeyError):
+        batch.commit()
+
+    assert _documents(embedded, "Unspent") == [("a", 1)]
+    assert _documents(embedded, "Block") == [("b1", None)]
+    assert not os.path.exists(os.path.join(embedded.directory, "batch.pending"))
+    # The reverted block was cut off its segment
+    blocks = embedded.get_collection("Block")
+    assert os.path.getsize(blocks._segment_path(0)) == sum(RECORD_SIZE + length for _, _, length in
+                                                           blocks.locations.values())
+
+
+def test_interrupted_batch_is_replayed_once(tmp_path):
+    store = EmbeddedBackend(str(tmp_path))
+    store.get_collection("Block").insert_one({"block_id": "b1", "key": "b1"})
+    store.get_collection("Unspent").insert_one({"key": "a", "value": 1})
+    store.close()
+
+    # The crash hit after the first inserts, before the other operations
+    pending = {
+        "Block": [InsertOne({"block_id": "b1", "key": "b1"}).to_json()],
+        "Unspent": [
+            InsertOne({"key": "a", "value": 1}).to_json(),
+            InsertOne({"key": "c", "value": 3}).to_json(),
+            UpdateOne({"key": "a"}, {"$set": {"value": 2}}).to_json(),
+            DeleteMany({"key": "missing"}).to_json(),
+        ],
+    }
+    with open(os.path.join(str(tmp_path), "batch.pending"), "w", encoding="utf-8") as batch_file:
+        json.dump(pending, batch_file)
+
+    store = EmbeddedBackend(str(tmp_path))
+    assert _documents(store, "Block") == [("b1", None)]
+    assert _documents(store, "Unspent") == [("a", 2), ("c", 3)]
+    assert not os.path.exists(os.path.join(str(tmp_path), "batch.pending"))
+    store.close()
+
+    # Replaying does not repeat the inserts on a later start either
+    store = EmbeddedBackend(str(tmp_path))
+    assert _documents(store, "Unspent") == [("a", 2), ("c", 3)]
+    store.close()
+
+
+def test_reverted_blocks_drop_the_segments_they_started(embedded, monkeypatch):
+    blocks = embedded.get_collection("Block")
+    blocks.insert_one({"block_id": "b1", "key": "b1"})
+    monkeypatch.setattr(embedded_module, "BLOCK_SEGMENT_SIZE", 1)       # one block per segment
+
+    batch = WriteBatch()
+    batch.add("Block", InsertOne({"block_id": "b2", "key": "b2"}))
+    batch.add("Block", InsertOne({"block_id": "b3", "key": "b3"}))
+    batch.add("Block", InsertOne({"block_id": "b1", "key": "b1"}))
+    with pytest.raises(DuplicateKeyError):
+        batch.commit()
+
+    assert blocks._segments() == [0] and blocks._segment == 0
+    blocks.insert_one({"block_id": "b4", "key": "b4"})
+    assert _documents(embedded, "Block") == [("b1", None), ("b4", None)]
+
+
+def test_interrupted_cut_is_completed_at_start(tmp_path):
+    store = EmbeddedBackend(str(tmp_path))
+    blocks = store.get_collection("Block")
+    blocks.insert_one({"block_id": "b1", "key": "b1"})
+    size = os.path.getsize(blocks._segment_path(0))
+    blocks.insert_one({"block_id": "b2", "key": "b2"})
+    store.close()
+
+    # The crash hit after the cut of b2 was logged, before the segment was truncated
+    with open(os.path.join(blocks.directory, "index.log"), "a", encoding="utf-8") as index_file:
+        index_file.write(json.dumps(["b2", None]) + "\n" + json.dumps([None, [0, size]]) + "\n")
+
+    store = EmbeddedBackend(str(tmp_path))
+    blocks = store.get_collection("Block")
+    assert _documents(store, "Block") == [("b1", None)]
+    assert os.path.getsize(blocks._segment_path(0)) == size
+    store.close()
+
+
+def test_blocks_are_append_only(embedded):
+    blocks = embedded.get_collection("Block")
+    blocks.insert_one({"block_id": "b1", "key": "b1"})
+    with pytest.raises(ReadOnlyCollectionError):
+        blocks.update_one({"block_id": "b1"}, {"$set": {"key": "changed"}})
+    assert _documents(embedded, "Block") == [("b1", None)]
+
+
+def test_indexes_are_created_once(tmp_path):
+    store = EmbeddedBackend(str(tmp_path))
+    assert indexes.ensure_indexes(store)["created"]
+    store.close()
+
+    store = EmbeddedBackend(str(tmp_path))
+    assert indexes.ensure_indexes(store) == {"created": {}, "failed": {}}
+    transactions = store.get_collection("Transaction")
+    transactions.insert_one({"transaction_id": "a"})
+    with pytest.raises(DuplicateKeyError):
+        transactions.insert_one({"transaction_id": "a"})
+    store.close()
+
+
+def test_update_many_needs_update_operators(embedded):
+    replacement = UpdateMany({"key": "a"}, {"key": "a", "value": 2})
+    with pytest.raises(ValueError):
+        to_pymongo(replacement)
+    assert type(to_pymongo(UpdateOne({"key": "a"}, {"key": "a", "value": 2}))).__name__ == "ReplaceOne"
+
+    embedded.get_collection("Unspent").insert_many([{"key": "a", "value": 1}, {"key": "a", "value": 1}])
+    batch = WriteBatch()
+    batch.add("Unspent", replacement)
+    with pytest.raises(ValueError):
+        batch.commit()
+    assert _documents(embedded, "Unspent") == [("a", 1), ("a", 1)]